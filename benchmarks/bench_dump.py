@@ -0,0 +1,78 @@
+"""
+Benchmark the dump of the training data to the .data file read by the L3 binaries.
+
+It compares, on synthetic categorical datasets, the original per-cell writer
+working on the unicode copy of the data with the bulk writer used by the
+estimator, which streams the integer encoded data in blocks of joined rows.
+The encoding, which :meth:`L3Classifier.fit` needs anyway, is timed on its own.
+
+Usage::
+
+    python benchmarks/bench_dump.py --shapes 100000x10 1000000x10 100000x100
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from l3wrapper.encoding import CategoricalEncoder
+from l3wrapper.l3wrapper import _dump_encoded_to_file
+
+
+def make_categorical(n_rows, n_cols, cardinality=10, seed=0):
+    """Build a random categorical dataset, as an object array of strings."""
+    rng = np.random.default_rng(seed)
+    values = np.array([f"value_{i}" for i in range(cardinality)], dtype=object)
+    return values[rng.integers(cardinality, size=(n_rows, n_cols))]
+
+
+def dump_per_cell(X, filestem, ext):
+    X = X.astype(np.str_)
+    with open(f"{filestem}.{ext}", "w") as fp:
+        for row in X:
+            row = [f"{i}" for i in row]
+            fp.write(f"{','.join(row)}\n")
+
+
+def encode(X):
+    encoder = CategoricalEncoder()
+    codes = encoder.fit_transform(X)
+    return [codes[:, i] for i in range(codes.shape[1])], encoder.categories_
+
+
+def best_time(func, repeat):
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shapes", nargs="+", default=["100000x10", "1000000x10", "100000x100"])
+    parser.add_argument("--cardinality", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'shape':>12}  {'stage':<14}  {'best (s)':>9}  {'rows/s':>12}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filestem = os.path.join(tmp_dir, "train")
+        for shape in args.shapes:
+            n_rows, n_cols = map(int, shape.split("x"))
+            X = make_categorical(n_rows, n_cols, args.cardinality)
+            codes, categories = encode(X)
+            stages = [
+                ("per cell dump", lambda: dump_per_cell(X, filestem, "data")),
+                ("encode", lambda: encode(X)),
+                ("bulk dump", lambda: _dump_encoded_to_file(codes, categories, filestem, "data")),
+            ]
+            for name, stage in stages:
+                best = best_time(stage, args.repeat)
+                print(f"{shape:>12}  {name:<14}  {best:>9.3f}  {n_rows / best:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
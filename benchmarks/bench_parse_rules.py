@@ -0,0 +1,66 @@
+"""
+Benchmark the parsing of the L3 rule files (livelloI.txt, livelloII.txt).
+
+It compares, on a synthetic rule file, the original per-line parser building
+a list of Rule, the per-line parser building a RuleTable and the bulk parser
+used by the estimator (:func:`l3wrapper.dictionary.parse_raw_rules`).
+
+Usage::
+
+    python benchmarks/bench_parse_rules.py --n-rules 1000000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from l3wrapper.dictionary import Rule, parse_raw_rules, _parse_raw_rules_by_line
+
+
+def write_synthetic_rules(filename, n_rules, n_items=500, max_length=6, n_classes=4, seed=0):
+    """Write `n_rules` random rules in the L3 raw format."""
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, max_length + 1, n_rules)
+    with open(filename, "w") as fp:
+        for length in lengths:
+            items = rng.choice(n_items, length, replace=False) + 1
+            class_id = 2147483548 + rng.integers(n_classes)
+            support = rng.integers(1, 1000)
+            confidence = rng.uniform(50, 100)
+            fp.write(f"{{{','.join(map(str, items))}}} -> {class_id} {support} {confidence:.6f} {length}\n")
+
+
+def parse_rule_list(filename):
+    with open(filename, 'r') as fp:
+        return [Rule(line.strip('\n'), rule_id) for (rule_id, line) in enumerate(fp)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n-rules", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    parsers = [("list of Rule", parse_rule_list),
+               ("RuleTable, by line", _parse_raw_rules_by_line),
+               ("RuleTable, bulk", parse_raw_rules)]
+
+    print(f"{'n_rules':>10}  {'MB':>7}  {'parser':<20}  {'best (s)':>9}  {'rules/s':>12}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_rules in args.n_rules:
+            filename = os.path.join(tmp_dir, f"rules_{n_rules}.txt")
+            write_synthetic_rules(filename, n_rules)
+            size = os.path.getsize(filename) / 2 ** 20
+            for name, parse in parsers:
+                timings = list()
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    parse(filename)
+                    timings.append(time.perf_counter() - start)
+                best = min(timings)
+                print(f"{n_rules:>10}  {size:>7.1f}  {name:<20}  {best:>9.3f}  {n_rules / best:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
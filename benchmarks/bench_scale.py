@@ -0,0 +1,181 @@
+"""
+Benchmark fit and predict across the scale of the dataset.
+
+It fits and applies :class:`L3Classifier` on synthetic categorical datasets
+for every combination of number of rows, number of columns, column
+cardinality and support threshold, and reports:
+
+- the best wall time of each stage of fit (validation and encoding, dump of
+  the training data, L3 training, loading and parsing of the rule files, as
+  recorded in `fit_stats_`) and of predict, with both matching engines;
+- the peak memory allocated by Python during fit and predict (traced with
+  :mod:`tracemalloc`, in a separate untimed run) and the peak resident memory
+  of the training subprocesses.
+
+If the L3 training binary is missing (or with ``--stand-in``), the training
+runs ``benchmarks/stand_in_train.py`` instead, so that the benchmark runs
+offline. The results can be saved as JSON and compared with a previous run
+to detect regressions.
+
+Usage::
+
+    python benchmarks/bench_scale.py --rows 1000 10000 --cols 8 --cardinality 4 16 --min-sups 0.05 0.01
+    python benchmarks/bench_scale.py --save baseline.json
+    python benchmarks/bench_scale.py --compare baseline.json --tolerance 1.25
+"""
+
+import argparse
+import itertools
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from l3wrapper import l3wrapper_data_path
+from l3wrapper.l3wrapper import L3Classifier, BIN_DIR, TRAIN_BIN
+
+
+FIT_STAGES = ["validate", "dump", "train", "load_rules"]
+PREDICT_ENGINES = ["loop", "sparse"]
+
+
+def make_dataset(n_rows, n_cols, cardinality, n_classes=3, noise=0.1, seed=0):
+    """Build a random categorical dataset whose label depends on its first two columns.
+
+    A fraction `noise` of the labels is random, so that rules of any
+    confidence are found.
+    """
+    rng = np.random.default_rng(seed)
+    codes = rng.integers(cardinality, size=(n_rows, n_cols))
+    values = np.array([f"v{i}" for i in range(cardinality)], dtype=object)
+    y = (codes[:, 0] + codes[:, min(1, n_cols - 1)]) % n_classes
+    noisy = rng.random(n_rows) < noise
+    y[noisy] = rng.integers(n_classes, size=int(noisy.sum()))
+    return values[codes], np.array([f"c{label}" for label in y], dtype=object)
+
+
+def make_stand_in_root(directory):
+    """Create an L3 root whose training binary runs the stand-in. Return its path."""
+    bin_dir = os.path.join(directory, BIN_DIR)
+    os.makedirs(bin_dir)
+    repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+    script = os.path.join(repo_root, "benchmarks", "stand_in_train.py")
+    bin_path = os.path.join(bin_dir, TRAIN_BIN)
+    with open(bin_path, "w") as fp:
+        fp.write(f'#!/bin/sh\nPYTHONPATH="{repo_root}${{PYTHONPATH:+:$PYTHONPATH}}" '
+                 f'exec "{sys.executable}" "{script}" "$@"\n')
+    os.chmod(bin_path, 0o755)
+    return directory
+
+
+def run_case(X, y, X_test, params, repeat):
+    """Time the stages of fit and predict, then trace the peak memory of one more run."""
+    timings = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        clf = L3Classifier(**params).fit(X, y)
+        run_timings = {stage: clf.fit_stats_[stage]["wall_time"] for stage in FIT_STAGES}
+        run_timings["fit"] = time.perf_counter() - start
+        for engine in PREDICT_ENGINES:
+            start = time.perf_counter()
+            clf.predict(X_test, engine=engine, explain=None)
+            run_timings[f"predict_{engine}"] = time.perf_counter() - start
+        for name, seconds in run_timings.items():
+            timings[name] = min(seconds, timings.get(name, np.inf))
+
+    tracemalloc.start()
+    clf = L3Classifier(**params).fit(X, y)
+    fit_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    for engine in PREDICT_ENGINES:
+        clf.predict(X_test, engine=engine, explain=None)
+    predict_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "timings": timings,
+        "fit_peak_mb": fit_peak / 2 ** 20,
+        "predict_peak_mb": predict_peak / 2 ** 20,
+        "n_lvl1_rules": clf.n_lvl1_rules_,
+        "n_lvl2_rules": clf.n_lvl2_rules_,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Report the timings slower than the baseline by more than `tolerance` times."""
+    baseline = {result["case"]: result for result in baseline}
+    regressions = 0
+    for result in results:
+        reference = baseline.get(result["case"])
+        if reference is None:
+            continue
+        for name, seconds in result["timings"].items():
+            reference_seconds = reference["timings"].get(name)
+            if reference_seconds and seconds > tolerance * reference_seconds:
+                regressions += 1
+                print(f"REGRESSION {result['case']} {name}: {reference_seconds:.4f}s -> {seconds:.4f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", nargs="+", type=int, default=[1000, 10000])
+    parser.add_argument("--cols", nargs="+", type=int, default=[8, 16])
+    parser.add_argument("--cardinality", nargs="+", type=int, default=[4, 16])
+    parser.add_argument("--min-sups", nargs="+", type=float, default=[0.05, 0.01])
+    parser.add_argument("--min-conf", type=float, default=0.5)
+    parser.add_argument("--max-length", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stand-in", action="store_true",
+                        help="train with the stand-in even if the L3 training binary is available")
+    parser.add_argument("--save", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="compare the timings with the results saved in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        l3_root = l3wrapper_data_path
+        if args.stand_in or not os.access(os.path.join(l3_root, BIN_DIR, TRAIN_BIN), os.X_OK):
+            print("Training with the stand-in for the L3 training binary.")
+            l3_root = make_stand_in_root(os.path.join(tmp_dir, "l3_root"))
+
+        columns = ["fit"] + FIT_STAGES + [f"predict_{engine}" for engine in PREDICT_ENGINES]
+        print(f"{'rows':>7} {'cols':>4} {'card':>4} {'min_sup':>7}  "
+              + "  ".join(f"{name:>14}" for name in columns)
+              + f"  {'fit MB':>7} {'pred MB':>7} {'child MB':>8} {'lvl1':>6} {'lvl2':>7}")
+
+        results = list()
+        for n_rows, n_cols, cardinality, min_sup in itertools.product(args.rows, args.cols, args.cardinality,
+                                                                     args.min_sups):
+            X, y = make_dataset(n_rows, n_cols, cardinality)
+            X_test, _ = make_dataset(n_rows, n_cols, cardinality, seed=1)
+            params = dict(min_sup=min_sup, min_conf=args.min_conf, max_length=args.max_length,
+                          l3_root=l3_root, work_dir=tmp_dir)
+            result = run_case(X, y, X_test, params, args.repeat)
+            # the peak resident memory of the largest training subprocess so far
+            result["child_peak_mb"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 2 ** 10
+            result["case"] = f"{n_rows}x{n_cols}x{cardinality}@{min_sup}"
+            results.append(result)
+
+            timings = result["timings"]
+            print(f"{n_rows:>7} {n_cols:>4} {cardinality:>4} {min_sup:>7}  "
+                  + "  ".join(f"{timings[name]:>14.4f}" for name in columns)
+                  + f"  {result['fit_peak_mb']:>7.1f} {result['predict_peak_mb']:>7.1f} "
+                    f"{result['child_peak_mb']:>8.1f} {result['n_lvl1_rules']:>6} {result['n_lvl2_rules']:>7}")
+
+    if args.save:
+        with open(args.save, "w") as fp:
+            json.dump(results, fp, indent=2)
+    if args.compare:
+        with open(args.compare) as fp:
+            regressions = compare(results, json.load(fp), args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark the training engines of the estimator.
+
+It fits :class:`L3Classifier` with the L3 training binary
+(``train_engine='binary'``) and with the in-process NumPy miner
+(``train_engine='python'``) on the bundled test datasets, for a few support
+thresholds, and reports the fit time, the size of the two rule levels and the
+accuracy on a held out split.
+
+Usage::
+
+    python benchmarks/bench_train.py --min-sups 0.01 0.005 --repeat 3
+"""
+
+import argparse
+import glob
+import os
+import time
+import numpy as np
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+from l3wrapper.l3wrapper import L3Classifier
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "tests", "data")
+
+
+def load_dataset(path):
+    """Load a comma separated dataset whose last column is the label."""
+    X = np.loadtxt(path, dtype=object, delimiter=",")
+    return X[:, :-1], X[:, -1]
+
+
+def best_fit(params, X, y, repeat):
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        clf = L3Classifier(**params).fit(X, y)
+        timings.append(time.perf_counter() - start)
+    return clf, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--datasets", nargs="+", default=sorted(glob.glob(os.path.join(DATA_DIR, "*.data"))))
+    parser.add_argument("--min-sups", nargs="+", type=float, default=[0.05, 0.01, 0.005])
+    parser.add_argument("--min-conf", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'dataset':>12}  {'min_sup':>7}  {'engine':<7}  {'best (s)':>9}  {'lvl1':>6}  {'lvl2':>7}  {'accuracy':>8}")
+    for path in args.datasets:
+        X, y = load_dataset(path)
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+        name = os.path.splitext(os.path.basename(path))[0]
+        for min_sup in args.min_sups:
+            for engine in ["binary", "python"]:
+                params = dict(min_sup=min_sup, min_conf=args.min_conf, train_engine=engine)
+                clf, best = best_fit(params, X_train, y_train, args.repeat)
+                accuracy = accuracy_score(y_test, clf.predict(X_test))
+                print(f"{name:>12}  {min_sup:>7}  {engine:<7}  {best:>9.4f}  "
+                      f"{clf.n_lvl1_rules_:>6}  {clf.n_lvl2_rules_:>7}  {accuracy:>8.4f}")
+
+
+if __name__ == "__main__":
+    main()
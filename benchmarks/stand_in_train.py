@@ -0,0 +1,58 @@
+"""
+A stand-in for the L3 training binary (L3CFiltriItemTrain), for benchmarks.
+
+It takes the same command line and writes the same files as the binary (the
+.cls and .diz dictionaries, the livelloI.txt and livelloII.txt raw rule files
+and an empty .bin file in place of the binary transactions), mining the rules
+with :mod:`l3wrapper.mining`. It lets the benchmarks exercise the whole file
+based fit (dump, subprocess, parsing) where the L3 binaries are not
+available, e.g. offline. Timings of the training stage are those of the
+stand-in, not of L3.
+
+Usage (from the training directory, as the estimator runs it)::
+
+    python stand_in_train.py <filestem> <min sup %> <min conf %> nofiltro 0 <specialistic flag> <max length> <l3 root>
+"""
+
+import sys
+import numpy as np
+from l3wrapper.mining import CLASS_ID_START, build_bitsets, mine_class_rules, sort_rules, split_levels
+
+
+def main(argv):
+    filestem, min_sup, min_conf, _, _, specialistic_flag, max_length, _ = argv[:8]
+
+    data = np.loadtxt(f"{filestem}.data", dtype=str, delimiter=",", ndmin=2)
+    X, y = data[:, :-1], data[:, -1]
+    labels, y_codes = np.unique(y, return_inverse=True)
+    categories, codes = zip(*[np.unique(X[:, i], return_inverse=True) for i in range(X.shape[1])])
+    n_categories = [len(column_categories) for column_categories in categories]
+    offsets = np.concatenate([[0], np.cumsum(n_categories)]).astype(np.int64)
+
+    with open(f"{filestem}.cls", "w") as fp:
+        fp.write(f"{CLASS_ID_START}\n")
+        fp.writelines(f"{label}\n" for label in labels.tolist())
+    with open(f"{filestem}.diz", "w") as fp:
+        for column_id, column_categories in enumerate(categories):
+            for code, value in enumerate(column_categories.tolist()):
+                fp.write(f"{offsets[column_id] + code + 1}->{column_id + 1},{value}\n")
+
+    item_bitsets = build_bitsets(np.stack(codes, axis=1) + offsets[:-1], int(offsets[-1]))
+    class_bitsets = build_bitsets(y_codes.reshape(-1, 1), len(labels))
+    rules = mine_class_rules(item_bitsets, np.repeat(np.arange(len(categories)), n_categories), class_bitsets,
+                             float(min_sup) * X.shape[0] / 100, float(min_conf), int(max_length))
+    rules = sort_rules(rules, specialistic=specialistic_flag == "0")
+    levels = split_levels(rules, item_bitsets, class_bitsets)
+
+    for level, filename in [(1, "livelloI.txt"), (2, "livelloII.txt")]:
+        with open(filename, "w") as fp:
+            for (items, class_index, support, confidence), rule_level in zip(rules, levels.tolist()):
+                if rule_level == level:
+                    fp.write(f"{{{','.join(str(item + 1) for item in items)}}} -> "
+                             f"{CLASS_ID_START + class_index} {support} {confidence:.6f} {len(items)}\n")
+    open(f"{filestem}.bin", "wb").close()
+    print(f"rules: {int((levels == 1).sum())} {int((levels == 2).sum())}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,99 @@
+"""
+This module provides the on-disk cache of the rules mined by the L3 training.
+
+Entries are content-addressed: the key hashes the training data (see
+:func:`l3wrapper.l3wrapper._fingerprint`) and the parameters passed to the
+training binary. Each entry is a pickle file; its modification time records
+the last access and the least recently used entries are evicted when the
+cache grows beyond its size limit.
+"""
+
+import hashlib
+import os
+import pickle
+import secrets
+from os.path import join
+
+
+_ENTRY_EXT = ".pkl"
+
+
+def make_key(fingerprint: str, params: dict) -> str:
+    """Build the key of the rules mined from the data with a given fingerprint and parameters."""
+    digest = hashlib.sha256(fingerprint.encode())
+    for name in sorted(params):
+        digest.update(f"\x1f{name}={params[name]!r}".encode())
+    return digest.hexdigest()
+
+
+class FitCache:
+    """An on-disk cache of the outcomes of the L3 training.
+
+    Parameters
+    ----------
+    directory : str
+        The directory holding the cache entries. It is created if missing.
+    max_bytes : int
+        The maximum total size of the entries. Least recently used entries
+        are evicted beyond it.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return join(self.directory, f"{key}{_ENTRY_EXT}")
+
+    def get(self, key: str):
+        """Get the entry stored with a key, or None if it is missing."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fp:
+                entry = pickle.load(fp)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            pass            # evicted meanwhile by a concurrent fit
+        return entry
+
+    def put(self, key: str, entry: dict):
+        """Store an entry with a key, then evict the least recently used entries if needed."""
+        path = self._path(key)
+        # write to a temporary file first, so that concurrent fits never read partial entries
+        tmp_path = f"{path}.{secrets.token_hex(4)}.tmp"
+        with open(tmp_path, "wb") as fp:
+            pickle.dump(entry, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """Remove the least recently used entries until the cache fits its size limit.
+
+        The entry at path `keep`, if given, is never removed.
+        """
+        entries = list()
+        for name in os.listdir(self.directory):
+            if not name.endswith(_ENTRY_EXT):
+                continue
+            path = join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, path) in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -1,4 +1,7 @@
 import numpy as np
+import mmap
+import os
+from collections import defaultdict
 
 
 _UNKNOWN_ITEM = -1
@@ -35,15 +38,10 @@ class RuleDictionary:
 class Transaction:
     def __init__(self, row: np.array, item_to_item_id: dict):
         # Extract items in the tuple form (column_id, value)
-        self._items = [(c_id, c_val) for (c_id, c_val) in enumerate(row)]
+        self._items = list(enumerate(row))
 
         # Associate to each item its 'item_id'
-        self._item_ids = list()
-        for item in self._items:
-            try:
-                self._item_ids.append(item_to_item_id[item])
-            except KeyError:
-                self._item_ids.append(_UNKNOWN_ITEM)
+        self._item_ids = [item_to_item_id.get(item, _UNKNOWN_ITEM) for item in self._items]
 
         self.item_ids_set = set(self._item_ids)
         self.used_level = -1
@@ -51,6 +49,8 @@ class Transaction:
 
 
 class Rule:
+    __slots__ = ("rule_id", "_raw_rule", "item_ids", "_n_items", "class_id", "support", "confidence")
+
     def __init__(self, raw_rule: str, rule_id: int):
         """Extract a new rule from a string (raw rule).
 
@@ -64,7 +64,7 @@ class Rule:
             An integer corresponding to the rule id.
         """
         self.rule_id = rule_id
-        self.raw_rule = raw_rule
+        self._raw_rule = raw_rule
 
         chunks = raw_rule.split(" ")
         items = chunks[0]
@@ -75,6 +75,38 @@ class Rule:
         self.support = int(chunks[3])
         self.confidence = float(chunks[4])
 
+    @classmethod
+    def from_fields(cls, rule_id: int, item_ids, class_id: int, support: int, confidence: float):
+        """Create a rule from its fields rather than from a raw rule."""
+        rule = cls.__new__(cls)
+        rule.rule_id = rule_id
+        rule._raw_rule = None
+        rule.item_ids = set(item_ids)
+        rule._n_items = len(rule.item_ids)
+        rule.class_id = class_id
+        rule.support = support
+        rule.confidence = confidence
+        return rule
+
+    @property
+    def raw_rule(self) -> str:
+        """The raw rule, as extracted by the L3 training or rebuilt from the rule's fields."""
+        if self._raw_rule is None:
+            return (f"{{{','.join(map(str, sorted(self.item_ids)))}}} -> "
+                    f"{self.class_id} {self.support} {self.confidence}")
+        return self._raw_rule
+
+    def _key(self):
+        return self.rule_id, frozenset(self.item_ids), self.class_id, self.support, self.confidence
+
+    def __eq__(self, other):
+        if not isinstance(other, Rule):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
     def get_readable_representation(self, item_id_to_item: dict, column_id_to_name: dict, class_dict: dict) -> str:
         """Create a human readable representation of the rule.
 
@@ -108,6 +140,103 @@ class Rule:
         return f"Rule(id:{self.rule_id};item_ids:{','.join(map(lambda x: str(x), self.item_ids))};sup:{self.support};conf:{self.confidence})"
 
 
+class RuleTable:
+    """A rule set stored in parallel NumPy arrays.
+
+    The items of the rules are stored in CSR-like form: the items of the i-th
+    rule are `item_ids[item_indptr[i]:item_indptr[i + 1]]`. The id of a rule is
+    its position in the table.
+
+    For backward compatibility, the table behaves as a read-only list of
+    :class:`Rule`: indexing or iterating over it builds the Rule on the fly.
+
+    Parameters
+    ----------
+    item_indptr : array-like, shape (n_rules + 1,)
+        The offsets of the items of each rule in `item_ids`.
+    item_ids : array-like, shape (n_entries,)
+        The item ids of all the rules, one rule after the other.
+    class_ids : array-like, shape (n_rules,)
+        The class id of each rule.
+    supports : array-like, shape (n_rules,)
+        The support count of each rule.
+    confidences : array-like, shape (n_rules,)
+        The confidence (%) of each rule.
+    lengths : array-like, shape (n_rules,), default=None
+        The number of items of each rule. If None, it is computed from
+        `item_indptr`.
+    """
+
+    def __init__(self, item_indptr, item_ids, class_ids, supports, confidences, lengths=None):
+        self.item_indptr = np.asarray(item_indptr, dtype=np.int64)
+        self.item_ids = np.asarray(item_ids, dtype=np.int32)
+        self.class_ids = np.asarray(class_ids, dtype=np.int64)
+        self.supports = np.asarray(supports, dtype=np.int32)
+        self.confidences = np.asarray(confidences, dtype=np.float64)
+        if lengths is None:
+            lengths = np.diff(self.item_indptr)
+        self.lengths = np.asarray(lengths, dtype=np.int32)
+
+    @classmethod
+    def from_rules(cls, rules: list):
+        """Build a table from a list of Rule. Rule ids are reassigned by position."""
+        item_ids = [sorted(r.item_ids) for r in rules]
+        return cls(
+            np.concatenate([[0], np.cumsum([len(i) for i in item_ids], dtype=np.int64)]),
+            [i for rule_item_ids in item_ids for i in rule_item_ids],
+            [r.class_id for r in rules],
+            [r.support for r in rules],
+            [r.confidence for r in rules]
+        )
+
+    def select(self, mask):
+        """Build a table with the rules selected by a boolean mask. Rule ids are reassigned by position."""
+        mask = np.asarray(mask, dtype=bool)
+        item_mask = np.repeat(mask, self.lengths)
+        return RuleTable(
+            np.concatenate([[0], np.cumsum(self.lengths[mask], dtype=np.int64)]),
+            self.item_ids[item_mask],
+            self.class_ids[mask],
+            self.supports[mask],
+            self.confidences[mask]
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """The total size of the arrays of the table, in bytes."""
+        return sum(array.nbytes for array in [self.item_indptr, self.item_ids, self.class_ids,
+                                              self.supports, self.confidences, self.lengths])
+
+    def get_item_ids(self, rule_id: int) -> np.array:
+        """Get the item ids of a rule."""
+        return self.item_ids[self.item_indptr[rule_id]:self.item_indptr[rule_id + 1]]
+
+    def __len__(self):
+        return len(self.class_ids)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self)))]
+
+        rule_id = int(key)
+        if rule_id < 0:
+            rule_id += len(self)
+        if not 0 <= rule_id < len(self):
+            raise IndexError("rule index out of range")
+
+        return Rule.from_fields(rule_id,
+                                self.get_item_ids(rule_id).tolist(),
+                                int(self.class_ids[rule_id]),
+                                int(self.supports[rule_id]),
+                                float(self.confidences[rule_id]))
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __repr__(self):
+        return f"RuleTable(n_rules:{len(self)})"
+
+
 def build_y_mappings(y: np.array) -> dict:
     orig_to_str = {label: str(label) for label in y}
     str_to_orig = {v: k for k, v in orig_to_str.items()}
@@ -170,10 +299,91 @@ def build_columns_dictionary(column_names: list):
     return {c_id: c_name for (c_id, c_name) in enumerate(column_names)}
 
 
+def _parse_raw_rules_by_line(filename: str):
+    """Parse a file with raw rules one line at a time. See :func:`parse_raw_rules`."""
+    item_counts, item_ids, class_ids, supports, confidences = list(), list(), list(), list(), list()
+    with open(filename, 'r') as fp:
+        for line in fp:
+            chunks = line.strip('\n').split(" ")
+            rule_item_ids = set([int(i) for i in chunks[0][1:-1].split(",")])
+            item_counts.append(len(rule_item_ids))
+            item_ids.extend(sorted(rule_item_ids))
+            class_ids.append(int(chunks[2]))
+            supports.append(int(chunks[3]))
+            confidences.append(float(chunks[4]))
+
+    item_indptr = np.concatenate([[0], np.cumsum(item_counts, dtype=np.int64)])
+    return RuleTable(item_indptr, item_ids, class_ids, supports, confidences)
+
+
+def _parse_rule_chars(chars: np.array):
+    """Parse the raw rules stored in an array of (ASCII) characters.
+
+    Every rule starts with '{'. Its tokens (runs of digits and dots) are the
+    items of the antecedent, up to '}', then the class id, the support and the
+    confidence. Any further token of the rule is ignored.
+    """
+    is_dot = chars == ord('.')
+    is_token = ((chars - np.uint8(ord('0'))) < 10) | is_dot
+
+    # boundaries of tokens and rules
+    is_token_start = is_token.copy()
+    is_token_start[1:] &= ~is_token[:-1]
+    is_token_end = is_token
+    is_token_end[:-1] &= ~is_token[1:]
+    token_starts = np.flatnonzero(is_token_start)
+    token_lengths = np.flatnonzero(is_token_end) + 1 - token_starts
+    rule_first_token = np.searchsorted(token_starts, np.flatnonzero(chars == ord('{')))
+    rule_n_items = np.searchsorted(token_starts, np.flatnonzero(chars == ord('}'))) - rule_first_token
+    n_rules = len(rule_first_token)
+    rule_n_tokens = np.diff(np.concatenate([rule_first_token, [len(token_starts)]]))
+    if len(rule_n_items) != n_rules or (rule_n_tokens < rule_n_items + 3).any():
+        raise ValueError("Malformed raw rule: class id, support or confidence missing.")
+
+    # value of each token ignoring dots, reading one character of all the tokens at a time.
+    # Tokens are sorted by decreasing length, so that those with a k-th character come first.
+    order = np.argsort(-token_lengths, kind='stable')
+    sorted_starts = token_starts[order]
+    n_longer = np.bincount(token_lengths, minlength=1)[::-1].cumsum()[::-1]   # tokens longer than k - 1
+    sorted_values = np.zeros(len(token_starts), dtype=np.int64)
+    for k in range(1, len(n_longer)):
+        n_tokens = n_longer[k]
+        token_chars = chars[sorted_starts[:n_tokens] + (k - 1)]
+        is_digit = token_chars != ord('.')
+        values = sorted_values[:n_tokens]
+        values[is_digit] = values[is_digit] * 10 + (token_chars[is_digit] - np.uint8(ord('0')))
+    token_values = np.empty_like(sorted_values)
+    token_values[order] = sorted_values
+
+    # number of decimals of each token
+    dot_positions = np.flatnonzero(is_dot)
+    dot_tokens = np.searchsorted(token_starts, dot_positions, side='right') - 1
+    token_n_decimals = np.zeros(len(token_starts), dtype=np.int64)
+    token_n_decimals[dot_tokens] = token_starts[dot_tokens] + token_lengths[dot_tokens] - dot_positions - 1
+
+    # items, sorted and without duplicates within each rule as in Rule
+    item_rules = np.repeat(np.arange(n_rules), rule_n_items)
+    item_tokens = np.repeat(rule_first_token - np.cumsum(rule_n_items) + rule_n_items, rule_n_items) + \
+        np.arange(len(item_rules))
+    item_ids = token_values[item_tokens]
+    n_item_ids = item_ids.max(initial=0) + 1
+    item_keys = np.unique(item_rules * n_item_ids + item_ids)
+    item_ids, item_rules = item_keys % n_item_ids, item_keys // n_item_ids
+    item_indptr = np.concatenate([[0], np.cumsum(np.bincount(item_rules, minlength=n_rules))])
+
+    class_tokens = rule_first_token + rule_n_items
+    confidence_tokens = class_tokens + 2
+    confidences = token_values[confidence_tokens] / 10.0 ** token_n_decimals[confidence_tokens]
+    return RuleTable(item_indptr, item_ids, token_values[class_tokens], token_values[class_tokens + 1],
+                     confidences)
+
+
 def parse_raw_rules(filename: str):
-    """Given a file with raw rules, parse and extract a list of Rule.
+    """Given a file with raw rules, parse and extract a table of rules.
 
     The ID assigned to the rule is its position in the rules file (either lvl1 or lvl2).
+    The file is memory-mapped and parsed at once with NumPy, without
+    splitting it into lines.
 
     Parameters
     ----------
@@ -182,15 +392,64 @@ def parse_raw_rules(filename: str):
 
     Returns
     -------
-    rules : list
-        A list of Rule extracted from <filename>.
+    rules : RuleTable
+        The rules extracted from <filename>.
     """
-    rules = list()
-    with open(filename, 'r') as fp:
-        rules = [Rule(line.strip('\n'), rule_id) for (rule_id, line) in enumerate(fp)]
+    with open(filename, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            return RuleTable([0], [], [], [], [])
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            chars = np.frombuffer(mm, dtype=np.uint8)
+            rules = _parse_rule_chars(chars)
+            del chars   # release the buffer before closing the map
     return rules
 
 
+def build_rule_index(rules: RuleTable) -> dict:
+    """Build an inverted index over a rule set.
+
+    Each rule is stored in the posting list of exactly one of its items, the
+    one shared by the fewest rules. Since a rule matches a transaction only if
+    all its items occur in it, the rules worth checking against a transaction
+    are those posted under one of its items. Posting lists contain rule ids
+    and are sorted in ascending order.
+
+    Parameters
+    ----------
+    rules : RuleTable
+        The rule set to index.
+
+    Returns
+    -------
+    rule_index : dict
+        A dictionary mapping an item id to the (sorted) list of ids of
+        the rules posted under it.
+    """
+    if len(rules.item_ids) == 0:
+        return dict()
+
+    unique_ids, inverse, counts = np.unique(rules.item_ids, return_inverse=True, return_counts=True)
+    entry_rule_ids = np.repeat(np.arange(len(rules)), rules.lengths)
+
+    # for each rule, pick the first of its entries by (item count, item id)
+    order = np.lexsort((rules.item_ids, counts[inverse], entry_rule_ids))
+    first = np.concatenate([[True], entry_rule_ids[order][1:] != entry_rule_ids[order][:-1]])
+    key_items = rules.item_ids[order][first]
+    rule_ids = entry_rule_ids[order][first]
+
+    rule_index = defaultdict(list)
+    for key_item, rule_id in zip(key_items.tolist(), rule_ids.tolist()):
+        rule_index[key_item].append(rule_id)
+    return dict(rule_index)
+
+
+def build_rule_item_sets(rules: RuleTable) -> list:
+    """Get the set of items of each rule, e.g. to check them against transactions."""
+    item_ids = rules.item_ids.tolist()
+    indptr = rules.item_indptr.tolist()
+    return [set(item_ids[indptr[i]:indptr[i + 1]]) for i in range(len(rules))]
+
+
 def write_human_readable(filename: str,
                          rules: list,
                          item_id_to_item: dict,
@@ -0,0 +1,166 @@
+"""
+This module provides the integer encoding of categorical data used by the estimator.
+
+Rather than converting a whole dataset into a fixed-width unicode array, each
+column is converted on its own and its values are replaced by small integer
+codes. Once the L3 item dictionary is known, codes are in turn mapped to
+item ids.
+"""
+
+import numpy as np
+from l3wrapper.dictionary import _UNKNOWN_ITEM
+
+
+_UNKNOWN_CODE = -1
+
+
+def _column_as_str(X, column_id):
+    # values are handled as the strings written in the L3 training file
+    return X[:, column_id].astype(str)
+
+
+class CategoricalEncoder:
+    """Encode the values of each column of a categorical dataset as integer codes.
+
+    The codes of a column are the positions of its values in the sorted array
+    of the distinct values (as strings) seen at :meth:`fit_transform`.
+
+    Attributes
+    ----------
+    categories_ : list of ndarray
+        The sorted distinct values of each column.
+    item_ids_ : list of ndarray
+        For each column, the item id assigned to each category (see
+        :meth:`set_item_ids`).
+    """
+
+    def fit(self, X):
+        """Learn the categories of each column of X.
+
+        Parameters
+        ----------
+        X : ndarray, shape (n_samples, n_features)
+            The categorical data.
+
+        Returns
+        -------
+        self : object
+            Returns self.
+        """
+        self.categories_ = [np.unique(_column_as_str(X, column_id)) for column_id in range(X.shape[1])]
+        return self
+
+    def fit_transform(self, X):
+        """Learn the categories of each column and encode X.
+
+        Parameters
+        ----------
+        X : ndarray, shape (n_samples, n_features)
+            The categorical data to encode.
+
+        Returns
+        -------
+        codes : ndarray of int32, shape (n_samples, n_features)
+            The encoded data.
+        """
+        self.categories_ = list()
+        codes = np.empty(X.shape, dtype=np.int32)
+        for column_id in range(X.shape[1]):
+            categories, inverse = np.unique(_column_as_str(X, column_id), return_inverse=True)
+            self.categories_.append(categories)
+            codes[:, column_id] = inverse.reshape(-1)
+        return codes
+
+    def update(self, X):
+        """Add to the categories of each column the values of X never seen before.
+
+        The codes of the categories seen before may change, as the categories
+        are kept sorted.
+
+        Parameters
+        ----------
+        X : ndarray, shape (n_samples, n_features)
+            The categorical data.
+
+        Returns
+        -------
+        positions : list of ndarray
+            For each column, the new codes of the categories seen before.
+        """
+        if not hasattr(self, "categories_"):
+            self.categories_ = [np.array([], dtype=str) for _ in range(X.shape[1])]
+        elif X.shape[1] != len(self.categories_):
+            raise ValueError(f"X has {X.shape[1]} features, but the encoder expects "
+                             f"{len(self.categories_)} features.")
+
+        positions = list()
+        for column_id, categories in enumerate(self.categories_):
+            updated = np.union1d(categories, _column_as_str(X, column_id))
+            positions.append(np.searchsorted(updated, categories))
+            self.categories_[column_id] = updated
+        return positions
+
+    def transform(self, X):
+        """Encode X. Values never seen at :meth:`fit_transform` get the code -1.
+
+        Parameters
+        ----------
+        X : ndarray, shape (n_samples, n_features)
+            The categorical data to encode.
+
+        Returns
+        -------
+        codes : ndarray of int32, shape (n_samples, n_features)
+            The encoded data.
+        """
+        if X.shape[1] != len(self.categories_):
+            raise ValueError(f"X has {X.shape[1]} features, but the encoder expects "
+                             f"{len(self.categories_)} features.")
+
+        codes = np.empty(X.shape, dtype=np.int32)
+        for column_id, categories in enumerate(self.categories_):
+            values = _column_as_str(X, column_id)
+            positions = np.searchsorted(categories, values)
+            positions[positions == len(categories)] = 0
+            known = categories[positions] == values
+            codes[:, column_id] = np.where(known, positions, _UNKNOWN_CODE)
+        return codes
+
+    def set_item_ids(self, item_to_item_id: dict):
+        """Align the codes to the item ids assigned by L3.
+
+        Parameters
+        ----------
+        item_to_item_id : dict
+            The mapping (column_id, value) -> item_id. Categories without an
+            item id are mapped to the unknown item.
+        """
+        self.item_ids_ = [
+            np.array([item_to_item_id.get((column_id, c), _UNKNOWN_ITEM) for c in categories],
+                     dtype=np.int32)
+            for (column_id, categories) in enumerate(self.categories_)
+        ]
+        return self
+
+    def transform_items(self, X):
+        """Encode X as the item ids of its values.
+
+        Parameters
+        ----------
+        X : ndarray, shape (n_samples, n_features)
+            The categorical data to encode.
+
+        Returns
+        -------
+        item_ids : ndarray of int32, shape (n_samples, n_features)
+            The item id of each value, or the unknown item id for values
+            without one.
+        """
+        codes = self.transform(X)
+        item_ids = np.empty(X.shape, dtype=np.int32)
+        for column_id, column_item_ids in enumerate(self.item_ids_):
+            column_codes = codes[:, column_id]
+            item_ids[:, column_id] = np.where(column_codes == _UNKNOWN_CODE,
+                                              _UNKNOWN_ITEM,
+                                              column_item_ids[column_codes])
+        return item_ids
@@ -2,32 +2,56 @@
 The main module for the L3 estimator.
 """
 
+import asyncio
 import logging
-from os.path import isdir, join, exists
+import os
+import hashlib
+from os.path import isdir, join, exists, abspath
 from os import rename, remove
 from glob import glob
 import subprocess
 import secrets
+import csv
+from itertools import islice
+from contextlib import contextmanager
 from l3wrapper import l3wrapper_data_path
-from l3wrapper.dictionary import build_class_dict, \
+from l3wrapper.dictionary import RuleTable, build_class_dict, \
                                  build_item_dictionaries, \
                                  parse_raw_rules, \
                                  write_human_readable, \
                                  build_columns_dictionary, \
                                  Transaction, \
-                                 build_y_mappings
+                                 build_y_mappings, \
+                                 build_rule_index, \
+                                 build_rule_item_sets
 from l3wrapper.validation import check_column_names, check_dtype
-from joblib import Parallel, delayed
+from l3wrapper.encoding import CategoricalEncoder
+from l3wrapper.cache import FitCache, make_key
+from l3wrapper.serialization import write_model_file, read_model_file
+from l3wrapper.mining import CLASS_ID_START, FrequentItemsets, build_bitsets, mine_class_rules, popcount, sort_rules, \
+    split_levels
+from l3wrapper.voting import get_match_strategy, vote
+from l3wrapper.monitoring import PredictionStats
+from l3wrapper.matching import build_item_columns, rule_matrix_from_arrays, \
+                               build_rule_matrix, \
+                               encode_transactions, \
+                               find_unreachable_rules, \
+                               get_matching_rules
+import joblib
+from joblib import Parallel, delayed, effective_n_jobs
 import time
-from collections import Counter
-from operator import itemgetter
 import numpy as np
-from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+from sklearn.model_selection import ParameterGrid
+import copy
 from sklearn.utils.validation import check_X_y, check_array, check_is_fitted
 from sklearn.utils.multiclass import unique_labels, check_classification_targets
 import warnings
-from os import chdir, getcwd, mkdir
+from os import mkdir
 import shutil
+import tempfile
+import threading
+import weakref
 
 
 BIN_DIR = "bin"
@@ -41,6 +65,26 @@ LEVEL2_FILE_READABLE = "lvl2_R.txt"
 FILTER_LEVEL1 = ''
 FILTER_LEVEL2 = ''
 FILTER_BOTH = ''
+SPARSE_BATCH_SIZE = 10000
+# the fraction of its probability a class tied in votes with the predicted one gives to it, see predict_proba
+PROBA_TIE_MARGIN = 1e-6
+DUMP_CHUNKSIZE = 100000
+# the fitted state saved in the header of model files, see L3Classifier.save
+SAVED_ATTRS = ["classes_", "_yorig_to_str", "_ystr_to_orig", "unlabeled_class_", "_class_dict",
+               "_column_id_to_name", "n_items_used_", "_mined_fingerprint", "_mined_n_samples",
+               "current_token_", "train_dir_"]
+# the arrays of a RuleTable, in the order of its constructor arguments
+RULE_TABLE_FIELDS = ["item_indptr", "item_ids", "class_ids", "supports", "confidences", "lengths"]
+# the state built from the rule sets at prediction time, never saved
+COMPILED_ATTRS = ["_lvl1_index", "_lvl2_index", "_lvl1_item_sets", "_lvl2_item_sets",
+                  "_item_columns", "_lvl1_matrix", "_lvl2_matrix", "_matcher_file"]
+# the number of rule matchers kept by each joblib worker across predict calls
+MAX_WORKER_MATCHERS = 8
+# the parameters used by the L3 training, the others only affect the prediction
+TRAINING_PARAMS = ['min_sup', 'min_conf', 'specialistic_rules', 'max_length', 'l3_root',
+                   'rule_sets_modifier', 'work_dir', 'train_engine']
+# the parameters passed to the L3 training binary
+MINING_PARAMS = ['min_sup', 'min_conf', 'specialistic_rules', 'max_length', 'l3_root', 'train_engine']
 
 
 def _create_column_names(X):
@@ -48,11 +92,58 @@ def _create_column_names(X):
     return [f"{i}" for i in range(1, X.shape[1] + 1)]
 
 
-def _dump_array_to_file(X, filestem, ext):
+def _dump_encoded_to_file(codes, categories, filestem, ext, chunksize=DUMP_CHUNKSIZE):
+    """Write a categorical dataset, given as integer codes, to a csv file.
+
+    Parameters
+    ----------
+    codes : list of ndarray
+        The codes of each column.
+    categories : list of ndarray
+        The values (categories) of each column, indexed by code.
+    filestem, ext : str
+        The file is named <filestem>.<ext>.
+    chunksize : int, default=DUMP_CHUNKSIZE
+        The number of rows joined in memory and written at once.
+    """
+    values = [np.array([str(c) for c in column_categories], dtype=object) for column_categories in categories]
+    n_rows = len(codes[0])
     with open(f"{filestem}.{ext}", "w") as fp:
-        for row in X:
-            row = [f"{i}" for i in row]
-            fp.write(f"{','.join(row)}\n")
+        for start in range(0, n_rows, chunksize):
+            columns = [v[c[start:start + chunksize]] for (v, c) in zip(values, codes)]
+            fp.write("\n".join(map(",".join, zip(*columns))))
+            fp.write("\n")
+
+
+def _fingerprint(X_codes, categories, y):
+    """Hash the encoded training data, identifying the data seen by the L3 training."""
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(X_codes).tobytes())
+    for column_categories in categories:
+        digest.update("\x1f".join(column_categories.tolist()).encode())
+        digest.update(b"\x1e")
+    digest.update("\x1f".join(np.asarray(y).tolist()).encode())
+    return digest.hexdigest()
+
+
+def _as_percent(threshold):
+    # thresholds are passed to the binary as percentages with two decimals
+    return float(f"{threshold * 100:.2f}")
+
+
+def _read_csv_chunks(path, chunksize, delimiter, usecols):
+    """Read a csv file in blocks of at most `chunksize` rows. Empty lines are skipped."""
+    if chunksize < 1:
+        raise ValueError("'chunksize' must be at least 1")
+
+    with open(path, "r", newline="") as fp:
+        reader = filter(None, csv.reader(fp, delimiter=delimiter))
+        while True:
+            rows = list(islice(reader, chunksize))
+            if not rows:
+                break
+            X = np.array(rows, dtype=object)
+            yield X if usecols is None else X[:, usecols]
 
 
 def _remove_fit_files(filestem):
@@ -71,12 +162,28 @@ def _remove_fit_files(filestem):
     ]
 
 
-def _get_matching_rules(transaction, rules, max_matching):
+def _get_matching_rules(item_ids, rule_item_sets, max_matching, rule_index=None):
+    """Get the ids of the first `max_matching` rules, in rule_id order, matching a record.
+
+    The record is given as the set of its item ids, the rules as the list of
+    their item sets (see :func:`build_rule_item_sets`).
+    If `rule_index` (see :func:`build_rule_index`) is given, only the rules
+    posted under the record's items are checked. Otherwise, the whole
+    rule set is scanned.
+    """
     if max_matching < 1:
         raise ValueError("'max_matching' must be at least 1")
 
+    if rule_index is not None:
+        candidates = list()
+        for item_id in item_ids:
+            candidates.extend(rule_index.get(item_id, ()))
+        candidates.sort()
+        rule_iter = (c for c in candidates if rule_item_sets[c].issubset(item_ids))
+    else:
+        rule_iter = (r for (r, rule_items) in enumerate(rule_item_sets) if rule_items.issubset(item_ids))
+
     matching_rules = list()
-    rule_iter = (r for r in rules if r.match(transaction))
     count = 0
     while count < max_matching:
         try:
@@ -88,6 +195,55 @@ def _get_matching_rules(transaction, rules, max_matching):
     return matching_rules
 
 
+def _match_chunk(matcher_path, item_ids, engine, max_matching, timed):
+    """Match a chunk of records in a joblib worker (see :meth:`L3Classifier._predict_parallel`).
+
+    The rule matcher is loaded, with its arrays memory mapped, and compiled once per worker: the next calls reuse it.
+    """
+    with _worker_matchers_lock:
+        # drop the matchers whose file was removed: their estimator was refitted or collected
+        for path in [path for path in _worker_matchers if not exists(path)]:
+            _worker_matchers.pop(path, None)
+        matcher = _worker_matchers.get(matcher_path)
+        if matcher is None:
+            matcher = joblib.load(matcher_path, mmap_mode='r')
+            while len(_worker_matchers) >= MAX_WORKER_MATCHERS:
+                _worker_matchers.pop(next(iter(_worker_matchers)), None)     # drop the oldest one
+            _worker_matchers[matcher_path] = matcher
+    return matcher._match(item_ids, engine, max_matching, timed)
+
+
+def _remove_matcher_file(path):
+    """Remove a dumped rule matcher, and drop it from the matchers loaded by this process, if any."""
+    with _worker_matchers_lock:
+        _worker_matchers.pop(path, None)
+    os.remove(path)
+
+
+async def _run_in_executor(func, *args):
+    """Run a function in the default executor of the running event loop and await it.
+
+    If the awaiting task is cancelled, the function is waited for anyway before the cancellation
+    propagates, as the thread running it cannot be interrupted: the caller can then clean up safely.
+    """
+    future = asyncio.get_running_loop().run_in_executor(None, func, *args)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        while not future.done():
+            try:
+                await asyncio.wait([future])
+            except asyncio.CancelledError:
+                pass
+        raise
+
+
+# the rule matchers loaded by this process as a joblib worker, by file path (see _match_chunk),
+# shared by the threads of the threading backend
+_worker_matchers = dict()
+_worker_matchers_lock = threading.Lock()
+
+
 def _get_majority_class(y):
     """Get the majority class.
 
@@ -98,7 +254,139 @@ def _get_majority_class(y):
     return mc[0][0]
 
 
-class L3Classifier(BaseEstimator, ClassifierMixin):
+class _RuleMatchingMixin:
+    """Match records against the rule sets `lvl1_rules_` and `lvl2_rules_`, whose items are in `_item_id_to_item`.
+
+    The rule indexes and matrices used by the matching engines are built lazily.
+    """
+
+    def _build_rule_indexes(self):
+        lvl1_index = build_rule_index(self.lvl1_rules_)
+        lvl2_index = build_rule_index(self.lvl2_rules_)
+        lvl1_item_sets = build_rule_item_sets(self.lvl1_rules_)
+        lvl2_item_sets = build_rule_item_sets(self.lvl2_rules_)
+        # the item sets are set last, their presence marks the indexes as built
+        self._lvl1_index, self._lvl2_index = lvl1_index, lvl2_index
+        self._lvl1_item_sets, self._lvl2_item_sets = lvl1_item_sets, lvl2_item_sets
+
+    def _build_rule_matrices(self):
+        item_columns = build_item_columns(self._item_id_to_item)
+        lvl1_matrix = build_rule_matrix(self.lvl1_rules_, item_columns)
+        lvl2_matrix = build_rule_matrix(self.lvl2_rules_, item_columns)
+        self._item_columns, self._lvl1_matrix = item_columns, lvl1_matrix
+        self._lvl2_matrix = lvl2_matrix     # set last, its presence marks the matrices as built
+
+    def _match(self, item_ids, engine, max_matching, timed):
+        """Match a batch of records, given as item ids, against the rule sets.
+
+        Returns
+        -------
+        used_levels, indptr, rule_ids, latencies : (ndarray, ndarray, ndarray, ndarray)
+            The level used to classify each record (-1 if no rule matched),
+            in CSR-like form, the ids of the rules matching each record: the
+            ones of the i-th record are `rule_ids[indptr[i]:indptr[i + 1]]`,
+            and the matching time of each record (None unless `timed`).
+        """
+        if engine == 'sparse':
+            return self._match_sparse(item_ids, max_matching, timed)
+        return self._match_loop(item_ids, max_matching, timed)
+
+    def _match_loop(self, item_ids, max_matching, timed):
+        if not hasattr(self, "_lvl2_item_sets"):
+            self._build_rule_indexes()
+
+        used_levels = np.full(item_ids.shape[0], -1, dtype=np.int8)
+        n_matching = np.zeros(item_ids.shape[0], dtype=np.int64)
+        rule_ids = list()
+        row_ends = np.empty(item_ids.shape[0]) if timed else None
+
+        start = time.perf_counter()
+        for i, row_item_ids in enumerate(item_ids.tolist()):
+            row_item_ids = set(row_item_ids)
+
+            # match against level 1, then against level 2 if level 1 was not used
+            for used_level, rule_item_sets, rule_index in [(1, self._lvl1_item_sets, self._lvl1_index),
+                                                           (2, self._lvl2_item_sets, self._lvl2_index)]:
+                matching_rule_ids = _get_matching_rules(row_item_ids, rule_item_sets, max_matching,
+                                                        rule_index)
+                if matching_rule_ids:
+                    used_levels[i] = used_level
+                    n_matching[i] = len(matching_rule_ids)
+                    rule_ids.extend(matching_rule_ids)
+                    break
+            if timed:
+                row_ends[i] = time.perf_counter()
+
+        indptr = np.concatenate([[0], np.cumsum(n_matching)])
+        latencies = np.diff(row_ends, prepend=start) if timed else None
+        return used_levels, indptr, np.array(rule_ids, dtype=np.int64), latencies
+
+    def _match_sparse(self, item_ids, max_matching, timed):
+        if not hasattr(self, "_lvl2_matrix"):
+            self._build_rule_matrices()
+
+        used_levels, n_matching, rule_ids, latencies = list(), list(), list(), list()
+        for start in range(0, item_ids.shape[0], SPARSE_BATCH_SIZE):
+            batch_start = time.perf_counter()
+            batch_item_ids = item_ids[start:start + SPARSE_BATCH_SIZE]
+            T = encode_transactions(batch_item_ids, self._item_columns)
+
+            # match against level 1, then match against level 2 the records left
+            lvl1_indptr, lvl1_ids = get_matching_rules(T, *self._lvl1_matrix, max_matching)
+            lvl1_counts = np.diff(lvl1_indptr)
+            lvl2_rows = np.flatnonzero(lvl1_counts == 0)
+            lvl2_indptr, lvl2_ids = get_matching_rules(T[lvl2_rows], *self._lvl2_matrix, max_matching)
+            lvl2_counts = np.diff(lvl2_indptr)
+
+            batch_levels = np.where(lvl1_counts > 0, 1, -1).astype(np.int8)
+            batch_levels[lvl2_rows[lvl2_counts > 0]] = 2
+            batch_counts = lvl1_counts.copy()
+            batch_counts[lvl2_rows] = lvl2_counts
+
+            # merge the rule ids of the two levels, in record order
+            rows = np.concatenate([np.repeat(np.arange(batch_item_ids.shape[0]), lvl1_counts),
+                                   np.repeat(lvl2_rows, lvl2_counts)])
+            order = np.argsort(rows, kind='stable')
+
+            used_levels.append(batch_levels)
+            n_matching.append(batch_counts)
+            rule_ids.append(np.concatenate([lvl1_ids, lvl2_ids])[order])
+            # the records of a batch are matched at once, each one gets the average time
+            if timed:
+                latencies.append(np.full(batch_item_ids.shape[0],
+                                         (time.perf_counter() - batch_start) / batch_item_ids.shape[0]))
+
+        n_matching = np.concatenate(n_matching) if n_matching else np.zeros(0, dtype=np.int64)
+        indptr = np.concatenate([[0], np.cumsum(n_matching)]).astype(np.int64)
+        used_levels = np.concatenate(used_levels) if used_levels else np.zeros(0, dtype=np.int8)
+        rule_ids = np.concatenate(rule_ids) if rule_ids else np.zeros(0, dtype=np.int64)
+        if timed:
+            latencies = np.concatenate(latencies) if latencies else np.zeros(0)
+        else:
+            latencies = None
+        return used_levels, indptr, rule_ids, latencies
+
+
+class _RuleMatcher(_RuleMatchingMixin):
+    """The rule sets of a fitted :class:`L3Classifier`, without the rest of its state, to match records in workers."""
+
+    def __init__(self, lvl1_rules, lvl2_rules, item_id_to_item):
+        self.lvl1_rules_ = lvl1_rules
+        self.lvl2_rules_ = lvl2_rules
+        self._item_id_to_item = item_id_to_item
+
+
+class _MatcherFile:
+    """A rule matcher dumped to a temporary file, removed along with this object."""
+
+    def __init__(self, matcher):
+        fd, self.path = tempfile.mkstemp(prefix="l3matcher_", suffix=".joblib")
+        os.close(fd)
+        self._finalizer = weakref.finalize(self, _remove_matcher_file, self.path)
+        joblib.dump(matcher, self.path)
+
+
+class L3Classifier(_RuleMatchingMixin, BaseEstimator, ClassifierMixin):
     """The L3-based estimator implementing the scikit-learn estimator interface.
 
     The model training relies on the L3 binaries. At this point they should
@@ -117,15 +405,27 @@ class L3Classifier(BaseEstimator, ClassifierMixin):
     assign_unlabeled : str, default='majority_class'
         The strategy used to assign the classification label whenever there is
         no rule that matches the data point to classified.
-    match_strategy : {'majority_voting'}, default='majority_voting'
+    match_strategy : {'majority_voting', 'first_match', 'confidence_weighted', \
+            'support_weighted'}, default='majority_voting'
         The strategy used to pick which rule or set of rules should be used to
         classify a data point. Supported values:
         - 'majority_voting' (default): choose the label using majority voting
         among the class labels predicted by the top `max_matching` rules.
-        In case of a tie, the label is chosen arbitrarily.
+        - 'first_match': use the label of the first matching rule, as L3
+        does. With engine='loop', matching stops at the first rule covering
+        the data point, which makes it the cheapest strategy. The sparse
+        engine still computes all the matches of a batch at once, then
+        keeps the first one.
+        - 'confidence_weighted': as 'majority_voting', but each rule votes
+        with its confidence.
+        - 'support_weighted': as 'majority_voting', but each rule votes
+        with its support.
+        Ties go to the class whose rules come first. More strategies can be
+        added with :func:`l3wrapper.voting.register_match_strategy`.
     max_matching : int, default=1
-        The number of rules to be used for choosing the final label. It is used
-        only when match_strategy='majority_voting'.
+        The number of rules to be used for choosing the final label (the top
+        `max_matching` matching rules). It is ignored when
+        match_strategy='first_match'.
     specialistic_rules : bool, default=True
         Choose whether to prefer specialistic or general rules first at
         training time.
@@ -138,25 +438,115 @@ class L3Classifier(BaseEstimator, ClassifierMixin):
         Use this parameter to modify the extracted rule sets. Option
         'level1' retains only the level 1 rule set, discarding level 2.
         If 'standard', the original behavior of L3 is unchanged.
+    work_dir : str, default=None
+        The directory where the training directory, holding the files
+        exchanged with the L3 binaries, is created at :meth:`fit`. Use a
+        RAM-backed file system (e.g. '/dev/shm') to speed up the I/O. If None,
+        the default temporary directory (see :func:`tempfile.gettempdir`) is
+        used.
+    keep_training_data : bool, default=True
+        Whether to store the training data in `X_` and `y_` at :meth:`fit`.
+        Set it to False to save memory, as they are not used at inference.
+    n_jobs : int, default=None
+        The number of jobs used by :meth:`predict`. The input is split into
+        `n_jobs` contiguous chunks, each one matched by a different joblib
+        worker. The workers are sent the rule sets only, through a temporary
+        file they memory map, and keep them compiled across calls.
+        ``None`` means 1 unless in a :obj:`joblib.parallel_backend` context.
+        ``-1`` means using all processors.
+    warm_start : bool, default=False
+        When set to True, :meth:`fit` reuses the rules mined by the previous
+        call to fit, on the same data, if the new parameters select a subset
+        of them. The rules are then filtered by support, confidence and length
+        without running the L3 training binary. This holds when `min_sup` and
+        `min_conf` are not lower than the mined ones and `max_length` is not
+        higher (0 means no limit). `assign_unlabeled`, `match_strategy`,
+        `max_matching` and `rule_sets_modifier` never need the binary.
+        Changing `specialistic_rules` or `l3_root`, lowering the thresholds,
+        raising `max_length` or fitting different data forces a full
+        retrain. As the L3 training splits the rules in the two levels by
+        database coverage over the whole rule set, the rules left are merged
+        back in L3 order and split again over the training data (see
+        :func:`l3wrapper.mining.split_levels`). With train_engine='python'
+        the levels are then the ones of a full retrain. The L3 binary
+        discards the rules pruned by the split, which a retrain at higher
+        thresholds may keep, and it limits the length of the macro-itemsets
+        while the filter limits the length of the rules, which is stricter.
+    fit_callback : callable, default=None
+        A function called as ``fit_callback(stage, stats)`` at the end of
+        each stage of :meth:`fit`, with the name of the stage and its
+        statistics (see `fit_stats_`), e.g. to export them to a monitoring
+        system. The statistics are also logged at debug level.
+    track_predictions : bool, default=False
+        Whether to maintain the aggregate counters of the predictions in
+        `prediction_stats_`.
 
     Attributes
     ----------
     X_ : ndarray, shape (n_samples, n_features)
-        The input passed during :meth:`fit`.
+        The input passed during :meth:`fit`. Only if keep_training_data=True.
     y_ : ndarray, shape (n_samples,)
-        The labels passed during :meth:`fit`.
+        The labels passed during :meth:`fit`. Only if keep_training_data=True.
     classes_ : ndarray, shape (n_classes,)
         The classes seen at :meth:`fit`.
     n_items_used_ : int
         The number of different items seen.
-    lvl1_rules_ : list
-        The level 1 rules (:class:`Rule`) mined at :meth:`fit`.
-    lvl2_rules_ : list
-        The level 2 rules (:class:`Rule`) mined at :meth:`fit`.
+    lvl1_rules_ : RuleTable
+        The level 1 rules mined at :meth:`fit`. It can be used as a list of
+        :class:`Rule`.
+    lvl2_rules_ : RuleTable
+        The level 2 rules mined at :meth:`fit`. It can be used as a list of
+        :class:`Rule`.
     n_lvl1_rules_ : int
         The number of level 1 rules.
     n_lvl2_rules_ : int
         The number of level 2 rules.
+    current_token_ : str
+        The token identifying the files of the last :meth:`fit`. None if
+        the rules were loaded from the cache (see `cache_dir`) and no file
+        was written.
+    train_dir_ : str
+        The absolute path of the training directory of the last :meth:`fit`.
+        It is removed unless the fit files or the human readable rules are
+        kept. None if no training directory was created.
+    fit_stats_ : dict
+        The statistics of the stages of the last :meth:`fit`, by stage, in
+        execution order. Each stage records its 'wall_time' (s) and:
+        - 'validate': 'n_samples' and 'n_features';
+        - 'warm_start' and 'cache_lookup': 'hit', whether the rules were
+        reused (see `warm_start` and `cache_dir`);
+        - 'dump': 'bytes_written' to the training file;
+        - 'train': 'returncode', the exit status of the L3 training binary,
+        and 'stdout_bytes';
+        - 'load_rules': 'bytes_read' from the rule files;
+        - 'mine' (train_engine='python'): no statistic;
+        - 'cache_store': 'key';
+        - 'write_human_readable': 'bytes_written';
+        - 'total': 'n_lvl1_rules' and 'n_lvl2_rules'.
+        Only the stages run are recorded. :meth:`partial_fit` records its
+        'mine' stage, with 'n_itemsets', the frequent itemsets, and
+        'n_history_counts', those counted over the previous batches, and its
+        'split_levels' stage.
+    prediction_stats_ : PredictionStats
+        The counters of the records classified since the last :meth:`fit`
+        (see :class:`l3wrapper.monitoring.PredictionStats`): the hits of
+        each rule, the records classified with each level or by no rule and
+        the histogram of the matching time per record. Only if
+        track_predictions=True. Call its `reset` method to start over.
+    compaction_report_ : dict
+        The outcome of the last :meth:`compact`.
+    labeled_transactions_ : list
+        The Transaction built for each record at the last :meth:`predict`
+        with explain='transactions'.
+    used_levels_ : ndarray, shape (n_samples,)
+        The level used to classify each record at the last :meth:`predict`
+        with explain='arrays' (-1 if no rule matched the record).
+    matched_rules_indptr_ : ndarray, shape (n_samples + 1,)
+        See `matched_rule_ids_`.
+    matched_rule_ids_ : ndarray
+        The ids of the rules (of level `used_levels_[i]`) used to classify
+        the i-th record at the last :meth:`predict` with explain='arrays' are
+        `matched_rule_ids_[matched_rules_indptr_[i]:matched_rules_indptr_[i + 1]]`.
     """
     def __init__(self, min_sup=0.01, min_conf=0.5,
                  l3_root=l3wrapper_data_path,
@@ -165,7 +555,16 @@ class L3Classifier(BaseEstimator, ClassifierMixin):
                  max_matching=1,
                  specialistic_rules=True,
                  max_length=0,
-                 rule_sets_modifier='standard'):
+                 rule_sets_modifier='standard',
+                 work_dir=None,
+                 keep_training_data=True,
+                 n_jobs=None,
+                 warm_start=False,
+                 cache_dir=None,
+                 cache_max_bytes=2 ** 30,
+                 train_engine='binary',
+                 fit_callback=None,
+                 track_predictions=False):
         self.min_sup = min_sup
         self.min_conf = min_conf
         self.l3_root = l3_root
@@ -175,6 +574,15 @@ class L3Classifier(BaseEstimator, ClassifierMixin):
         self.specialistic_rules = specialistic_rules
         self.max_length = max_length
         self.rule_sets_modifier = rule_sets_modifier
+        self.work_dir = work_dir
+        self.keep_training_data = keep_training_data
+        self.n_jobs = n_jobs
+        self.warm_start = warm_start
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.train_engine = train_engine
+        self.fit_callback = fit_callback
+        self.track_predictions = track_predictions
 
     def _more_tags(self):
         return {
@@ -183,69 +591,66 @@ class L3Classifier(BaseEstimator, ClassifierMixin):
             'X_types': ['2darray', 'string']
         }
 
-    def _get_class_label(self, matching_rules: list):
-        """TODO Important method to weight majority voting"""
-        class_ids = list()
-        class_priority = {class_id : 0 for (class_id, _) in self._class_dict.items()}
-        for rule in matching_rules:
-            class_ids.append(rule.class_id)
-            class_priority[rule.class_id] += rule.rule_id
+    def __getstate__(self):
+        # The rule indexes and matrices are rebuilt after unpickling
+        state = super().__getstate__().copy()
+        for attr in COMPILED_ATTRS:
+            state.pop(attr, None)
+        return state
 
-        most_common = Counter(class_ids).most_common()
-        most_common = sorted(most_common, key=lambda x: class_priority[x[0]])   # ascending by class priority
-        most_common = sorted(most_common, key=itemgetter(1), reverse=True)      # descending by matched count
+    def _reset_compiled(self):
+        # the rule indexes and matrices are built lazily by the matching engines
+        for attr in COMPILED_ATTRS:
+            self.__dict__.pop(attr, None)
 
-        return self._class_dict[most_common[0][0]]
+    @contextmanager
+    def _fit_stage(self, name):
+        """Time a stage of fit and record it in `fit_stats_`, along with the statistics set in the yielded dict."""
+        stats = dict()
+        start = time.perf_counter()
+        yield stats
+        stats = {'wall_time': time.perf_counter() - start, **stats}
+        self.fit_stats_[name] = stats
+        self._logger.debug(f"Fit stage '{name}': {stats}")
+        if self.fit_callback is not None:
+            self.fit_callback(name, stats)
 
-    def fit(self,
-            X,
-            y,
-            column_names=None,
-            save_human_readable=False,
-            remove_files=True
-            ):
-        """A reference implementation of a fitting function for a classifier.
+    def _check_params(self):
+        # Check that the rule sets modifier is valid
+        valid_modifiers = ['standard', 'level1']
+        if self.rule_sets_modifier not in valid_modifiers:
+            raise NotImplementedError(
+                f"The rule sets modifier specified is not" \
+                f"supported. Use one of {valid_modifiers}."
+            )
 
-        Parameters
-        ----------
-        X : array-like, shape (n_samples, n_features)
-            The training input samples. No numerical inputs are allowed it.
-        y : array-like, shape (n_samples,)
-            The target values. An array of int.
-        column_names : list, default=None
-            A list containing the names to assign to columns in the dataset.
-            They will be used when printing the human readable format of the
-            rules.
-        remove_files : bool, default=True
-            Use this parameter to remove all the file generated by the original
-            L3 implementation at training time.
+        valid_engines = ['binary', 'python']
+        if self.train_engine not in valid_engines:
+            raise NotImplementedError(
+                f"The training engine specified is not supported. Use one of {valid_engines}."
+            )
 
-        Returns
-        -------
-        self : object
-            Returns self.
-        """
-        self._train_bin_path = join(self.l3_root, BIN_DIR, TRAIN_BIN)
-        self._classify_bin_path = join(self.l3_root, BIN_DIR, CLASSIFY_BIN)
+        get_match_strategy(self.match_strategy)     # raises if not registered
+
+        self._l3_root = abspath(self.l3_root)
+        self._train_bin_path = join(self._l3_root, BIN_DIR, TRAIN_BIN)
+        self._classify_bin_path = join(self._l3_root, BIN_DIR, CLASSIFY_BIN)
         self._logger = logging.getLogger(__name__)
 
+    def _validate_data(self, X, y, column_names):
+        """Validate the training data and learn the mappings needed to encode it.
+
+        Returns the integer codes of X and the labels as L3 strings.
+        """
         X = check_dtype(X)
         check_classification_targets(y)
 
         # Check that X and y have correct shape
-        X, y = check_X_y(X, y, dtype=np.unicode_)
+        X, y = check_X_y(X, y, dtype=None)
 
         # Check that y has correct values according to sklearn's policy
         unique = unique_labels(y)
 
-        # Check that the rule sets modifier is valid
-        valid_modifiers = ['standard', 'level1']
-        if self.rule_sets_modifier not in valid_modifiers:
-            raise NotImplementedError(
-                f"The rule sets modifier specified is not" \
-                f"supported. Use one of {valid_modifiers}."
-            )
-
         # create mappings letting L3 binaries to work on strings only
         self._yorig_to_str, self._ystr_to_orig = build_y_mappings(unique)
         y = np.array([self._yorig_to_str[label] for label in y])
@@ -253,148 +658,1299 @@ class L3Classifier(BaseEstimator, ClassifierMixin):
         # Store the classes seen during fit
         self.classes_ = [label for label in self._ystr_to_orig.keys()]
 
-        # Define the label when no rule matches
+        if self.keep_training_data:
+            self.X_ = X
+            self.y_ = y
+        else:
+            self.__dict__.pop('X_', None)
+            self.__dict__.pop('y_', None)
+
+        # Create column names if not provided
+        if column_names is None:
+            column_names = _create_column_names(X)
+        check_column_names(X, column_names)
+        self._column_id_to_name = build_columns_dictionary(column_names)
+
+        # learn the categories of each column, values are then handled as integer codes
+        self._encoder = CategoricalEncoder()
+        X_codes = self._encoder.fit_transform(X)
+        return X_codes, y
+
+    def _set_unlabeled_class(self, y):
+        # Define the label when no rule matches
         if self.assign_unlabeled == 'majority_class':
             self.unlabeled_class_ = _get_majority_class(y)
         else:
             self.unlabeled_class_ = self.assign_unlabeled
 
-        self.X_ = X
-        self.y_ = y
-
+    def _make_train_dir(self):
+        """Create a new training dir. Returns its token, its path and the filestem of its files."""
+        # All the files live in the training dir. The binaries run from there, no chdir is
+        # needed and multiple fits can run concurrently.
         token = secrets.token_hex(4)
-        filestem = f"{token}"
-        train_dir = token
+        work_dir = self.work_dir if self.work_dir is not None else tempfile.gettempdir()
+        train_dir = abspath(join(work_dir, token))
+        filestem = join(train_dir, token)
         if exists(train_dir):
             raise RuntimeError(f"The training dir with token {token} already exists")
         else:
             mkdir(train_dir)
-        old_dir = getcwd()
-        chdir(train_dir)
-
-        # Create column names if not provided
-        if column_names is None:
-            column_names = _create_column_names(X)
-        check_column_names(X, column_names)
-        self._column_id_to_name = build_columns_dictionary(column_names)
+        return token, train_dir, filestem
 
+    def _dump_training_data(self, filestem, X_codes, y):
         # Dump X and y in a single .data (csv) file. "y" target labels are inserted as the last column
-        X_todump = np.hstack([X, y.reshape(-1, 1)])
-        _dump_array_to_file(X_todump, filestem, "data")
+        y_categories, y_codes = np.unique(y, return_inverse=True)
+        _dump_encoded_to_file([X_codes[:, i] for i in range(X_codes.shape[1])] + [y_codes.reshape(-1)],
+                              self._encoder.categories_ + [y_categories],
+                              filestem, "data")
 
-        # Invoke the training module of L3.
+    def _training_command(self, token):
+        """Build the command line invoking the training module of L3."""
         if self.specialistic_rules:
             specialistic_flag = "0"
         else:
             specialistic_flag = "1"
 
-        with open(f"{filestem}_stdout.txt", "w") as stdout:
-            subprocess.run(
-                [
-                    self._train_bin_path,
-                    filestem,                       # training file filestem
-                    f"{self.min_sup * 100:.2f}",    # min sup
-                    f"{self.min_conf * 100:.2f}",   # min conf
-                    "nofiltro",                     # filtering measure for items (DEPRECATED)
-                    "0",                            # filtering threshold (DEPRECATED)
-                    specialistic_flag,              # specialistic/general rules (TO VERIFY)
-                    f"{self.max_length}",           # max length allowed for rules
-                    self.l3_root                    # L3 root containing the 'bin' directory with binaries
-                ],
-                stdout=stdout
-            )
+        return [
+            self._train_bin_path,
+            token,                          # training file filestem, relative to the training dir
+            f"{self.min_sup * 100:.2f}",    # min sup
+            f"{self.min_conf * 100:.2f}",   # min conf
+            "nofiltro",                     # filtering measure for items (DEPRECATED)
+            "0",                            # filtering threshold (DEPRECATED)
+            specialistic_flag,              # specialistic/general rules (TO VERIFY)
+            f"{self.max_length}",           # max length allowed for rules
+            self._l3_root                   # L3 root containing the 'bin' directory with binaries
+        ]
 
+    def _collect_rule_files(self, token, train_dir):
         # rename useful (lvl1) and sparse (lvl2) rule files
-        rename(LEVEL1_FILE, f"{token}_{LEVEL1_FILE}")
-        rename(LEVEL2_FILE, f"{token}_{LEVEL2_FILE}")
+        filestem = join(train_dir, token)
+        rename(join(train_dir, LEVEL1_FILE), f"{filestem}_{LEVEL1_FILE}")
+        rename(join(train_dir, LEVEL2_FILE), f"{filestem}_{LEVEL2_FILE}")
+
+    def _run_training(self, token, train_dir):
+        # Invoke the training module of L3.
+        filestem = join(train_dir, token)
+        with open(f"{filestem}_stdout.txt", "w") as stdout:
+            completed = subprocess.run(self._training_command(token), stdout=stdout, cwd=train_dir)
 
+        self._collect_rule_files(token, train_dir)
+        return completed.returncode
+
+    async def _run_training_async(self, token, train_dir, timeout, progress_callback):
+        """Run the training module of L3 without blocking the event loop (see :meth:`fit_async`)."""
+        filestem = join(train_dir, token)
+        process = await asyncio.create_subprocess_exec(*self._training_command(token),
+                                                       stdout=asyncio.subprocess.PIPE, cwd=train_dir)
+
+        async def stream_output():
+            with open(f"{filestem}_stdout.txt", "wb") as stdout:
+                async for line in process.stdout:
+                    stdout.write(line)
+                    line = line.decode(errors="replace").rstrip("\r\n")
+                    self._logger.debug(f"L3 training: {line}")
+                    if progress_callback is not None:
+                        progress_callback(line)
+            return await process.wait()
+
+        try:
+            returncode = await asyncio.wait_for(stream_output(), timeout)
+        except BaseException:
+            # timed out or cancelled: do not leave the training running
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+
+        self._collect_rule_files(token, train_dir)
+        return returncode
+
+    def _load_rule_sets(self, filestem):
         # read the mappings of classification labels
-        self._class_dict = build_class_dict(filestem)
+        class_dict = build_class_dict(filestem)
 
         # read the mappings item->"column_name","value"
-        self._item_id_to_item, self._item_to_item_id = build_item_dictionaries(filestem)
+        item_id_to_item, item_to_item_id = build_item_dictionaries(filestem)
+
+        # parse the two rule sets
+        lvl1_rules = parse_raw_rules(f"{filestem}_{LEVEL1_FILE}")
+        lvl2_rules = parse_raw_rules(f"{filestem}_{LEVEL2_FILE}")
+
+        self._set_mined(class_dict, item_id_to_item, item_to_item_id, lvl1_rules, lvl2_rules)
+
+    def _set_mined(self, class_dict, item_id_to_item, item_to_item_id, lvl1_rules, lvl2_rules, pruned_rules=None):
+        """Store the outcome of the L3 training and set the rule sets from it.
+
+        The data the rules were mined from is the one being fitted, identified by `_fit_fingerprint` and
+        `_fit_n_samples`: it is recorded along with the rules, only once the mining succeeded. The rules
+        pruned by the split in levels are only known when mining in process, the L3 binary discards them.
+        """
+        self._mined_fingerprint = self._fit_fingerprint
+        self._mined_n_samples = self._fit_n_samples
+        self._class_dict = class_dict
+        self._item_id_to_item, self._item_to_item_id = item_id_to_item, item_to_item_id
         self.n_items_used_ = len(self._item_id_to_item)
+        self._encoder.set_item_ids(self._item_to_item_id)
 
-        # apply the rule set modifier 
-        if self.rule_sets_modifier == 'level1':
-            with open(f"{token}_{LEVEL2_FILE}", "w") as fp:
-                self._logger.debug("Empty the level 2 rule set.")
+        # keep the rule sets as mined, to warm start later fits
+        self._mined_params = self._get_mining_params()
+        self._mined_lvl1_rules = lvl1_rules
+        self._mined_lvl2_rules = lvl2_rules
+        self._mined_pruned_rules = pruned_rules if pruned_rules is not None else RuleTable([0], [], [], [], [])
+        self._set_rule_sets()
 
-        # parse the two rule sets and store them
-        self.lvl1_rules_ = parse_raw_rules(f"{token}_{LEVEL1_FILE}")
-        self.lvl2_rules_ = parse_raw_rules(f"{token}_{LEVEL2_FILE}")
+    def _get_cache_entry(self):
+        return {
+            'class_dict': self._class_dict,
+            'item_id_to_item': self._item_id_to_item,
+            'item_to_item_id': self._item_to_item_id,
+            'lvl1_rules': self._mined_lvl1_rules,
+            'lvl2_rules': self._mined_lvl2_rules,
+            'pruned_rules': self._mined_pruned_rules
+        }
+
+    def _get_mining_params(self):
+        params = {name: getattr(self, name) for name in MINING_PARAMS}
+        params['l3_root'] = self._l3_root
+        return params
+
+    def _can_warm_start(self, fingerprint):
+        """Check whether the rules of the previous fit can be filtered instead of mined again."""
+        if not hasattr(self, "_mined_params") or self._mined_fingerprint != fingerprint:
+            return False
+        mined = self._mined_params
+        if mined['specialistic_rules'] != self.specialistic_rules \
+                or mined['l3_root'] != self._l3_root \
+                or mined['train_engine'] != self.train_engine:
+            return False
+        if mined['max_length'] != 0 and not 0 < self.max_length <= mined['max_length']:
+            return False
+        return _as_percent(self.min_sup) >= _as_percent(mined['min_sup']) \
+            and _as_percent(self.min_conf) >= _as_percent(mined['min_conf'])
+
+    def _filter_rules(self, rules):
+        """Select the mined rules satisfying the current thresholds."""
+        mask = (rules.supports >= _as_percent(self.min_sup) * self._mined_n_samples / 100) \
+            & (rules.confidences >= _as_percent(self.min_conf))
+        if self.max_length > 0:
+            mask &= rules.lengths <= self.max_length
+        return rules if mask.all() else rules.select(mask)
+
+    def _set_rule_sets(self, X_codes=None, y=None):
+        """Set the rule sets from the mined ones, according to the current parameters.
+
+        If the training data is given and some rules of the two levels are
+        filtered out, the rules left, along with the pruned ones, are split in
+        the two levels again (see :meth:`_split_levels`).
+        """
+        lvl1_rules = self._filter_rules(self._mined_lvl1_rules)
+        lvl2_rules = self._filter_rules(self._mined_lvl2_rules)
+        if X_codes is not None and (lvl1_rules is not self._mined_lvl1_rules
+                                    or lvl2_rules is not self._mined_lvl2_rules):
+            pruned_rules = self._filter_rules(self._mined_pruned_rules)
+            lvl1_rules, lvl2_rules = self._split_levels([lvl1_rules, lvl2_rules, pruned_rules], X_codes, y)
+        self.lvl1_rules_ = lvl1_rules
+        if self.rule_sets_modifier == 'level1':
+            self.lvl2_rules_ = RuleTable([0], [], [], [], [])
+        else:
+            self.lvl2_rules_ = lvl2_rules
         self.n_lvl1_rules_ = len(self.lvl1_rules_)
         self.n_lvl2_rules_ = len(self.lvl2_rules_)
+        # the training parameters the rule sets satisfy, saved with the model
+        self._fitted_params = {name: getattr(self, name) for name in TRAINING_PARAMS}
+        self._reset_compiled()
+        # the rule ids changed
+        for attr in ['prediction_stats_', '_lvl1_rule_ranks', '_lvl2_rule_ranks']:
+            self.__dict__.pop(attr, None)
+
+    def _split_levels(self, rule_sets, X_codes, y):
+        """Merge rule sets in L3 order and split them in the two levels by coverage of the training data.
 
+        The L3 training splits the levels over the whole mined rule set: once some rules are filtered out,
+        the rules left are split as a training with the current thresholds would (see
+        :func:`l3wrapper.mining.split_levels`).
+        """
+        item_columns = build_item_columns(self._item_id_to_item)
+        class_ids = sorted(self._class_dict)
+        class_positions = {class_id: position for (position, class_id) in enumerate(class_ids)}
+        rules = list()
+        for table in rule_sets:
+            indptr, item_ids = table.item_indptr.tolist(), table.item_ids.tolist()
+            for i, (class_id, support, confidence) in enumerate(zip(table.class_ids.tolist(), table.supports.tolist(),
+                                                                     table.confidences.tolist())):
+                items = tuple(sorted(item_columns[item_id] for item_id in item_ids[indptr[i]:indptr[i + 1]]))
+                rules.append((items, class_positions[class_id], support, confidence))
+        rules = sort_rules(rules, self.specialistic_rules)
+
+        # the bitsets of the training records, the values without an item id fall in an extra item
+        column_item_ids = np.array(sorted(item_columns), dtype=np.int64)
+        item_to_column = np.full(int(column_item_ids.max(initial=0)) + 2, len(item_columns), dtype=np.int64)
+        item_to_column[column_item_ids] = np.arange(len(item_columns))
+        X_item_ids = np.stack([self._encoder.item_ids_[column_id][X_codes[:, column_id]]
+                               for column_id in range(X_codes.shape[1])], axis=1)
+        item_bitsets = build_bitsets(item_to_column[X_item_ids], len(item_columns) + 1)
+        label_positions = {self._class_dict[class_id]: position for (position, class_id) in enumerate(class_ids)}
+        y_codes = np.array([label_positions[label] for label in y.tolist()], dtype=np.int64)
+        levels = split_levels(rules, item_bitsets, build_bitsets(y_codes.reshape(-1, 1), len(class_ids)))
+
+        return tuple(
+            RuleTable(np.concatenate([[0], np.cumsum([len(r[0]) for r in level_rules], dtype=np.int64)]),
+                      [int(column_item_ids[item]) for r in level_rules for item in r[0]],
+                      [class_ids[r[1]] for r in level_rules],
+                      [r[2] for r in level_rules],
+                      [r[3] for r in level_rules])
+            for level_rules in [[r for (r, l) in zip(rules, levels.tolist()) if l == level] for level in [1, 2]]
+        )
+
+    def _finish_fit(self, token, train_dir, filestem, save_human_readable, remove_files):
         # translate the model to human readable format
         if save_human_readable:
-            write_human_readable(f"{token}_{LEVEL1_FILE_READABLE}", self.lvl1_rules_,
-                                 self._item_id_to_item, self._column_id_to_name, self._class_dict)
-            write_human_readable(f"{token}_{LEVEL2_FILE_READABLE}", self.lvl2_rules_,
-                                 self._item_id_to_item, self._column_id_to_name, self._class_dict)
+            with self._fit_stage("write_human_readable") as stats:
+                write_human_readable(f"{filestem}_{LEVEL1_FILE_READABLE}", self.lvl1_rules_,
+                                     self._item_id_to_item, self._column_id_to_name, self._class_dict)
+                write_human_readable(f"{filestem}_{LEVEL2_FILE_READABLE}", self.lvl2_rules_,
+                                     self._item_id_to_item, self._column_id_to_name, self._class_dict)
+                stats['bytes_written'] = sum(os.path.getsize(f"{filestem}_{name}")
+                                             for name in [LEVEL1_FILE_READABLE, LEVEL2_FILE_READABLE])
 
         if remove_files:
-            _remove_fit_files(token)
+            _remove_fit_files(filestem)
 
-        chdir(old_dir)
         if remove_files and not save_human_readable:
             shutil.rmtree(train_dir)
         self.current_token_ = token # keep track of the latest token generated by the fit method
+        self.train_dir_ = train_dir
+
+    def _mine_rules(self, X_codes, y):
+        """Mine the rule sets in process, without the L3 training binary (see :mod:`l3wrapper.mining`)."""
+        n_categories = [len(column_categories) for column_categories in self._encoder.categories_]
+        offsets = np.concatenate([[0], np.cumsum(n_categories)]).astype(np.int32)
+        labels, y_codes = np.unique(y, return_inverse=True)
+        self._mine_bitsets(build_bitsets(X_codes + offsets[:-1], int(offsets[-1])),
+                           build_bitsets(y_codes.reshape(-1, 1), len(labels)),
+                           labels)
+
+    def _mine_bitsets(self, item_bitsets, class_bitsets, labels):
+        """Mine the rule sets in process from the bitsets of the items and of the classes.
+
+        The items enumerate the categories of the encoder column by column, their ids start from 1.
+        """
+        n_categories = [len(column_categories) for column_categories in self._encoder.categories_]
+        rules = mine_class_rules(item_bitsets,
+                                 np.repeat(np.arange(len(n_categories)), n_categories),
+                                 class_bitsets,
+                                 _as_percent(self.min_sup) * int(popcount(class_bitsets).sum()) / 100,
+                                 _as_percent(self.min_conf),
+                                 self.max_length)
+        self._set_mined_rules(rules, item_bitsets, class_bitsets, labels)
+
+    def _set_mined_rules(self, rules, item_bitsets, class_bitsets, labels):
+        """Sort the mined rules, split them in levels over the bitsets and set them as the mined rule sets."""
+        categories = self._encoder.categories_
+        n_categories = [len(column_categories) for column_categories in categories]
+        offsets = np.concatenate([[0], np.cumsum(n_categories)])
+        item_id_to_item = {
+            int(offsets[column_id]) + code + 1: (column_id, value)
+            for (column_id, column_categories) in enumerate(categories)
+            for (code, value) in enumerate(column_categories.tolist())
+        }
+        item_to_item_id = {item: item_id for (item_id, item) in item_id_to_item.items()}
+        class_dict = {CLASS_ID_START + i: label for (i, label) in enumerate(labels.tolist())}
+
+        rules = sort_rules(rules, self.specialistic_rules)
+        levels = split_levels(rules, item_bitsets, class_bitsets)
+
+        # the pruned rules (level 0) are kept for warm start, they may be used at higher thresholds
+        lvl1_rules, lvl2_rules, pruned_rules = [
+            RuleTable(np.concatenate([[0], np.cumsum([len(r[0]) for r in level_rules], dtype=np.int64)]),
+                      [item + 1 for r in level_rules for item in r[0]],
+                      [CLASS_ID_START + r[1] for r in level_rules],
+                      [r[2] for r in level_rules],
+                      [r[3] for r in level_rules])
+            for level_rules in [[r for (r, l) in zip(rules, levels.tolist()) if l == level] for level in [1, 2, 0]]
+        ]
+        self._set_mined(class_dict, item_id_to_item, item_to_item_id, lvl1_rules, lvl2_rules, pruned_rules)
+
+    def _finish_fit_without_files(self, save_human_readable):
+        """Finish a fit that did not run the L3 training binary."""
+        self.current_token_, self.train_dir_ = None, None
+        if save_human_readable:
+            token, train_dir, filestem = self._make_train_dir()
+            self._finish_fit(token, train_dir, filestem, save_human_readable, remove_files=False)
+
+    def fit(self,
+            X,
+            y,
+            column_names=None,
+            save_human_readable=False,
+            remove_files=True
+            ):
+        """A reference implementation of a fitting function for a classifier.
+
+        Parameters
+        ----------
+        X : array-like, shape (n_samples, n_features)
+            The training input samples. No numerical inputs are allowed it.
+        y : array-like, shape (n_samples,)
+            The target values. An array of int.
+        column_names : list, default=None
+            A list containing the names to assign to columns in the dataset.
+            They will be used when printing the human readable format of the
+            rules.
+        remove_files : bool, default=True
+            Use this parameter to remove all the file generated by the original
+            L3 implementation at training time.
 
+        Returns
+        -------
+        self : object
+            Returns self.
+        """
+        self._check_params()
+        self.fit_stats_ = dict()
+        with self._fit_stage("total") as stats:
+            prepared = self._prepare_fit(X, y, column_names, save_human_readable)
+            if prepared is not None:
+                X_codes, y, cache_key = prepared
+                del prepared
+                if self.train_engine == 'python':
+                    self._mine_stage(X_codes, y)
+                    token = train_dir = filestem = None
+                else:
+                    token, train_dir, filestem = self._make_train_dir()
+                    self._dump_stage(filestem, X_codes, y)
+                    del X_codes
+
+                    with self._fit_stage("train") as train_stats:
+                        train_stats['returncode'] = self._run_training(token, train_dir)
+                        train_stats['stdout_bytes'] = os.path.getsize(f"{filestem}_stdout.txt")
+                    self._load_stage(filestem)
+                self._complete_fit(cache_key, token, train_dir, filestem, save_human_readable, remove_files)
+            stats['n_lvl1_rules'], stats['n_lvl2_rules'] = self.n_lvl1_rules_, self.n_lvl2_rules_
         return self
 
-    def predict(self, X):
+    async def fit_async(self,
+                        X,
+                        y,
+                        column_names=None,
+                        save_human_readable=False,
+                        remove_files=True,
+                        timeout=None,
+                        progress_callback=None
+                        ):
+        """Fit the model without blocking the event loop.
+
+        It runs the same stages as :meth:`fit`. The L3 training binary runs
+        as an asyncio subprocess and the other stages (validation, dump,
+        parsing of the rules) run in the default executor of the event
+        loop. If the fit times out or is cancelled, the training binary is
+        killed, or the stage running in the executor is let finish, and the
+        training directory is removed.
+
+        Parameters
+        ----------
+        X : array-like, shape (n_samples, n_features)
+            The training input samples. No numerical inputs are allowed it.
+        y : array-like, shape (n_samples,)
+            The target values.
+        column_names : list, default=None
+            A list containing the names to assign to columns in the dataset.
+        save_human_readable : bool, default=False
+            See :meth:`fit`.
+        remove_files : bool, default=True
+            See :meth:`fit`.
+        timeout : float, default=None
+            The maximum time (s) the L3 training may take. None means no
+            limit. When exceeded, :class:`asyncio.TimeoutError` is raised.
+        progress_callback : callable, default=None
+            A function called with each line printed by the L3 training
+            binary, as it is printed, to report its progress. The lines are
+            also logged at debug level and saved in the stdout file of the
+            training directory.
+
+        Returns
+        -------
+        self : object
+            Returns self.
+        """
+        self._check_params()
+        self.fit_stats_ = dict()
+        with self._fit_stage("total") as stats:
+            prepared = await _run_in_executor(self._prepare_fit, X, y, column_names, save_human_readable)
+            if prepared is not None:
+                X_codes, y, cache_key = prepared
+                del prepared
+                if self.train_engine == 'python':
+                    await _run_in_executor(self._mine_stage, X_codes, y)
+                    token = train_dir = filestem = None
+                else:
+                    token, train_dir, filestem = self._make_train_dir()
+                    try:
+                        await _run_in_executor(self._dump_stage, filestem, X_codes, y)
+                        del X_codes
+
+                        with self._fit_stage("train") as train_stats:
+                            train_stats['returncode'] = await self._run_training_async(token, train_dir, timeout,
+                                                                                       progress_callback)
+                            train_stats['stdout_bytes'] = os.path.getsize(f"{filestem}_stdout.txt")
+                        await _run_in_executor(self._load_stage, filestem)
+                    except BaseException:
+                        shutil.rmtree(train_dir, ignore_errors=True)
+                        raise
+                await _run_in_executor(self._complete_fit, cache_key, token, train_dir, filestem,
+                                       save_human_readable, remove_files)
+            stats['n_lvl1_rules'], stats['n_lvl2_rules'] = self.n_lvl1_rules_, self.n_lvl2_rules_
+        return self
+
+    def _prepare_fit(self, X, y, column_names, save_human_readable):
+        """Run the stages of fit before the training.
+
+        Returns
+        -------
+        prepared : tuple or None
+            The encoded training data, the labels and the cache key (None if
+            no cache is used), or None if the rules were reused from the
+            previous fit or from the cache and the fit is over.
+        """
+        with self._fit_stage("validate") as stats:
+            X_codes, y = self._validate_data(X, y, column_names)
+            self._set_unlabeled_class(y)
+            for attr in ["_stream_labels", "_stream_item_bitsets", "_stream_class_bitsets", "_stream_n_bytes",
+                         "_stream_itemsets"]:
+                self.__dict__.pop(attr, None)
+            fingerprint = _fingerprint(X_codes, self._encoder.categories_, y)
+            stats['n_samples'], stats['n_features'] = X_codes.shape
+
+        if self.warm_start:
+            with self._fit_stage("warm_start") as stats:
+                hit = stats['hit'] = self._can_warm_start(fingerprint)
+                if hit:
+                    self._logger.debug("Warm start: filter the rules mined by the previous fit.")
+                    self._encoder.set_item_ids(self._item_to_item_id)
+                    self._set_rule_sets(X_codes, y)
+            if hit:
+                if save_human_readable:
+                    token, train_dir, filestem = self._make_train_dir()
+                    self._finish_fit(token, train_dir, filestem, save_human_readable, remove_files=False)
+                return None
+
+        self._fit_fingerprint = fingerprint
+        self._fit_n_samples = X_codes.shape[0]
+
+        cache_key = None
+        if self.cache_dir is not None:
+            with self._fit_stage("cache_lookup") as stats:
+                cache_key = make_key(fingerprint, self._get_mining_params())
+                entry = FitCache(self.cache_dir, self.cache_max_bytes).get(cache_key)
+                hit = stats['hit'] = entry is not None
+                if hit:
+                    self._logger.debug("Cache hit: load the rules mined by a previous fit.")
+                    self._set_mined(**entry)
+            if hit:
+                self._finish_fit_without_files(save_human_readable)
+                return None
+        return X_codes, y, cache_key
+
+    def _mine_stage(self, X_codes, y):
+        with self._fit_stage("mine"):
+            self._mine_rules(X_codes, y)
+
+    def _dump_stage(self, filestem, X_codes, y):
+        with self._fit_stage("dump") as stats:
+            self._dump_training_data(filestem, X_codes, y)
+            stats['bytes_written'] = os.path.getsize(f"{filestem}.data")
+
+    def _load_stage(self, filestem):
+        with self._fit_stage("load_rules") as stats:
+            stats['bytes_read'] = sum(os.path.getsize(f"{filestem}_{name}") for name in [LEVEL1_FILE, LEVEL2_FILE])
+            self._load_rule_sets(filestem)
+
+    def _complete_fit(self, cache_key, token, train_dir, filestem, save_human_readable, remove_files):
+        """Run the stages of fit after the training: store the rules in the cache and finish."""
+        if cache_key is not None:
+            with self._fit_stage("cache_store") as stats:
+                FitCache(self.cache_dir, self.cache_max_bytes).put(cache_key, self._get_cache_entry())
+                stats['key'] = cache_key
+
+        if token is None:
+            self._finish_fit_without_files(save_human_readable)
+        else:
+            self._finish_fit(token, train_dir, filestem, save_human_readable, remove_files)
+
+    def fit_many(self, X, y, param_grid, n_jobs=None, column_names=None):
+        """Fit a model for each configuration of a parameter grid.
+
+        The training data is validated, encoded and dumped only once and
+        shared by all the L3 trainings, which run concurrently. Configurations
+        differing only in parameters not used at training time (e.g.
+        `max_matching`) share a single training. The `fit_stats_` of each
+        model hold the shared 'validate' and 'dump' stages, then the stages
+        of its training.
+
+        Parameters
+        ----------
+        X : array-like, shape (n_samples, n_features)
+            The training input samples. No numerical inputs are allowed it.
+        y : array-like, shape (n_samples,)
+            The target values. An array of int.
+        param_grid : dict or list of dicts
+            The configurations to fit, as accepted by
+            :class:`sklearn.model_selection.ParameterGrid`. Parameters not
+            in the grid are taken from this estimator.
+        n_jobs : int, default=None
+            The maximum number of L3 trainings running at the same time.
+            None means 1, -1 means using all processors.
+        column_names : list, default=None
+            A list containing the names to assign to columns in the dataset.
+
+        Returns
+        -------
+        models : list of (dict, L3Classifier)
+            The configurations of the grid, in :class:`ParameterGrid` order,
+            each with its fitted model.
+        """
+        candidates = list(ParameterGrid(param_grid))
+
+        base = clone(self)
+        base._check_params()
+        base.fit_stats_ = dict()
+        with base._fit_stage("validate") as stats:
+            X_codes, y = base._validate_data(X, y, column_names)
+            base._fit_fingerprint = _fingerprint(X_codes, base._encoder.categories_, y)
+            base._fit_n_samples = X_codes.shape[0]
+            stats['n_samples'], stats['n_features'] = X_codes.shape
+        _, data_dir, data_filestem = base._make_train_dir()
+        base._dump_stage(data_filestem, X_codes, y)
+
+        # group the configurations requiring the same training
+        groups = dict()
+        for (position, params) in enumerate(candidates):
+            all_params = {**base.get_params(), **params}
+            key = tuple(repr(all_params[name]) for name in TRAINING_PARAMS)
+            groups.setdefault(key, list()).append(position)
+
+        def train(params):
+            model = base._with_params(params, y)
+            if model.train_engine == 'python':
+                model._mine_stage(X_codes, y)
+                model._finish_fit_without_files(save_human_readable=False)
+                return model
+
+            token, train_dir, filestem = model._make_train_dir()
+            os.symlink(f"{data_filestem}.data", f"{filestem}.data")
+            with model._fit_stage("train") as stats:
+                stats['returncode'] = model._run_training(token, train_dir)
+                stats['stdout_bytes'] = os.path.getsize(f"{filestem}_stdout.txt")
+            model._load_stage(filestem)
+            model._finish_fit(token, train_dir, filestem, save_human_readable=False, remove_files=True)
+            return model
+
+        try:
+            trained = Parallel(n_jobs=n_jobs, prefer="threads")(
+                delayed(train)(candidates[positions[0]]) for positions in groups.values()
+            )
+        finally:
+            shutil.rmtree(data_dir)
+
+        models = [None] * len(candidates)
+        for (positions, model) in zip(groups.values(), trained):
+            models[positions[0]] = model
+            for position in positions[1:]:
+                # the rule sets are read-only, the models of a group can share them
+                models[position] = model._with_params(candidates[position], y)
+        return [(params, model) for (params, model) in zip(candidates, models)]
+
+    def _with_params(self, params, y):
+        """Return a shallow copy of self, sharing its fitted state, with the given parameters."""
+        model = copy.copy(self)
+        model._encoder = copy.copy(self._encoder)
+        model.fit_stats_ = dict(self.fit_stats_)
+        model.set_params(**params)
+        model._check_params()
+        model._set_unlabeled_class(y)
+        return model
+
+    def partial_fit(self, X, y, classes=None, column_names=None):
+        """Update the model with a batch of training data.
+
+        The training data seen so far is accumulated in vertical form, as the
+        bitsets of the records containing each item and each class, rather
+        than as records. At each call, the bitsets are extended with the
+        batch and the rules are mined in process (as with
+        train_engine='python'), with the support threshold relative to all
+        the records seen so far. Neither the history is encoded and dumped
+        again nor the L3 training binary is run.
+
+        The mining is incremental (see
+        :class:`~l3wrapper.mining.FrequentItemsets`): the class counts of
+        the frequent itemsets are kept between the calls and updated from
+        the batch, and only the itemsets becoming frequent with the batch
+        are counted over the history. The rules are still split in levels
+        over all the records seen so far. The bitsets take one bit per
+        record for each item and each class, and they are never shrunk.
+        They are buffers grown by doubling, so that the history is not
+        copied at each call, except when the batch brings new items.
+
+        A model fitted with :meth:`fit`, or loaded with :meth:`load`, is not
+        updated: the first call to partial_fit starts from scratch.
+
+        Parameters
+        ----------
+        X : array-like, shape (n_samples, n_features)
+            The training input samples. No numerical inputs are allowed it.
+        y : array-like, shape (n_samples,)
+            The target values.
+        classes : array-like, shape (n_classes,), default=None
+            All the classes that can appear in y over the calls. Required at
+            the first call, ignored afterwards.
+        column_names : list, default=None
+            A list containing the names to assign to columns in the dataset.
+            Used at the first call only.
+
+        Returns
+        -------
+        self : object
+            Returns self.
+        """
+        first_call = not hasattr(self, "_stream_item_bitsets")
+        if first_call and classes is None:
+            raise ValueError("The classes must be passed at the first call to partial_fit.")
+
+        self._check_params()
+        X = check_dtype(X)
+        check_classification_targets(y)
+        X, y = check_X_y(X, y, dtype=None)
+
+        if first_call:
+            self._yorig_to_str, self._ystr_to_orig = build_y_mappings(unique_labels(classes))
+            self.classes_ = [label for label in self._ystr_to_orig.keys()]
+            if column_names is None:
+                column_names = _create_column_names(X)
+            check_column_names(X, column_names)
+            self._column_id_to_name = build_columns_dictionary(column_names)
+            self._encoder = CategoricalEncoder()
+            self._stream_labels = np.array(sorted(self._ystr_to_orig))
+            self._stream_item_bitsets = np.zeros((0, 0), dtype=np.uint8)
+            self._stream_class_bitsets = np.zeros((len(self._stream_labels), 0), dtype=np.uint8)
+            self._stream_n_bytes = 0
+            self._stream_itemsets = FrequentItemsets(self.max_length)
+        self.__dict__.pop('X_', None)
+        self.__dict__.pop('y_', None)
+
+        unknown = set(y.tolist()) - set(self._yorig_to_str)
+        if unknown:
+            raise ValueError(f"The labels {sorted(unknown, key=str)} are not in the classes passed "
+                             f"at the first call to partial_fit.")
+        y_codes = np.searchsorted(self._stream_labels, [self._yorig_to_str[label] for label in y])
+
+        n_categories = [len(column_categories) for column_categories in
+                        getattr(self._encoder, "categories_", [[]] * X.shape[1])]
+        old_offsets = np.concatenate([[0], np.cumsum(n_categories)]).astype(np.int64)
+        positions = self._encoder.update(X)
+        n_categories = [len(column_categories) for column_categories in self._encoder.categories_]
+        offsets = np.concatenate([[0], np.cumsum(n_categories)]).astype(np.int64)
+        X_codes = self._encoder.transform(X)
+        batch_item_bitsets = build_bitsets(X_codes + offsets[:-1].astype(np.int32), int(offsets[-1]))
+        batch_class_bitsets = build_bitsets(y_codes.reshape(-1, 1), len(self._stream_labels))
+
+        # the bitsets have room for the next batches: they are reallocated, doubling their
+        # capacity, only if the batch does not fit, or to insert the rows of new items
+        used, n_bytes = self._stream_n_bytes, self._stream_n_bytes + batch_item_bitsets.shape[1]
+        capacity = self._stream_item_bitsets.shape[1]
+        if n_bytes > capacity:
+            capacity = max(n_bytes, 2 * capacity)
+            class_bitsets = np.zeros((len(self._stream_labels), capacity), dtype=np.uint8)
+            class_bitsets[:, :used] = self._stream_class_bitsets[:, :used]
+            self._stream_class_bitsets = class_bitsets
+        if capacity != self._stream_item_bitsets.shape[1] or offsets[-1] != old_offsets[-1]:
+            # move the bitsets of the items seen before to their new positions
+            item_bitsets = np.zeros((offsets[-1], capacity), dtype=np.uint8)
+            for column_id, column_positions in enumerate(positions):
+                item_bitsets[offsets[column_id] + column_positions, :used] = \
+                    self._stream_item_bitsets[old_offsets[column_id]:old_offsets[column_id + 1], :used]
+            self._stream_item_bitsets = item_bitsets
+        if offsets[-1] != old_offsets[-1]:
+            item_map = np.concatenate([offsets[column_id] + column_positions
+                                       for (column_id, column_positions) in enumerate(positions)])
+            self._stream_itemsets.remap_items(item_map.astype(np.int64))
+
+        # append the batch, the padding bits of the previous batches belong to no class
+        self._stream_item_bitsets[:, used:n_bytes] = batch_item_bitsets
+        self._stream_class_bitsets[:, used:n_bytes] = batch_class_bitsets
+        self._stream_n_bytes = n_bytes
+        item_bitsets, class_bitsets = self._stream_item_bitsets[:, :n_bytes], self._stream_class_bitsets[:, :n_bytes]
+
+        class_counts = popcount(class_bitsets)
+        if self.assign_unlabeled == 'majority_class':
+            self.unlabeled_class_ = self._stream_labels[np.argmax(class_counts)]
+        else:
+            self.unlabeled_class_ = self.assign_unlabeled
+
+        self._fit_fingerprint = None
+        self._fit_n_samples = int(class_counts.sum())
+        self.fit_stats_ = dict()
+        # the itemsets kept are complete only up to their length, they are counted again over the history
+        if self._stream_itemsets.max_length != self.max_length:
+            self._stream_itemsets, used = FrequentItemsets(self.max_length), 0
+        with self._fit_stage("mine") as stats:
+            stats.update(self._stream_itemsets.update(
+                item_bitsets[:, used:], np.repeat(np.arange(len(n_categories)), n_categories),
+                class_bitsets[:, used:], item_bitsets[:, :used], class_bitsets[:, :used],
+                _as_percent(self.min_sup) * self._fit_n_samples / 100))
+            rules = self._stream_itemsets.get_rules(_as_percent(self.min_conf))
+        with self._fit_stage("split_levels"):
+            self._set_mined_rules(rules, item_bitsets, class_bitsets, self._stream_labels)
+        self._finish_fit_without_files(save_human_readable=False)
+        return self
+
+    def save(self, path):
+        """Save the fitted model in a compact binary file.
+
+        The rule sets, the encoder and the item dictionary are stored as raw
+        NumPy arrays (see :mod:`l3wrapper.serialization`), the remaining
+        state as a small header. The training data (`X_`, `y_`) and the
+        explanations of the last :meth:`predict` are not saved.
+
+        The `fit_callback` is not saved: it is None in the loaded model.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file to write.
+        """
+        check_is_fitted(self, ['lvl1_rules_', 'lvl2_rules_'])
+
+        arrays = dict()
+        for level, rules in [("lvl1", self.lvl1_rules_), ("lvl2", self.lvl2_rules_)]:
+            for field in RULE_TABLE_FIELDS:
+                arrays[f"{level}_{field}"] = getattr(rules, field)
+        # the rule matrices are saved as well, so that loaded models share them
+        if not hasattr(self, "_lvl2_matrix"):
+            self._build_rule_matrices()
+        for level, (R, _) in [("lvl1", self._lvl1_matrix), ("lvl2", self._lvl2_matrix)]:
+            for field in ["data", "indices", "indptr"]:
+                arrays[f"{level}_matrix_{field}"] = getattr(R, field)
+        if hasattr(self, "_lvl2_rule_ranks"):
+            arrays["lvl1_rule_ranks"], arrays["lvl2_rule_ranks"] = self._lvl1_rule_ranks, self._lvl2_rule_ranks
+        for column_id, (categories, item_ids) in enumerate(zip(self._encoder.categories_,
+                                                               self._encoder.item_ids_)):
+            arrays[f"categories_{column_id}"] = categories
+            arrays[f"item_ids_{column_id}"] = item_ids
+        items = sorted(self._item_id_to_item.items())
+        arrays["items_item_id"] = np.array([item_id for (item_id, _) in items], dtype=np.int64)
+        arrays["items_column_id"] = np.array([item[0] for (_, item) in items], dtype=np.int64)
+        arrays["items_value"] = np.array([item[1] for (_, item) in items], dtype=str)
+
+        meta = {attr: getattr(self, attr) for attr in SAVED_ATTRS if hasattr(self, attr)}
+        # the rule sets are saved as they are: the training parameters are the ones they were fitted with
+        # the callback is often a lambda, it is not saved and is None once loaded
+        meta["params"] = {**self.get_params(), **self._fitted_params, 'fit_callback': None}
+        meta["n_features"] = len(self._encoder.categories_)
+        write_model_file(path, meta, arrays)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a model saved with :meth:`save`.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file to read.
+        mmap : bool, default=True
+            Whether to memory-map the rule sets and the encoder arrays rather
+            than reading them in memory. Loading is then almost immediate and
+            the processes loading the same file share its pages.
+
+        Notes
+        -----
+        The rule matrices used by ``predict(engine='sparse')`` are stored in
+        the file as well. A memory-mapped model predicting with the sparse
+        engine reads the rule sets from the mapped file and keeps no private
+        copy of them, so that worker processes serving the same model add
+        no memory per worker beyond the item dictionaries. The loop engine
+        instead builds its rule indexes in each process.
+
+        Returns
+        -------
+        model : L3Classifier
+            The fitted model.
+        """
+        meta, arrays = read_model_file(path, mmap=mmap)
+        model = cls(**meta.pop("params"))
+        model._check_params()
+        n_features = meta.pop("n_features")
+        model.__dict__.update(meta)
+
+        model._encoder = CategoricalEncoder()
+        model._encoder.categories_ = [arrays[f"categories_{i}"] for i in range(n_features)]
+        model._encoder.item_ids_ = [arrays[f"item_ids_{i}"] for i in range(n_features)]
+        model._item_id_to_item = {
+            item_id: (column_id, value) for (item_id, column_id, value) in
+            zip(arrays["items_item_id"].tolist(), arrays["items_column_id"].tolist(),
+                arrays["items_value"].tolist())
+        }
+        model._item_to_item_id = {item: item_id for (item_id, item) in model._item_id_to_item.items()}
+
+        # the saved rule sets are the ones fitted at the saved parameters, they are not filtered again
+        model._mined_params = model._get_mining_params()
+        model._fitted_params = {name: getattr(model, name) for name in TRAINING_PARAMS}
+        model._mined_lvl1_rules, model._mined_lvl2_rules = [
+            RuleTable(*[arrays[f"{level}_{field}"] for field in RULE_TABLE_FIELDS])
+            for level in ["lvl1", "lvl2"]
+        ]
+        model._mined_pruned_rules = RuleTable([0], [], [], [], [])
+        model.lvl1_rules_, model.lvl2_rules_ = model._mined_lvl1_rules, model._mined_lvl2_rules
+        model.n_lvl1_rules_, model.n_lvl2_rules_ = len(model.lvl1_rules_), len(model.lvl2_rules_)
+        if "lvl2_rule_ranks" in arrays:
+            model._lvl1_rule_ranks, model._lvl2_rule_ranks = arrays["lvl1_rule_ranks"], arrays["lvl2_rule_ranks"]
+
+        model._item_columns = build_item_columns(model._item_id_to_item)
+        model._lvl1_matrix, model._lvl2_matrix = [
+            rule_matrix_from_arrays(*[arrays[f"{level}_matrix_{field}"] for field in ["data", "indices", "indptr"]],
+                                    len(rules), rules.lengths)
+            for (level, rules) in [("lvl1", model.lvl1_rules_), ("lvl2", model.lvl2_rules_)]
+        ]
+        return model
+
+    def compact(self, X=None, prune_unused=False, engine='sparse'):
+        """Shrink the rule sets, removing the rules that do not classify any record.
+
+        The rules removed are:
+        - the unreachable rules (always): a rule is never among the first
+        `max_matching` rules matching a record if at least `max_matching`
+        earlier rules of its level generalize it (i.e. their items are a
+        subset of its items), or, for a level 2 rule, if any level 1 rule
+        generalizes it (see :func:`l3wrapper.matching.find_unreachable_rules`).
+        Removing them leaves the predictions, the probabilities and the
+        scores of any record unchanged, unless `max_matching` is raised
+        afterwards.
+        - the unused rules, if prune_unused=True: the rules matching none of
+        the records of X. This can change the predictions of records unlike
+        the ones of X.
+
+        The rules keep their order but their ids change: the explanations
+        and `prediction_stats_` refer to the compacted rule sets. A later
+        :meth:`fit` mines the full rule sets again.
+
+        Parameters
+        ----------
+        X : array-like, shape (n_samples, n_features), default=None
+            The records classified before and after the compaction to time
+            it and, if prune_unused=True, to find the unused rules.
+        prune_unused : bool, default=False
+            Whether to remove the rules matching none of the records of X.
+        engine : {'loop', 'sparse'}, default='sparse'
+            The engine used to classify X (see :meth:`predict`).
+
+        Returns
+        -------
+        self : object
+            Returns self, with the outcome of the compaction in
+            `compaction_report_`: the number of rules removed by each pass
+            ('n_unreachable' and 'n_unused', by level) and, 'before' and
+            'after' it, the number of rules of each level, the size in bytes
+            of the rule sets and, if X is given, the best time (s) to
+            classify X.
+        """
+        check_is_fitted(self, ['lvl1_rules_', 'lvl2_rules_'])
+        if prune_unused and X is None:
+            raise ValueError("The records X are required to prune the unused rules.")
+
+        report = {'before': self._get_compaction_sizes(X, engine)}
+        max_matching = self._get_max_matching()
+        item_columns = build_item_columns(self._item_id_to_item)
+        lvl1_keep = ~find_unreachable_rules(self.lvl1_rules_, item_columns, max_matching)
+        lvl2_keep = ~find_unreachable_rules(self.lvl2_rules_, item_columns, max_matching,
+                                            shadowing_rules=self.lvl1_rules_)
+        report['n_unreachable'] = {1: int((~lvl1_keep).sum()), 2: int((~lvl2_keep).sum())}
+        self._select_rules(lvl1_keep, lvl2_keep)
+
+        if prune_unused:
+            _, (_, used_levels, indptr, rule_ids) = self._predict_arrays(X, engine, track=False)
+            entry_levels = np.repeat(used_levels, np.diff(indptr))
+            lvl1_keep, lvl2_keep = [
+                np.bincount(rule_ids[entry_levels == level], minlength=n_rules) > 0
+                for (level, n_rules) in [(1, self.n_lvl1_rules_), (2, self.n_lvl2_rules_)]
+            ]
+            report['n_unused'] = {1: int((~lvl1_keep).sum()), 2: int((~lvl2_keep).sum())}
+            self._select_rules(lvl1_keep, lvl2_keep)
+
+        report['after'] = self._get_compaction_sizes(X, engine)
+        self.compaction_report_ = report
+        self._logger.debug(f"Compaction: {report}")
+        return self
+
+    def _select_rules(self, lvl1_mask, lvl2_mask):
+        """Keep the rules selected by the masks, keeping track of their positions before."""
+        lvl1_ranks = getattr(self, "_lvl1_rule_ranks", np.arange(self.n_lvl1_rules_))
+        lvl2_ranks = getattr(self, "_lvl2_rule_ranks", np.arange(self.n_lvl2_rules_))
+        self.lvl1_rules_ = self.lvl1_rules_.select(lvl1_mask)
+        self.lvl2_rules_ = self.lvl2_rules_.select(lvl2_mask)
+        self.n_lvl1_rules_ = len(self.lvl1_rules_)
+        self.n_lvl2_rules_ = len(self.lvl2_rules_)
+        self._reset_compiled()
+        self.__dict__.pop('prediction_stats_', None)
+        self._lvl1_rule_ranks, self._lvl2_rule_ranks = lvl1_ranks[lvl1_mask], lvl2_ranks[lvl2_mask]
+
+    def _get_compaction_sizes(self, X, engine, repeat=3):
+        sizes = {
+            'n_lvl1_rules': self.n_lvl1_rules_,
+            'n_lvl2_rules': self.n_lvl2_rules_,
+            'nbytes': self.lvl1_rules_.nbytes + self.lvl2_rules_.nbytes
+        }
+        if X is not None:
+            self._predict_arrays(X, engine, track=False)     # build the rule indexes or matrices first
+            timings = list()
+            for _ in range(repeat):
+                start = time.perf_counter()
+                self._predict_arrays(X, engine, track=False)
+                timings.append(time.perf_counter() - start)
+            sizes['predict_time'] = min(timings)
+        return sizes
+
+    def predict(self, X, engine='loop', explain='transactions', return_proba=False):
         """Predict the class labels for each sample in X.
 
         Additionally, the method helps to characterize the rules used during
-        the inference. Each record to be predicted is converted into a
-        Transaction and the list of transactions is saved.
-        From the transactions one can retrieve:
-            - which level was used to classify it (level=-1 means that no
-              rule has covered the record)
+        the inference. From the explanation one can retrieve:
+            - which level was used to classify each record (level=-1 means
+              that no rule has covered the record)
             - which Rule (or rules) was used to classify it.
 
         Parameters
         ----------
         X : array-like, shape (n_samples, n_features)
             The input samples.
+        engine : {'loop', 'sparse'}, default='loop'
+            The engine used to match the records against the rule sets.
+            - 'loop' (default): match each record separately, using the
+            rule indexes built at :meth:`fit`.
+            - 'sparse': match the records in batches, encoding both records
+            and rules as sparse matrices (see :mod:`l3wrapper.matching`).
+            Both engines predict the same labels.
+        explain : {'transactions', 'arrays', None}, default='transactions'
+            How to keep track of the rules used during the inference.
+            - 'transactions' (default): each record is converted into a
+            Transaction and the list of transactions is saved in
+            `labeled_transactions_`.
+            - 'arrays': the same information is saved in the compact
+            `used_levels_`, `matched_rules_indptr_` and `matched_rule_ids_`
+            arrays.
+            - None: nothing is saved.
+        return_proba : bool, default=False
+            Whether to return the class probabilities as well (see
+            :meth:`predict_proba`). They are computed from the same matching
+            pass, at a small additional cost.
 
         Returns
         -------
         y : ndarray, shape (n_samples,)
             The label for each sample.
+        proba : ndarray, shape (n_samples, n_classes)
+            The class probabilities. Only if return_proba=True.
+        """
+        valid_explains = ['transactions', 'arrays', None]
+        if explain not in valid_explains:
+            raise ValueError(f"The explain mode specified is not supported. Use one of {valid_explains}.")
+
+        X, (y_pred, used_levels, indptr, rule_ids) = self._predict_arrays(X, engine)
+        self._save_explanation(X, explain, used_levels, indptr, rule_ids)
+
+        y_pred = np.array([self._ystr_to_orig[label] for label in y_pred])
+        if return_proba:
+            return y_pred, self._score_matches(used_levels, indptr, rule_ids)
+        return y_pred
+
+    def predict_proba(self, X, engine='loop'):
+        """Predict the class probabilities for each sample in X.
+
+        The probabilities are derived from the votes of the rules used by
+        :meth:`predict` (see :meth:`decision_function`), normalized and
+        tempered by the average confidence of the rules, so that the most
+        probable class is the predicted one. A sample matched by no rule gets
+        probability 1 for the unlabeled class.
+
+        Parameters
+        ----------
+        X : array-like, shape (n_samples, n_features)
+            The input samples.
+        engine : {'loop', 'sparse'}, default='loop'
+            The engine used to match the records against the rule sets (see
+            :meth:`predict`).
+
+        Returns
+        -------
+        proba : ndarray, shape (n_samples, n_classes)
+            The class probabilities, with the classes in the order of
+            `classes_`.
+        """
+        _, (_, used_levels, indptr, rule_ids) = self._predict_arrays(X, engine)
+        return self._score_matches(used_levels, indptr, rule_ids)
+
+    def decision_function(self, X, engine='loop'):
+        """Compute the decision scores of the classes for each sample in X.
+
+        The score of a class is the (weighted, see `match_strategy`) number
+        of votes it gets from the rules used by :meth:`predict`.
+
+        Parameters
+        ----------
+        X : array-like, shape (n_samples, n_features)
+            The input samples.
+        engine : {'loop', 'sparse'}, default='loop'
+            The engine used to match the records against the rule sets (see
+            :meth:`predict`).
+
+        Returns
+        -------
+        scores : ndarray, shape (n_samples, n_classes) or (n_samples,)
+            The scores of the classes, in the order of `classes_`. With two
+            classes, as in scikit-learn, the score of the second class minus
+            the score of the first one.
+        """
+        _, (_, used_levels, indptr, rule_ids) = self._predict_arrays(X, engine)
+        _, votes = self._vote(used_levels, indptr, rule_ids)
+        if votes.shape[1] == 2:
+            return votes[:, 1] - votes[:, 0]
+        return votes
+
+    def _predict_arrays(self, X, engine, track=True):
+        """Validate X and match it against the rule sets (see :meth:`_predict_batch`).
+
+        The counters of `prediction_stats_` are updated if track_predictions=True, unless track=False.
         """
         # Check is fit had been called
-        check_is_fitted(self, ['X_', 'y_'])
+        check_is_fitted(self, ['lvl1_rules_', 'lvl2_rules_'])
+
+        valid_engines = ['loop', 'sparse']
+        if engine not in valid_engines:
+            raise ValueError(f"The engine specified is not supported. Use one of {valid_engines}.")
+
+        get_match_strategy(self.match_strategy)
 
         # Input validation
-        X = check_array(X, dtype=np.unicode_)
+        X = check_array(X, dtype=None)
+        item_ids = self._encoder.transform_items(X)
+
+        n_jobs = min(effective_n_jobs(self.n_jobs), X.shape[0])
+        if n_jobs > 1:
+            *result, latencies = self._predict_parallel(item_ids, engine, n_jobs)
+        else:
+            *result, latencies = self._predict_batch(item_ids, engine)
+
+        if self.track_predictions and track:
+            if not hasattr(self, "prediction_stats_"):
+                self.prediction_stats_ = PredictionStats(self.n_lvl1_rules_, self.n_lvl2_rules_)
+            self.prediction_stats_.update(*result[1:], latencies)
+        return X, tuple(result)
+
+    def predict_iter(self, chunks, engine='loop'):
+        """Predict the class labels of a stream of blocks of samples.
+
+        Each block is validated and classified on its own, hence the memory
+        used does not depend on the number of blocks. No explanation of the
+        inference is kept (see the `explain` parameter of :meth:`predict`).
+
+        Parameters
+        ----------
+        chunks : iterable of array-like, shape (n_samples_chunk, n_features)
+            The blocks of input samples.
+        engine : {'loop', 'sparse'}, default='loop'
+            The engine used to match the records against the rule sets (see
+            :meth:`predict`).
+
+        Yields
+        ------
+        y : ndarray, shape (n_samples_chunk,)
+            The label for each sample of a block.
+        """
+        for X in chunks:
+            yield self.predict(X, engine=engine, explain=None)
+
+    def predict_file(self, path, chunksize=10000, delimiter=',', usecols=None, engine='loop'):
+        """Predict the class labels of the samples stored in a csv file.
+
+        The file is read and classified in blocks of `chunksize` rows (see
+        :meth:`predict_iter`), without loading it entirely in memory.
+
+        Parameters
+        ----------
+        path : str
+            The path of the csv file, with one sample per row and no header.
+        chunksize : int, default=10000
+            The number of rows classified at once.
+        delimiter : str, default=','
+            The field delimiter used in the file.
+        usecols : list, default=None
+            The indexes of the columns to use as features, e.g. to skip a
+            target column. If None, all the columns are used.
+        engine : {'loop', 'sparse'}, default='loop'
+            The engine used to match the records against the rule sets (see
+            :meth:`predict`).
 
-        self.labeled_transactions_ = list()
-        y_pred = list()
+        Yields
+        ------
+        y : ndarray, shape (n_samples_chunk,)
+            The label for each sample of a block.
+        """
+        return self.predict_iter(_read_csv_chunks(path, chunksize, delimiter, usecols), engine=engine)
+
+    def _save_explanation(self, X, explain, used_levels, indptr, rule_ids):
+        # Discard the explanation of any previous prediction
+        for attr in ['labeled_transactions_', 'used_levels_', 'matched_rules_indptr_', 'matched_rule_ids_']:
+            self.__dict__.pop(attr, None)
+
+        if explain == 'arrays':
+            self.used_levels_ = used_levels
+            self.matched_rules_indptr_ = indptr
+            self.matched_rule_ids_ = rule_ids
+        elif explain == 'transactions':
+            rule_sets = {1: self.lvl1_rules_, 2: self.lvl2_rules_}
+            indptr, rule_ids = indptr.tolist(), rule_ids.tolist()
+            self.labeled_transactions_ = list()
+            for i, (X_row, used_level) in enumerate(zip(X, used_levels.tolist())):
+                tr = Transaction(X_row.astype(str), self._item_to_item_id)
+                if used_level != -1:
+                    rules = rule_sets[used_level]
+                    tr.used_level = used_level
+                    tr.matched_rules = [rules[r] for r in rule_ids[indptr[i]:indptr[i + 1]]]
+                self.labeled_transactions_.append(tr)    # keep track of labeled transaction
+
+    def _predict_batch(self, item_ids, engine):
+        """Match a batch of records, given as item ids, against the rule sets and label them.
+
+        Returns
+        -------
+        y_pred, used_levels, indptr, rule_ids, latencies : (list, ndarray, ndarray, ndarray, ndarray)
+            The labels (as L3 strings), the level used to classify each
+            record (-1 if no rule matched), in CSR-like form, the ids of the
+            rules matching each record: the ones of the i-th record are
+            `rule_ids[indptr[i]:indptr[i + 1]]`, and the matching time of
+            each record (None unless track_predictions=True).
+        """
+        used_levels, indptr, rule_ids, latencies = self._match(item_ids, engine, self._get_max_matching(),
+                                                               self.track_predictions)
+        return self._label(used_levels, indptr, rule_ids), used_levels, indptr, rule_ids, latencies
+
+    def _label(self, used_levels, indptr, rule_ids):
+        """Label a batch of matched records with the classes voted, as L3 strings."""
+        winners, _ = self._vote(used_levels, indptr, rule_ids)
+        labels = np.array(list(self._ystr_to_orig) + [self.unlabeled_class_], dtype=object)
+        return labels[winners].tolist()     # winner -1 picks the unlabeled class
+
+    def _get_max_matching(self):
+        return get_match_strategy(self.match_strategy).get_max_matching(self.max_matching)
+
+    def _gather_matching(self, field, used_levels, indptr, rule_ids):
+        """Gather a field (e.g. 'class_ids') of the matching rules, of both levels, in entry order."""
+        # only the matching rules are accessed, the rule sets may be large
+        entry_levels = np.repeat(used_levels, np.diff(indptr))
+        values = np.empty(rule_ids.shape[0], dtype=getattr(self.lvl1_rules_, field).dtype)
+        for level, rules in [(1, self.lvl1_rules_), (2, self.lvl2_rules_)]:
+            level_entries = entry_levels == level
+            values[level_entries] = getattr(rules, field)[rule_ids[level_entries]]
+        return values
+
+    def _class_positions(self, class_ids):
+        """Map L3 class ids to the positions of the classes in `classes_`."""
+        label_positions = {label: position for (position, label) in enumerate(self._ystr_to_orig)}
+        sorted_ids = np.array(sorted(self._class_dict), dtype=np.int64)
+        positions = np.array([label_positions[self._class_dict[i]] for i in sorted_ids.tolist()], dtype=np.int64)
+        return positions[np.searchsorted(sorted_ids, class_ids)]
 
-        # TODO evaluate parallelization here
-        for X_row in X:
-            tr = Transaction(X_row, self._item_to_item_id)
+    def _vote(self, used_levels, indptr, rule_ids):
+        """Vote the class of each record of a batch, as set by `match_strategy` (see :mod:`l3wrapper.voting`).
 
-            # match against level 1
-            matching_rules = _get_matching_rules(tr, self.lvl1_rules_, self.max_matching)
+        Returns
+        -------
+        winners, scores : (ndarray, ndarray)
+            The position in `classes_` of the winning class of each record
+            (-1 if no rule matched it) and the scores of the classes.
+        """
+        strategy = get_match_strategy(self.match_strategy)
+        rule_classes = self._class_positions(self._gather_matching("class_ids", used_levels, indptr, rule_ids))
+        weights = None
+        if strategy.weight is not None:
+            weights = self._gather_matching(strategy.weight, used_levels, indptr, rule_ids).astype(np.float64)
+        if hasattr(self, "_lvl2_rule_ranks"):
+            # ties are broken by the positions of the rules before compaction
+            entry_levels = np.repeat(used_levels, np.diff(indptr))
+            rule_ids = rule_ids.copy()
+            for level, ranks in [(1, self._lvl1_rule_ranks), (2, self._lvl2_rule_ranks)]:
+                level_entries = entry_levels == level
+                rule_ids[level_entries] = ranks[rule_ids[level_entries]]
+        return vote(indptr, rule_ids, rule_classes, len(self.classes_), weights)
+
+    def _score_matches(self, used_levels, indptr, rule_ids):
+        """Compute the class probabilities of a batch of matched records in a single vectorized pass.
+
+        Returns
+        -------
+        proba : ndarray, shape (n_samples, n_classes)
+            The class probabilities. The votes of the matching rules (weighted
+            as set by `match_strategy`) are normalized and tempered by the
+            average confidence c of the rules: a class getting a fraction v of
+            the votes gets probability c * v + (1 - c) / n_classes. The classes
+            tied in votes with the winner of :meth:`_vote` give it a tiny part
+            of their probability, so that the most probable class is always
+            the predicted one. Records matched by no rule get the unlabeled
+            class, or uniform probabilities if it is not one of `classes_`.
+        """
+        n_samples, n_classes = used_levels.shape[0], len(self.classes_)
+        n_matching = np.diff(indptr)
+        matched = n_matching > 0
+        winners, scores = self._vote(used_levels, indptr, rule_ids)
+        scores = scores.astype(np.float64)
+
+        totals = scores.sum(axis=1)
+        voted = totals > 0
+        shares = np.full((n_samples, n_classes), 1 / n_classes)
+        shares[voted] = scores[voted] / totals[voted, None]
+        confidences = np.bincount(np.repeat(np.arange(n_samples), n_matching),
+                                  weights=self._gather_matching("confidences", used_levels, indptr, rule_ids) / 100,
+                                  minlength=n_samples)
+        confidences[matched] /= n_matching[matched]
+        proba = confidences[:, None] * shares + (1 - confidences[:, None]) / n_classes
 
-            # if level 1 was not used, match against level 2
-            if not matching_rules:
-                matching_rules = _get_matching_rules(tr, self.lvl2_rules_, self.max_matching)
-                if matching_rules:
-                    tr.used_level = 2
-            else:
-                tr.used_level = 1
+        # break the ties in votes as the vote does
+        rows = np.flatnonzero(matched)
+        row_winners = winners[rows]
+        tied = scores[rows] == scores[rows, row_winners][:, None]
+        tied[np.arange(rows.shape[0]), row_winners] = False
+        margins = PROBA_TIE_MARGIN * proba[rows, row_winners]
+        proba[rows] -= tied * margins[:, None]
+        proba[rows, row_winners] += tied.sum(axis=1) * margins
 
-            if not matching_rules:
-                y_pred.append(self.unlabeled_class_)
-            else:
-                y_pred.append(self._get_class_label(matching_rules))
-                tr.matched_rules = matching_rules
+        label_positions = {label: position for (position, label) in enumerate(self._ystr_to_orig)}
+        if self.unlabeled_class_ in label_positions:
+            proba[~matched] = 0
+            proba[~matched, label_positions[self.unlabeled_class_]] = 1
+        else:
+            proba[~matched] = 1 / n_classes
+        return proba
+
+    def _predict_parallel(self, item_ids, engine, n_jobs):
+        """Match the records in joblib workers, then label them (see :meth:`_predict_batch`).
 
-            self.labeled_transactions_.append(tr)        # keep track of labeled transaction
+        The workers are not sent the estimator, only the rule sets: they are
+        dumped once to a file, which the workers memory map and keep compiled
+        across calls.
+        """
+        if not hasattr(self, "_matcher_file"):
+            self._matcher_file = _MatcherFile(_RuleMatcher(self.lvl1_rules_, self.lvl2_rules_,
+                                                           self._item_id_to_item))
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(_match_chunk)(self._matcher_file.path, chunk, engine, self._get_max_matching(),
+                                  self.track_predictions)
+            for chunk in np.array_split(item_ids, n_jobs)
+        )
 
-        y_pred = [self._ystr_to_orig[label] for label in y_pred]
-        return np.array(y_pred)
+        used_levels = np.concatenate([chunk_levels for chunk_levels, _, _, _ in results])
+        n_matching = np.concatenate([np.diff(chunk_indptr) for _, chunk_indptr, _, _ in results])
+        indptr = np.concatenate([[0], np.cumsum(n_matching)])
+        rule_ids = np.concatenate([chunk_rule_ids for _, _, chunk_rule_ids, _ in results])
+        latencies = None
+        if self.track_predictions:
+            latencies = np.concatenate([chunk_latencies for _, _, _, chunk_latencies in results])
+        return self._label(used_levels, indptr, rule_ids), used_levels, indptr, rule_ids, latencies
@@ -0,0 +1,297 @@
+"""
+This module provides the batch (vectorized) rule matching used by the estimator.
+
+Transactions and rules are encoded as binary sparse matrices over the same set
+of items. A rule covers a transaction if all its items occur in it, i.e. if the
+dot product between the transaction row and the rule column equals the rule
+length.
+"""
+
+import itertools
+import numpy as np
+import scipy.sparse as sp
+
+
+def build_item_columns(item_id_to_item: dict) -> dict:
+    """Assign a column index, in ascending item id order, to every item id."""
+    return {item_id: col for (col, item_id) in enumerate(sorted(item_id_to_item))}
+
+
+def encode_transactions(item_ids, item_columns: dict):
+    """Encode a set of records as a binary transaction x item sparse matrix.
+
+    Items without a column (e.g. the unknown item) are dropped.
+
+    Parameters
+    ----------
+    item_ids : ndarray, shape (n_samples, n_features)
+        The item id of each value of the records (see
+        :meth:`CategoricalEncoder.transform_items`).
+    item_columns : dict
+        The mapping item_id -> column index (see :func:`build_item_columns`).
+
+    Returns
+    -------
+    T : scipy.sparse.csr_matrix, shape (n_samples, n_items)
+        The encoded transactions.
+    """
+    n_samples = item_ids.shape[0]
+    unique_ids, inverse = np.unique(item_ids, return_inverse=True)
+    unique_cols = np.array([item_columns.get(i, -1) for i in unique_ids.tolist()], dtype=np.int64)
+    cols = unique_cols[inverse.reshape(-1)].reshape(item_ids.shape)
+
+    known = cols >= 0
+    indptr = np.concatenate([[0], np.cumsum(known.sum(axis=1))])
+    indices = cols[known]
+    data = np.ones(indices.shape[0], dtype=np.int32)
+    return sp.csr_matrix((data, indices, indptr), shape=(n_samples, len(item_columns)))
+
+
+def build_rule_matrix(rules, item_columns: dict):
+    """Encode a rule set as a binary item x rule sparse matrix.
+
+    The matrix is stored by rows, i.e. as the lists of the rules containing
+    each item, in the same format as the transactions: multiplying them needs
+    no conversion. Its arrays are int32, as the ones of the transactions, so
+    that they are used as they are (e.g. when memory-mapped).
+
+    Parameters
+    ----------
+    rules : RuleTable
+        The rule set to encode.
+    item_columns : dict
+        The mapping item_id -> row index (see :func:`build_item_columns`).
+
+    Returns
+    -------
+    R, rule_lengths : (scipy.sparse.csr_matrix, ndarray)
+        The encoded rule set, with one column per rule, and the number of
+        items of each rule.
+    """
+    rule_lengths = rules.lengths.astype(np.int32, copy=False)
+    unique_ids, inverse = np.unique(rules.item_ids, return_inverse=True)
+    unique_rows = np.array([item_columns[i] for i in unique_ids.tolist()], dtype=np.int32)
+    indices = unique_rows[inverse.reshape(-1)]
+    data = np.ones(indices.shape[0], dtype=np.int32)
+    R = sp.csc_matrix((data, indices, rules.item_indptr.astype(np.int32)),
+                      shape=(len(item_columns), len(rules))).tocsr()
+    R.indptr, R.indices = R.indptr.astype(np.int32, copy=False), R.indices.astype(np.int32, copy=False)
+    return R, rule_lengths
+
+
+def rule_matrix_from_arrays(data, indices, indptr, n_rules, rule_lengths):
+    """Rebuild, without copying its arrays, a rule matrix built by :func:`build_rule_matrix`."""
+    # the arrays may come from a file: check them, an inconsistent matrix crashes the product
+    if len(indptr) == 0 or indptr[-1] != len(indices) or len(rule_lengths) != n_rules \
+            or (len(indices) > 0 and (indices.min() < 0 or indices.max() >= n_rules)):
+        raise ValueError(f"The rule matrix arrays do not match a set of {n_rules} rules.")
+    R = sp.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, n_rules))
+    return R, rule_lengths
+
+
+def get_matching_rules(T, R, rule_lengths, max_matching):
+    """Get, for every transaction, the first `max_matching` rules covering it.
+
+    Parameters
+    ----------
+    T : scipy.sparse.csr_matrix, shape (n_samples, n_items)
+        The encoded transactions (see :func:`encode_transactions`).
+    R : scipy.sparse matrix, shape (n_items, n_rules)
+        The encoded rule set (see :func:`build_rule_matrix`).
+    rule_lengths : ndarray, shape (n_rules,)
+        The number of items of each rule.
+    max_matching : int
+        The maximum number of rules to retain for each transaction.
+
+    Returns
+    -------
+    indptr, positions : (ndarray, ndarray)
+        The positions (in rule_id order) of the rules matching the i-th
+        transaction are `positions[indptr[i]:indptr[i + 1]]`.
+    """
+    if max_matching < 1:
+        raise ValueError("'max_matching' must be at least 1")
+
+    n_samples = T.shape[0]
+    if R.shape[1] == 0 or n_samples == 0:
+        return np.zeros(n_samples + 1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    M = (T @ R).tocsr()
+    M.data = (M.data == rule_lengths[M.indices]).astype(np.int8)
+    M.eliminate_zeros()
+    M.sort_indices()
+
+    n_matching = np.minimum(np.diff(M.indptr), max_matching)
+    indptr = np.concatenate([[0], np.cumsum(n_matching)])
+    offsets = np.arange(indptr[-1]) - np.repeat(indptr[:-1], n_matching)
+    positions = M.indices[np.repeat(M.indptr[:-1], n_matching) + offsets]
+    return indptr.astype(np.int64), positions.astype(np.int64)
+
+
+def _row_keys(rows):
+    """View each row of a 2d array as a single (bytes) value, to sort and search whole rows."""
+    rows = np.ascontiguousarray(rows)
+    return rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).ravel()
+
+
+def _count_subset_rules(T, G, limits, rules):
+    """Count, for some rules of T, the rules of G before their limit whose items are one of their subsets.
+
+    The subsets of each rule are enumerated and looked up among the item sets
+    of G: the cost grows with the number of subsets, not with the size of G.
+    """
+    G_lengths = np.diff(G.indptr)
+    width = int(G_lengths.max())
+    G_rows = np.repeat(np.arange(G.shape[0], dtype=np.int64), G_lengths)
+    G_items = np.full((G.shape[0], width), -1, dtype=np.int64)
+    G_items[G_rows, np.arange(G.nnz) - G.indptr[G_rows]] = G.indices
+    item_sets, group_of_rule = np.unique(_row_keys(G_items), return_inverse=True)
+    # the ids of the rules of each item set, sorted
+    group_keys = np.sort(group_of_rule.reshape(-1).astype(np.int64) * G.shape[0] + np.arange(G.shape[0]))
+
+    counts = np.zeros(rules.shape[0], dtype=np.int64)
+    T_lengths = np.diff(T.indptr)[rules]
+    for length in np.unique(T_lengths).tolist():
+        positions = np.flatnonzero(T_lengths == length)
+        items = T.indices[T.indptr[rules[positions]][:, None] + np.arange(length)].astype(np.int64)
+        group_limits = limits[rules[positions]]
+        for size in range(1, min(length, width) + 1):
+            for columns in itertools.combinations(range(length), size):
+                subsets = np.full((positions.shape[0], width), -1, dtype=np.int64)
+                subsets[:, :size] = items[:, columns]
+                keys = _row_keys(subsets)
+                groups = np.minimum(np.searchsorted(item_sets, keys), item_sets.shape[0] - 1)
+                found = item_sets[groups] == keys
+                groups = groups.astype(np.int64) * G.shape[0]
+                n_before = np.searchsorted(group_keys, groups + group_limits) - np.searchsorted(group_keys, groups)
+                counts[positions] += np.where(found, n_before, 0)
+    return counts
+
+
+def _count_generalizations(T, G, limits, max_candidates: int):
+    """Count, for each rule of T, the rules of G before a limit whose items are a subset of its items.
+
+    The candidate generalizations are taken from the posting lists of the
+    rules of G: as in :func:`l3wrapper.dictionary.build_rule_index`, each rule
+    is posted under its item shared by the fewest rules, hence a rule of G
+    generalizing a rule of T is posted under one of the items of the latter.
+    The candidates are checked `max_candidates` at most at once. The rules
+    with fewer subsets than candidates enumerate their subsets instead (see
+    :func:`_count_subset_rules`).
+
+    Parameters
+    ----------
+    T, G : scipy.sparse.csr_matrix, shape (n_rules, n_items) and (n_rules_G, n_items)
+        The rule sets, with one row per rule, with sorted indices.
+    limits : ndarray, shape (n_rules,)
+        For each rule of T, the rules of G are counted only if their id is
+        below its limit.
+    max_candidates : int
+        The maximum number of (rule, candidate) pairs checked at once, to
+        bound the memory used.
+
+    Returns
+    -------
+    counts : ndarray of int64, shape (n_rules,)
+        The number of generalizations of each rule.
+    """
+    n_items = T.shape[1]
+    G_lengths = np.diff(G.indptr)
+    # the rules without items generalize any rule
+    counts = np.searchsorted(np.flatnonzero(G_lengths == 0), limits).astype(np.int64)
+    if T.nnz == 0 or G.nnz == 0:
+        return counts
+
+    # post each rule of G under its rarest item, the posting lists sorted by rule id
+    G_rows = np.repeat(np.arange(G.shape[0], dtype=np.int64), G_lengths)
+    order = np.lexsort((G.indices, np.bincount(G.indices, minlength=n_items)[G.indices], G_rows))
+    posted = order[G.indptr[:-1][G_lengths > 0]]
+    post_keys = G.indices[posted].astype(np.int64) * G.shape[0] + G_rows[posted]
+    post_keys.sort()
+    post_rules = post_keys % G.shape[0]
+
+    # the candidates of each item of each rule of T are a range of the posting lists
+    T_lengths = np.diff(T.indptr)
+    T_rows = np.repeat(np.arange(T.shape[0], dtype=np.int64), T_lengths)
+    item_keys = T.indices.astype(np.int64) * G.shape[0]
+    starts = np.searchsorted(post_keys, item_keys)
+    n_candidates = np.searchsorted(post_keys, item_keys + limits[T_rows]) - starts
+
+    by_subsets = 2.0 ** T_lengths - 1 < np.bincount(T_rows, weights=n_candidates, minlength=T.shape[0])
+    subset_rules = np.flatnonzero(by_subsets)
+    if subset_rules.shape[0] > 0:
+        counts[subset_rules] += _count_subset_rules(T, G, limits, subset_rules)
+        n_candidates[by_subsets[T_rows]] = 0
+
+    # batches of rules of T, with at most max_candidates candidates (unless a single rule has more)
+    T_keys = T_rows * n_items + T.indices
+    rule_candidates = np.cumsum(np.bincount(T_rows, weights=n_candidates, minlength=T.shape[0]))
+    start_rule = 0
+    while start_rule < T.shape[0]:
+        done = rule_candidates[start_rule - 1] if start_rule > 0 else 0
+        stop_rule = max(int(np.searchsorted(rule_candidates, done + max_candidates, side="right")),
+                        start_rule + 1)
+        entries = np.arange(T.indptr[start_rule], T.indptr[stop_rule])
+        entry_candidates = n_candidates[entries]
+        pair_entries = np.repeat(entries, entry_candidates)
+        pair_offsets = np.arange(pair_entries.shape[0]) - np.repeat(np.cumsum(entry_candidates) - entry_candidates,
+                                                                    entry_candidates)
+        pair_rules = T_rows[pair_entries]
+        pair_candidates = post_rules[starts[pair_entries] + pair_offsets]
+
+        # a candidate generalizes the rule if all its items are items of the rule
+        candidate_lengths = G_lengths[pair_candidates]
+        item_pairs = np.repeat(np.arange(pair_rules.shape[0]), candidate_lengths)
+        item_offsets = np.arange(item_pairs.shape[0]) - np.repeat(np.cumsum(candidate_lengths) - candidate_lengths,
+                                                                  candidate_lengths)
+        query_keys = pair_rules[item_pairs] * n_items + G.indices[G.indptr[pair_candidates][item_pairs] + item_offsets]
+        found = T_keys[np.minimum(np.searchsorted(T_keys, query_keys), T_keys.shape[0] - 1)] == query_keys
+        n_found = np.bincount(item_pairs, weights=found, minlength=pair_rules.shape[0])
+        counts += np.bincount(pair_rules[n_found == candidate_lengths], minlength=T.shape[0])
+        start_rule = stop_rule
+    return counts
+
+
+def find_unreachable_rules(rules, item_columns: dict, max_matching: int, shadowing_rules=None,
+                           max_candidates: int = 2 ** 20):
+    """Find the rules never among the first `max_matching` rules covering a record.
+
+    A rule generalizes another one if its items are a subset of the items
+    of the other one: every record covered by the latter is covered by the
+    former too. A rule is unreachable if at least `max_matching` rules
+    before it generalize it, or if any of the `shadowing_rules`, matched
+    first, generalizes it (e.g. the level 1 rules for the level 2 ones).
+
+    Each rule is only checked against its subsets, or against the rules
+    sharing with it the item of their posting list (see
+    :func:`l3wrapper.dictionary.build_rule_index`), whichever are fewer, so
+    that the work does not grow with the square of the number of rules.
+
+    Parameters
+    ----------
+    rules : RuleTable
+        The rule set, in rule_id order.
+    item_columns : dict
+        The mapping item_id -> column index (see :func:`build_item_columns`).
+    max_matching : int
+        The number of matching rules used to label a record.
+    shadowing_rules : RuleTable, default=None
+        The rule set matched before `rules`, if any.
+    max_candidates : int, default=2**20
+        The number of candidate generalizations checked at once, to bound
+        the memory used.
+
+    Returns
+    -------
+    unreachable : ndarray of bool, shape (n_rules,)
+        Whether each rule is unreachable.
+    """
+    # the rules as rows of their items
+    T = build_rule_matrix(rules, item_columns)[0].T.tocsr()
+    T.sort_indices()
+    unreachable = _count_generalizations(T, T, np.arange(len(rules)), max_candidates) >= max_matching
+    if shadowing_rules is not None:
+        S = build_rule_matrix(shadowing_rules, item_columns)[0].T.tocsr()
+        S.sort_indices()
+        unreachable |= _count_generalizations(T, S, np.full(len(rules), len(shadowing_rules)), max_candidates) > 0
+    return unreachable
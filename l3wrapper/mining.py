@@ -0,0 +1,267 @@
+"""
+This module provides the in-process rule miner, an alternative to the L3
+training binary (see the `train_engine` parameter of :class:`L3Classifier`).
+
+Class association rules are mined depth-first over the vertical layout of the
+data: each item is represented by the bitset of the records it occurs in, and
+the support of an itemset (for each class) is the popcount of the AND of the
+bitsets of its items. The rules are then sorted and split in two levels by the
+lazy pruning of L3 (see :func:`split_levels`).
+"""
+
+import numpy as np
+
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+# the id of the first class, as assigned by the L3 training binary
+CLASS_ID_START = 2147483548
+
+
+def popcount(bits):
+    """Count the set bits of each bitset (along the last axis)."""
+    return _POPCOUNT[bits].sum(axis=-1, dtype=np.int64)
+
+
+def build_bitsets(item_indexes, n_items: int):
+    """Build the bitset of the records containing each item.
+
+    Parameters
+    ----------
+    item_indexes : ndarray, shape (n_samples, n_features)
+        The index of the item of each value of the records, in [0, n_items).
+    n_items : int
+        The number of items.
+
+    Returns
+    -------
+    bitsets : ndarray of uint8, shape (n_items, ceil(n_samples / 8))
+        The packed bitsets, one per row.
+    """
+    n_samples = item_indexes.shape[0]
+    occurs = np.zeros((n_items, n_samples), dtype=bool)
+    occurs[item_indexes, np.arange(n_samples)[:, None]] = True
+    return np.packbits(occurs, axis=1)
+
+
+def mine_class_rules(item_bitsets, item_features, class_bitsets, min_count: float,
+                     min_conf: float, max_length: int = 0):
+    """Mine all the class association rules above the thresholds.
+
+    Itemsets hold at most one item per column, as items of the same column
+    never occur together.
+
+    Parameters
+    ----------
+    item_bitsets : ndarray of uint8, shape (n_items, n_bytes)
+        The bitsets of the items (see :func:`build_bitsets`).
+    item_features : ndarray, shape (n_items,)
+        The column of each item. Items must be sorted by column.
+    class_bitsets : ndarray of uint8, shape (n_classes, n_bytes)
+        The bitsets of the classes.
+    min_count : float
+        The minimum support count of a rule (at least 1).
+    min_conf : float
+        The minimum confidence (%) of a rule.
+    max_length : int, default=0
+        The maximum number of items of a rule (0 means no limit).
+
+    Returns
+    -------
+    rules : list of tuple
+        The rules as (item indexes, class index, support count, confidence).
+    """
+    min_count = max(min_count, 1)
+    rules = list()
+
+    def extend(prefix, prefix_bitset, candidates):
+        bitsets = item_bitsets[candidates] if prefix_bitset is None else item_bitsets[candidates] & prefix_bitset
+        counts = popcount(bitsets)
+        class_counts = np.stack([popcount(bitsets & class_bitset) for class_bitset in class_bitsets], axis=1)
+
+        # only the itemsets frequent with some class can be extended into rules
+        frequent = class_counts.max(axis=1) >= min_count
+        candidates, bitsets = candidates[frequent], bitsets[frequent]
+        counts, class_counts = counts[frequent], class_counts[frequent]
+
+        for position, item in enumerate(candidates.tolist()):
+            itemset = prefix + (item,)
+            for class_index, class_count in enumerate(class_counts[position].tolist()):
+                confidence = 100 * class_count / counts[position]
+                if class_count >= min_count and confidence >= min_conf:
+                    rules.append((itemset, class_index, class_count, confidence))
+
+            if max_length == 0 or len(itemset) < max_length:
+                next_candidates = candidates[position + 1:]
+                next_candidates = next_candidates[item_features[next_candidates] > item_features[item]]
+                if len(next_candidates) > 0:
+                    extend(itemset, bitsets[position], next_candidates)
+
+    extend(tuple(), None, np.arange(item_bitsets.shape[0]))
+    return rules
+
+
+class FrequentItemsets:
+    """The itemsets frequent with some class over a stream of records.
+
+    The itemsets having at least `min_count` records of some class are kept
+    with their class counts, and updated batch by batch as in FUP (Cheung et
+    al., 1996): the counts of the known itemsets are updated from the bitsets
+    of the batch only. An itemset not frequent before can only become frequent
+    if it is frequent enough in the batch, and only those are counted over the
+    records seen before. As in :func:`mine_class_rules`, the itemsets are the
+    tuples of the indexes of their items, and their class counts are arrays.
+
+    Parameters
+    ----------
+    max_length : int, default=0
+        The maximum number of items of an itemset (0 means no limit).
+    """
+
+    def __init__(self, max_length: int = 0):
+        self.max_length = max_length
+        self.itemsets = dict()
+        self.min_count = None
+
+    def remap_items(self, item_map):
+        """Move the items to new indexes (e.g. when new items are inserted).
+
+        `item_map` maps the old index of each item to the new one, and must
+        preserve their order.
+        """
+        self.itemsets = {tuple(item_map[list(itemset)].tolist()): class_counts
+                         for (itemset, class_counts) in self.itemsets.items()}
+
+    def update(self, item_bitsets, item_features, class_bitsets, history_item_bitsets, history_class_bitsets,
+               min_count: float):
+        """Update the itemsets with a batch of records.
+
+        Parameters
+        ----------
+        item_bitsets : ndarray of uint8, shape (n_items, n_bytes)
+            The bitsets of the items over the batch (see :func:`build_bitsets`).
+        item_features : ndarray, shape (n_items,)
+            The column of each item. Items must be sorted by column.
+        class_bitsets : ndarray of uint8, shape (n_classes, n_bytes)
+            The bitsets of the classes over the batch.
+        history_item_bitsets : ndarray of uint8, shape (n_items, n_history_bytes)
+            The bitsets of the items over the records seen before the batch.
+        history_class_bitsets : ndarray of uint8, shape (n_classes, n_history_bytes)
+            The bitsets of the classes over the records seen before the batch.
+        min_count : float
+            The minimum support count of an itemset, over all the records.
+
+        Returns
+        -------
+        stats : dict
+            The number of frequent itemsets and of itemsets counted over the
+            records seen before the batch.
+        """
+        min_count = max(min_count, 1)
+        # an itemset below the previous threshold must gain more than the difference in the batch,
+        # the tolerance only lets in a few more itemsets, whose counts are exact anyway
+        min_batch_count = min_count if self.min_count is None else min_count - self.min_count - 1e-6
+        itemsets = dict()
+        n_history_counts = 0
+
+        def extend(prefix, prefix_bitset, candidates):
+            nonlocal n_history_counts
+            bitsets = item_bitsets[candidates] if prefix_bitset is None else item_bitsets[candidates] & prefix_bitset
+            batch_class_counts = np.stack([popcount(bitsets & class_bitset) for class_bitset in class_bitsets],
+                                          axis=1)
+
+            frequent = np.zeros(len(candidates), dtype=bool)
+            for position, item in enumerate(candidates.tolist()):
+                itemset = prefix + (item,)
+                class_counts = self.itemsets.get(itemset)
+                if class_counts is None:
+                    if batch_class_counts[position].max() < min_batch_count:
+                        continue
+                    class_counts = 0
+                    if history_item_bitsets.shape[1] > 0:
+                        history_bitset = np.bitwise_and.reduce(history_item_bitsets[list(itemset)], axis=0)
+                        class_counts = popcount(history_bitset & history_class_bitsets)
+                        n_history_counts += 1
+                class_counts = class_counts + batch_class_counts[position]
+                if class_counts.max() >= min_count:
+                    itemsets[itemset] = class_counts
+                    frequent[position] = True
+            candidates, bitsets = candidates[frequent], bitsets[frequent]
+
+            for position, item in enumerate(candidates.tolist()):
+                itemset = prefix + (item,)
+                if self.max_length == 0 or len(itemset) < self.max_length:
+                    next_candidates = candidates[position + 1:]
+                    next_candidates = next_candidates[item_features[next_candidates] > item_features[item]]
+                    if len(next_candidates) > 0:
+                        extend(itemset, bitsets[position], next_candidates)
+
+        extend(tuple(), None, np.arange(item_bitsets.shape[0]))
+        self.itemsets, self.min_count = itemsets, min_count
+        return {'n_itemsets': len(itemsets), 'n_history_counts': n_history_counts}
+
+    def get_rules(self, min_conf: float):
+        """Get the class association rules above the thresholds.
+
+        The rules are those of :func:`mine_class_rules` over all the records
+        seen so far, with the support threshold of the last update.
+        """
+        rules = list()
+        for itemset, class_counts in self.itemsets.items():
+            count = int(class_counts.sum())
+            for class_index, class_count in enumerate(class_counts.tolist()):
+                confidence = 100 * class_count / count
+                if class_count >= self.min_count and confidence >= min_conf:
+                    rules.append((itemset, class_index, class_count, confidence))
+        return rules
+
+
+def sort_rules(rules: list, specialistic: bool = True) -> list:
+    """Sort rules as L3 does.
+
+    Rules are sorted by descending confidence, descending support, length
+    (descending if specialistic, ascending otherwise) and lexicographically.
+    """
+    sign = -1 if specialistic else 1
+    return sorted(rules, key=lambda r: (-r[3], -r[2], sign * len(r[0]), r[0], r[1]))
+
+
+def split_levels(rules: list, item_bitsets, class_bitsets):
+    """Split a sorted rule set in the two L3 levels by lazy pruning.
+
+    The rules are considered in order against the training records not yet
+    covered. A rule classifying correctly at least one of them goes to level 1
+    and the records it covers are removed. A rule covering none of them goes
+    to level 2. A rule only classifying them wrongly is discarded, and the
+    records stay available to the following rules.
+
+    Parameters
+    ----------
+    rules : list of tuple
+        The sorted rules, as returned by :func:`mine_class_rules`.
+    item_bitsets : ndarray of uint8, shape (n_items, n_bytes)
+        The bitsets of the items.
+    class_bitsets : ndarray of uint8, shape (n_classes, n_bytes)
+        The bitsets of the classes. Every record belongs to one class, bits
+        set in no class bitset are not records (e.g. padding).
+
+    Returns
+    -------
+    levels : ndarray of int8, shape (n_rules,)
+        The level of each rule, 0 if discarded.
+    """
+    levels = np.full(len(rules), 2, dtype=np.int8)
+    remaining = np.bitwise_or.reduce(class_bitsets, axis=0)
+    n_remaining = popcount(remaining)
+    for rule_id, (items, class_index, _, _) in enumerate(rules):
+        if n_remaining == 0:
+            break       # the following rules cover no record, they all go to level 2
+        covered = np.bitwise_and.reduce(item_bitsets[list(items)], axis=0) & remaining
+        if not covered.any():
+            continue
+        if (covered & class_bitsets[class_index]).any():
+            levels[rule_id] = 1
+            remaining &= ~covered
+            n_remaining -= popcount(covered)
+        else:
+            levels[rule_id] = 0
+    return levels
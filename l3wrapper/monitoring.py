@@ -0,0 +1,82 @@
+"""
+This module provides the aggregate counters of the predictions of a model.
+
+They are maintained by :meth:`L3Classifier.predict` when `track_predictions`
+is set, from the compact matching arrays of each batch (see the 'arrays'
+explain mode), so that a model can be monitored in production without
+keeping a :class:`Transaction` per classified record.
+"""
+
+import numpy as np
+
+
+# the edges of the latency histogram buckets (s): 4 per decade, from 100ns to 10s
+LATENCY_EDGES = 10 ** np.arange(-7, 1.01, 0.25)
+
+
+class PredictionStats:
+    """The counters of the predictions of a model.
+
+    Parameters
+    ----------
+    n_lvl1_rules : int
+        The number of level 1 rules.
+    n_lvl2_rules : int
+        The number of level 2 rules.
+
+    Attributes
+    ----------
+    n_samples : int
+        The number of records classified.
+    lvl1_hits : ndarray of int64, shape (n_lvl1_rules,)
+        The number of records each level 1 rule was used to classify.
+    lvl2_hits : ndarray of int64, shape (n_lvl2_rules,)
+        The number of records each level 2 rule was used to classify.
+    level_counts : dict
+        The number of records classified with each level: 1, 2 and -1 for
+        the records matched by no rule (labeled with the unlabeled class).
+    latency_edges : ndarray, shape (n_buckets + 1,)
+        The edges (s) of the buckets of the latency histogram. Latencies
+        out of the edges are counted in the first or last bucket.
+    latency_counts : ndarray of int64, shape (n_buckets,)
+        The number of records whose matching took a time in each bucket.
+        With the sparse engine, the records of a batch are matched at once
+        and each one is given the average time of its batch.
+    """
+
+    def __init__(self, n_lvl1_rules: int, n_lvl2_rules: int):
+        self.n_samples = 0
+        self.lvl1_hits = np.zeros(n_lvl1_rules, dtype=np.int64)
+        self.lvl2_hits = np.zeros(n_lvl2_rules, dtype=np.int64)
+        self.level_counts = {1: 0, 2: 0, -1: 0}
+        self.latency_edges = LATENCY_EDGES
+        self.latency_counts = np.zeros(LATENCY_EDGES.shape[0] - 1, dtype=np.int64)
+
+    def update(self, used_levels, indptr, rule_ids, latencies):
+        """Count a batch of classified records.
+
+        Parameters
+        ----------
+        used_levels, indptr, rule_ids : ndarray
+            The level used to classify each record and the rules matching
+            it, as saved by :meth:`L3Classifier.predict` with explain='arrays'.
+        latencies : ndarray, shape (n_samples,)
+            The matching time (s) of each record.
+        """
+        self.n_samples += used_levels.shape[0]
+        entry_levels = np.repeat(used_levels, np.diff(indptr))
+        for level, hits in [(1, self.lvl1_hits), (2, self.lvl2_hits)]:
+            hits += np.bincount(rule_ids[entry_levels == level], minlength=hits.shape[0])
+        levels, counts = np.unique(used_levels, return_counts=True)
+        for level, count in zip(levels.tolist(), counts.tolist()):
+            self.level_counts[level] += count
+        buckets = np.searchsorted(self.latency_edges, latencies, side="right") - 1
+        buckets = np.clip(buckets, 0, self.latency_counts.shape[0] - 1)
+        self.latency_counts += np.bincount(buckets, minlength=self.latency_counts.shape[0])
+
+    def reset(self):
+        """Reset all the counters to zero."""
+        self.__init__(self.lvl1_hits.shape[0], self.lvl2_hits.shape[0])
+
+    def __repr__(self):
+        return f"PredictionStats(n_samples={self.n_samples}, level_counts={self.level_counts})"
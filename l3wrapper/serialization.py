@@ -0,0 +1,107 @@
+"""
+This module provides the binary file format used to save fitted models.
+
+A model file holds a set of named NumPy arrays plus a small header of
+metadata. The layout is:
+
+- the magic string ``L3WMODEL``;
+- the format version (uint32) and the header length (uint64), little endian;
+- the header, pickled: the metadata and the dtype, shape and offset of each array;
+- the raw array buffers, each one aligned to 64 bytes.
+
+Since the arrays are stored raw, they can be memory-mapped: loading takes
+the time needed to read the header only, and multiple processes mapping the
+same file share the same physical pages.
+
+As for pickle, only load files from trusted sources.
+"""
+
+import pickle
+import struct
+import numpy as np
+
+
+_MAGIC = b"L3WMODEL"
+_VERSION = 1
+_PREAMBLE = struct.Struct("<IQ")
+_ALIGNMENT = 64
+
+
+def _align(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def write_model_file(path: str, meta: dict, arrays: dict):
+    """Write a set of arrays and their metadata to a model file.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file to write.
+    meta : dict
+        The metadata, any picklable object. Keep it small, it is always
+        loaded in memory.
+    arrays : dict
+        The arrays to write, by name. Object arrays are not supported.
+    """
+    specs = dict()
+    offset = 0
+    contiguous = dict()
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        if array.dtype.hasobject:
+            raise ValueError(f"The array '{name}' has dtype object, which cannot be saved.")
+        offset = _align(offset)
+        specs[name] = (array.dtype.str, array.shape, offset)
+        contiguous[name] = array
+        offset += array.nbytes
+
+    header = pickle.dumps({'meta': meta, 'arrays': specs}, protocol=pickle.HIGHEST_PROTOCOL)
+    data_start = _align(len(_MAGIC) + _PREAMBLE.size + len(header))
+
+    with open(path, "wb") as fp:
+        fp.write(_MAGIC)
+        fp.write(_PREAMBLE.pack(_VERSION, len(header)))
+        fp.write(header)
+        for name, array in contiguous.items():
+            fp.write(b"\0" * (data_start + specs[name][2] - fp.tell()))
+            fp.write(array.tobytes())
+
+
+def read_model_file(path: str, mmap: bool = True) -> (dict, dict):
+    """Read the arrays and the metadata of a model file.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file to read.
+    mmap : bool, default=True
+        Whether to memory-map the arrays (read-only) rather than reading
+        them in memory.
+
+    Returns
+    -------
+    meta, arrays : (dict, dict)
+        The metadata and the arrays, by name.
+    """
+    with open(path, "rb") as fp:
+        if fp.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f"{path} is not a model file.")
+        version, header_length = _PREAMBLE.unpack(fp.read(_PREAMBLE.size))
+        if version != _VERSION:
+            raise ValueError(f"Unsupported model file version {version}.")
+        header = pickle.loads(fp.read(header_length))
+    data_start = _align(len(_MAGIC) + _PREAMBLE.size + header_length)
+
+    if mmap:
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    else:
+        buffer = np.fromfile(path, dtype=np.uint8)
+
+    arrays = dict()
+    for name, (dtype, shape, offset) in header['arrays'].items():
+        dtype = np.dtype(dtype)
+        start = data_start + offset
+        stop = start + dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+        arrays[name] = buffer[start:stop].view(dtype).reshape(shape)
+    return header['meta'], arrays
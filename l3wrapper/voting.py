@@ -0,0 +1,113 @@
+"""
+This module provides the vectorized voting used to label matched records.
+
+The rules matching a batch of records are given in CSR-like form (see
+:meth:`L3Classifier.predict` with explain='arrays'): the ids of the rules
+matching the i-th record are ``rule_ids[indptr[i]:indptr[i + 1]]``, in
+ascending order. The votes of all the records are accumulated at once with
+:func:`numpy.bincount` over (record, class) cells.
+
+The match strategies (the `match_strategy` parameter of
+:class:`L3Classifier`) are registered in `MATCH_STRATEGIES`. Each one sets how
+many matching rules label a record and how their votes are weighted.
+"""
+
+import numpy as np
+
+
+def vote(indptr, rule_ids, rule_classes, n_classes: int, weights=None):
+    """Pick the winning class of each record of a batch by (weighted) voting.
+
+    Each matching rule votes for its class with its weight. The class with
+    the highest score wins. Ties are broken in favour of the class whose
+    rules have the lower summed rule id (i.e. the rules ranked first), then
+    of the class of the first matching rule.
+
+    Parameters
+    ----------
+    indptr : ndarray, shape (n_samples + 1,)
+        The offsets of the matching rules of each record in `rule_ids`.
+    rule_ids : ndarray, shape (n_entries,)
+        The ids of the matching rules.
+    rule_classes : ndarray, shape (n_entries,)
+        The class, in [0, n_classes), of each matching rule.
+    n_classes : int
+        The number of classes.
+    weights : ndarray, shape (n_entries,), default=None
+        The weight of the vote of each matching rule. If None, each rule
+        has one vote.
+
+    Returns
+    -------
+    winners, scores : (ndarray, ndarray)
+        The winning class of each record (-1 for the records matched by no
+        rule) and the score of each class, with shape (n_samples, n_classes).
+    """
+    n_samples = indptr.shape[0] - 1
+    n_matching = np.diff(indptr)
+    entry_rows = np.repeat(np.arange(n_samples), n_matching)
+    cells = entry_rows * n_classes + rule_classes
+    n_cells = n_samples * n_classes
+
+    scores = np.bincount(cells, weights=weights, minlength=n_cells).reshape(n_samples, n_classes)
+    if weights is None:
+        scores = scores.astype(np.int64)
+    rule_id_sums = np.bincount(cells, weights=rule_ids, minlength=n_cells).reshape(n_samples, n_classes)
+    first_rule_ids = np.full(n_cells, np.inf)
+    np.minimum.at(first_rule_ids, cells, rule_ids)
+    first_rule_ids = first_rule_ids.reshape(n_samples, n_classes)
+
+    # highest score, then lowest summed rule id, then lowest first rule id
+    voted = np.bincount(cells, minlength=n_cells).reshape(n_samples, n_classes) > 0
+    best = voted & (scores == np.where(voted, scores, -np.inf).max(axis=1, initial=-np.inf)[:, None])
+    best &= rule_id_sums == np.where(best, rule_id_sums, np.inf).min(axis=1, initial=np.inf)[:, None]
+    winners = np.where(best, first_rule_ids, np.inf).argmin(axis=1)
+    winners[n_matching == 0] = -1
+    return winners, scores
+
+
+class MatchStrategy:
+    """A strategy to label a record from the rules matching it.
+
+    Parameters
+    ----------
+    weight : {None, 'confidences', 'supports'}, default=None
+        The field of the rules (see :class:`l3wrapper.dictionary.RuleTable`)
+        weighting their votes. If None, each rule has one vote.
+    first_match : bool, default=False
+        Whether only the first matching rule labels a record, whatever
+        `max_matching`. The loop engine then stops matching a record at the
+        first rule covering it, the sparse engine keeps the first of the
+        rules it matched.
+    """
+
+    def __init__(self, weight=None, first_match=False):
+        self.weight = weight
+        self.first_match = first_match
+
+    def get_max_matching(self, max_matching: int) -> int:
+        """Get the number of matching rules to look for, given the `max_matching` of the estimator."""
+        return 1 if self.first_match else max_matching
+
+
+MATCH_STRATEGIES = {
+    'majority_voting': MatchStrategy(),
+    'first_match': MatchStrategy(first_match=True),
+    'confidence_weighted': MatchStrategy(weight='confidences'),
+    'support_weighted': MatchStrategy(weight='supports'),
+}
+
+
+def register_match_strategy(name: str, strategy: MatchStrategy):
+    """Register a match strategy, making `name` a valid `match_strategy` of :class:`L3Classifier`."""
+    MATCH_STRATEGIES[name] = strategy
+
+
+def get_match_strategy(name: str) -> MatchStrategy:
+    """Get a registered match strategy by name."""
+    try:
+        return MATCH_STRATEGIES[name]
+    except (KeyError, TypeError):
+        raise ValueError(
+            f"The match strategy specified is not supported. Use one of {sorted(MATCH_STRATEGIES)}."
+        ) from None
@@ -32,7 +32,7 @@ def test_save_human_readable(dataset_X_y):
     X, y = dataset_X_y
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
     clf = L3Classifier().fit(X_train, y_train, save_human_readable=True)
-    train_dir = clf.current_token_
+    train_dir = clf.train_dir_
     files = [f for f in os.listdir(train_dir) if f.startswith(f"{clf.current_token_}")]
     assert len(files) == 2 # level 1 and level 2
 
@@ -41,7 +41,7 @@ def test_training_files(dataset_X_y):
     X, y = dataset_X_y
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
     clf = L3Classifier().fit(X_train, y_train, remove_files=False)
-    train_dir = clf.current_token_
+    train_dir = clf.train_dir_
     files = [f for f in os.listdir(train_dir) if f.startswith(f"{clf.current_token_}")]
     assert len(files) == 7 # all the stuff left by L3 
 
@@ -116,3 +116,851 @@ def test_leve1_modifier(dataset_X_y):
     assert len([
         t for t in clf.labeled_transactions_ if t.used_level == 2
     ]) == 0
+
+
+def test_rule_index_matching(dataset_X_y):
+    from l3wrapper.l3wrapper import _get_matching_rules
+    X, y = dataset_X_y
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+    clf = L3Classifier(max_matching=3).fit(X_train, y_train)
+    clf._build_rule_indexes()
+    for row_item_ids in clf._encoder.transform_items(X_test).tolist():
+        item_ids = set(row_item_ids)
+        for item_sets, index in [(clf._lvl1_item_sets, clf._lvl1_index), (clf._lvl2_item_sets, clf._lvl2_index)]:
+            assert _get_matching_rules(item_ids, item_sets, 3, index) == _get_matching_rules(item_ids, item_sets, 3)
+
+    # the index is not pickled, it is rebuilt at the first predict
+    clf_l = pickle.loads(pickle.dumps(clf))
+    assert not hasattr(clf_l, "_lvl2_index")
+    assert (clf_l.predict(X_test) == clf.predict(X_test)).all()
+    assert clf_l._lvl2_index == clf._lvl2_index
+
+
+@pytest.mark.parametrize("max_matching", [1, 3])
+@pytest.mark.parametrize("rule_sets_modifier", ["standard", "level1"])
+def test_sparse_engine(dataset_X_y, max_matching, rule_sets_modifier):
+    X, y = dataset_X_y
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+    clf = L3Classifier(max_matching=max_matching, rule_sets_modifier=rule_sets_modifier).fit(X_train, y_train)
+    y_pred = clf.predict(X_test)
+    loop_transactions = clf.labeled_transactions_
+    assert (clf.predict(X_test, engine='sparse') == y_pred).all()
+    for tr_loop, tr_sparse in zip(loop_transactions, clf.labeled_transactions_):
+        assert tr_loop.used_level == tr_sparse.used_level
+        assert tr_loop.matched_rules == tr_sparse.matched_rules
+
+    with pytest.raises(ValueError):
+        clf.predict(X_test, engine='unknown')
+
+
+@pytest.mark.parametrize("engine", ["loop", "sparse"])
+def test_parallel_predict(dataset_X_y, engine):
+    X, y = dataset_X_y
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+    clf = L3Classifier(max_matching=2).fit(X_train, y_train)
+    y_pred = clf.predict(X_test, engine=engine)
+    transactions = clf.labeled_transactions_
+
+    clf.set_params(n_jobs=2)
+    assert (clf.predict(X_test, engine=engine) == y_pred).all()
+    assert len(clf.labeled_transactions_) == X_test.shape[0]
+    for tr, tr_parallel in zip(transactions, clf.labeled_transactions_):
+        assert tr.used_level == tr_parallel.used_level
+        assert tr.matched_rules == tr_parallel.matched_rules
+
+    # the workers keep the rule matcher across calls, until the rule sets change
+    from joblib import parallel_backend
+    from l3wrapper import l3wrapper as l3wrapper_module
+
+    with parallel_backend("threading"):
+        assert (clf.predict(X_test, engine=engine) == y_pred).all()
+        matcher_path = clf._matcher_file.path
+        matcher = l3wrapper_module._worker_matchers[matcher_path]
+        assert (clf.predict(X_test, engine=engine) == y_pred).all()
+        assert l3wrapper_module._worker_matchers[matcher_path] is matcher
+    clf.fit(X_train, y_train)
+    assert not os.path.exists(matcher_path)
+    assert matcher_path not in l3wrapper_module._worker_matchers
+
+    # more estimators than the matchers kept, predicting concurrently
+    from concurrent.futures import ThreadPoolExecutor
+
+    copies = [pickle.loads(pickle.dumps(clf)) for _ in range(2 * l3wrapper_module.MAX_WORKER_MATCHERS)]
+    with parallel_backend("threading"), ThreadPoolExecutor(8) as executor:
+        for copy_pred in executor.map(lambda model: model.predict(X_test, engine=engine, explain=None), copies):
+            assert (copy_pred == y_pred).all()
+    assert len(l3wrapper_module._worker_matchers) <= l3wrapper_module.MAX_WORKER_MATCHERS
+    paths = [model._matcher_file.path for model in copies]
+    del copies
+    assert not any(os.path.exists(path) or path in l3wrapper_module._worker_matchers for path in paths)
+
+
+@pytest.mark.parametrize("engine", ["loop", "sparse"])
+def test_explain(dataset_X_y, engine):
+    X, y = dataset_X_y
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+    clf = L3Classifier(max_matching=2).fit(X_train, y_train)
+    y_pred = clf.predict(X_test, engine=engine)
+    transactions = clf.labeled_transactions_
+
+    assert (clf.predict(X_test, engine=engine, explain='arrays') == y_pred).all()
+    assert not hasattr(clf, 'labeled_transactions_')
+    assert clf.used_levels_.shape[0] == X_test.shape[0]
+    for i, tr in enumerate(transactions):
+        assert tr.used_level == clf.used_levels_[i]
+        rule_ids = clf.matched_rule_ids_[clf.matched_rules_indptr_[i]:clf.matched_rules_indptr_[i + 1]]
+        assert [r.rule_id for r in (tr.matched_rules or [])] == list(rule_ids)
+
+    assert (clf.predict(X_test, engine=engine, explain=None) == y_pred).all()
+    assert not hasattr(clf, 'labeled_transactions_') and not hasattr(clf, 'used_levels_')
+
+
+def test_predict_file(dataset_X_y, tmp_path):
+    X, y = dataset_X_y
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+    clf = L3Classifier().fit(X_train, y_train)
+    y_pred = clf.predict(X_test)
+
+    y_chunks = list(clf.predict_iter(np.array_split(X_test, 4), engine='sparse'))
+    assert len(y_chunks) == 4
+    assert (np.concatenate(y_chunks) == y_pred).all()
+
+    path = tmp_path / "test.data"
+    np.savetxt(path, np.hstack([X_test, y_test.reshape(-1, 1)]), fmt="%s", delimiter=",")
+    y_chunks = list(clf.predict_file(path, chunksize=100, usecols=list(range(X_test.shape[1]))))
+    assert [len(y_chunk) for y_chunk in y_chunks[:-1]] == [100] * (len(y_chunks) - 1)
+    assert (np.concatenate(y_chunks) == y_pred).all()
+
+
+def test_encoder(dataset_X_y):
+    from l3wrapper.encoding import CategoricalEncoder
+    X, y = dataset_X_y
+    encoder = CategoricalEncoder()
+    codes = encoder.fit_transform(X)
+    assert codes.dtype == np.int32
+    assert (encoder.transform(X) == codes).all()
+    for column_id, categories in enumerate(encoder.categories_):
+        assert (categories[codes[:, column_id]] == X[:, column_id]).all()
+
+    X_unseen = X[:2].copy()
+    X_unseen[0, 0] = "unseen"
+    assert encoder.transform(X_unseen)[0, 0] == -1 and encoder.transform(X_unseen)[1, 0] >= 0
+
+
+def test_keep_training_data(dataset_X_y):
+    X, y = dataset_X_y
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+    clf = L3Classifier().fit(X_train, y_train)
+    y_pred = clf.predict(X_test)
+
+    clf_light = L3Classifier(keep_training_data=False).fit(X_train, y_train)
+    assert not hasattr(clf_light, 'X_') and not hasattr(clf_light, 'y_')
+    assert (clf_light.predict(X_test) == y_pred).all()
+
+
+def test_rule_table(tmp_path):
+    from l3wrapper.dictionary import Rule, RuleTable, parse_raw_rules
+    raw_rules = ["{3,1} -> 100 12 100.000000 2", "{7} -> 101 40 87.500000 1", "{2,5,4} -> 100 9 75.000000 3"]
+    path = tmp_path / "livelloI.txt"
+    path.write_text("".join(f"{r}\n" for r in raw_rules))
+
+    rules = parse_raw_rules(str(path))
+    assert isinstance(rules, RuleTable) and len(rules) == 3
+    assert list(rules.lengths) == [2, 1, 3]
+    for rule_id, raw_rule in enumerate(raw_rules):
+        assert rules[rule_id] == Rule(raw_rule, rule_id)
+    assert list(rules) == rules[:] == [Rule(r, i) for (i, r) in enumerate(raw_rules)]
+    assert rules[-1].rule_id == 2 and rules[1].raw_rule == "{7} -> 101 40 87.5"
+    assert RuleTable.from_rules(list(rules))[2] == rules[2]
+
+    rules_l = pickle.loads(pickle.dumps(rules))
+    assert list(rules_l) == list(rules)
+
+
+def test_parse_raw_rules_bulk(dataset_X_y):
+    from l3wrapper.dictionary import parse_raw_rules, _parse_raw_rules_by_line
+    X, y = dataset_X_y
+    clf = L3Classifier(min_sup=0.005).fit(X, y, remove_files=False)
+    token = clf.current_token_
+    for level_file in ["livelloI.txt", "livelloII.txt"]:
+        filename = os.path.join(clf.train_dir_, f"{token}_{level_file}")
+        rules, rules_by_line = parse_raw_rules(filename), _parse_raw_rules_by_line(filename)
+        for attr in ["item_indptr", "item_ids", "class_ids", "supports", "confidences", "lengths"]:
+            assert np.array_equal(getattr(rules, attr), getattr(rules_by_line, attr))
+
+
+def test_dump_encoded_to_file(dataset_X_y, tmp_path):
+    from l3wrapper.l3wrapper import _dump_encoded_to_file
+    from l3wrapper.encoding import CategoricalEncoder
+    X, y = dataset_X_y
+    encoder = CategoricalEncoder()
+    codes = encoder.fit_transform(X)
+    filestem = str(tmp_path / "car")
+    _dump_encoded_to_file([codes[:, i] for i in range(codes.shape[1])], encoder.categories_, filestem, "data",
+                          chunksize=500)
+    with open(f"{filestem}.data") as fp:
+        assert fp.read() == "".join(f"{','.join(row)}\n" for row in X)
+
+
+def test_work_dir(dataset_X_y, tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    X, y = dataset_X_y
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+    cwd = os.getcwd()
+    clf = L3Classifier(work_dir=str(tmp_path)).fit(X_train, y_train, remove_files=False)
+    assert os.getcwd() == cwd
+    assert os.path.dirname(clf.train_dir_) == str(tmp_path)
+    assert len(os.listdir(clf.train_dir_)) == 7
+
+    # concurrent fits in the same process
+    params = [{'min_sup': 0.01}, {'min_sup': 0.05}, {'min_conf': 0.75}, {'max_length': 2}]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        clfs = list(executor.map(lambda p: L3Classifier(work_dir=str(tmp_path), **p).fit(X_train, y_train), params))
+    for p, clf_thread in zip(params, clfs):
+        clf = L3Classifier(**p).fit(X_train, y_train)
+        assert (clf.predict(X_test) == clf_thread.predict(X_test)).all()
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_fit_many(dataset_X_y, tmp_path):
+    X, y = dataset_X_y
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+    param_grid = {'min_sup': [0.01, 0.05], 'max_matching': [1, 3], 'assign_unlabeled': ['majority_class', 'x']}
+    models = L3Classifier(work_dir=str(tmp_path)).fit_many(X_train, y_train, param_grid, n_jobs=2)
+    assert len(models) == 8
+    for params, model in models:
+        assert model.get_params()['min_sup'] == params['min_sup']
+        clf = L3Classifier(**params).fit(X_train, y_train)
+        assert clf.n_lvl1_rules_ == model.n_lvl1_rules_
+        assert clf.unlabeled_class_ == model.unlabeled_class_
+        assert (clf.predict(X_test) == model.predict(X_test)).all()
+    assert os.listdir(tmp_path) == []
+
+
+def test_warm_start(dataset_X_y, monkeypatch, tmp_path):
+    X, y = dataset_X_y
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+    clf = L3Classifier(min_sup=0.01, min_conf=0.5, warm_start=True).fit(X_train, y_train)
+    token = clf.current_token_
+    mined, mined_lvl2 = clf.lvl1_rules_, clf.lvl2_rules_
+
+    clf.set_params(min_sup=0.05, min_conf=0.75, max_length=2)
+    clf.fit(X_train, y_train)
+    assert clf.current_token_ == token  # the binary did not run
+    for rules in [clf.lvl1_rules_, clf.lvl2_rules_]:
+        assert (rules.supports >= 0.05 * X_train.shape[0]).all()
+        assert (rules.confidences >= 75).all()
+        assert (rules.lengths <= 2).all()
+    expected = {r.raw_rule for rules in [mined, mined_lvl2] for r in rules if r.support >= 0.05 * X_train.shape[0]
+                and r.confidence >= 75 and len(r.item_ids) <= 2}
+    assert {r.raw_rule for rules in [clf.lvl1_rules_, clf.lvl2_rules_] for r in rules} <= expected
+    clf.predict(X_test)
+
+    # the rules left are split in the levels as a full retrain does (by L3 lazy pruning, see split_levels)
+    clf_python = L3Classifier(min_sup=0.01, min_conf=0.5, train_engine="python", warm_start=True)
+    clf_python.fit(X_train, y_train)
+    for min_sup, min_conf in [(0.02, 0.6), (0.013, 0.5)]:
+        clf_python.set_params(min_sup=min_sup, min_conf=min_conf).fit(X_train, y_train)
+        assert clf_python.fit_stats_["warm_start"]["hit"]
+        retrained = L3Classifier(min_sup=min_sup, min_conf=min_conf, train_engine="python").fit(X_train, y_train)
+        for level in ["lvl1_rules_", "lvl2_rules_"]:
+            assert [r.raw_rule for r in getattr(clf_python, level)] == \
+                [r.raw_rule for r in getattr(retrained, level)]
+        assert (clf_python.predict(X_test) == retrained.predict(X_test)).all()
+
+    # back to the mined thresholds
+    clf.set_params(min_sup=0.01, min_conf=0.5, max_length=0).fit(X_train, y_train)
+    assert clf.current_token_ == token
+    assert clf.lvl1_rules_ is mined
+
+    # lower thresholds, other data or other params force a full retrain
+    for params, X_fit, y_fit in [({'min_sup': 0.005}, X_train, y_train),
+                                 ({}, X_test, y_test),
+                                 ({'specialistic_rules': False}, X_train, y_train)]:
+        clf.set_params(**params).fit(X_fit, y_fit)
+        assert clf.current_token_ != token
+        token = clf.current_token_
+
+    # a failed fit on other data does not let the rules of the previous data be reused
+    clf = L3Classifier(warm_start=True).fit(X_train, y_train)
+    with pytest.raises(OSError):
+        clf.set_params(work_dir=os.path.join(str(tmp_path), "missing")).fit(X_test, y_test)
+    clf.set_params(work_dir=None).fit(X_test, y_test)
+    assert not clf.fit_stats_["warm_start"]["hit"]
+    assert [r.raw_rule for r in clf.lvl1_rules_] == \
+        [r.raw_rule for r in L3Classifier().fit(X_test, y_test).lvl1_rules_]
+
+
+def test_fit_cache(dataset_X_y, tmp_path):
+    from l3wrapper.cache import FitCache
+    X, y = dataset_X_y
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+    cache_dir = str(tmp_path / "cache")
+    clf = L3Classifier(cache_dir=cache_dir).fit(X_train, y_train)
+    assert clf.current_token_ is not None
+    assert len(os.listdir(cache_dir)) == 1
+
+    # a hit does not run the binary, even with different prediction parameters
+    clf_hit = L3Classifier(cache_dir=cache_dir, max_matching=2).fit(X_train, y_train)
+    assert clf_hit.current_token_ is None
+    assert [r.raw_rule for r in clf_hit.lvl1_rules_] == [r.raw_rule for r in clf.lvl1_rules_]
+    assert (clf_hit.predict(X_test) == clf.set_params(max_matching=2).predict(X_test)).all()
+
+    # other data or mining parameters miss
+    assert L3Classifier(cache_dir=cache_dir).fit(X_test, y_test).current_token_ is not None
+    assert L3Classifier(cache_dir=cache_dir, min_sup=0.05).fit(X_train, y_train).current_token_ is not None
+    assert len(os.listdir(cache_dir)) == 3
+
+    # least recently used entries are evicted beyond the size limit
+    entries = sorted(os.listdir(cache_dir), key=lambda name: os.path.getmtime(os.path.join(cache_dir, name)))
+    cache = FitCache(cache_dir, max_bytes=os.path.getsize(os.path.join(cache_dir, entries[-1])))
+    cache.evict()
+    assert os.listdir(cache_dir) == [entries[-1]]
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load_binary(dataset_X_y, tmp_path, mmap):
+    X, y = dataset_X_y
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+    clf = L3Classifier(max_matching=2).fit(X_train, y_train)
+    y_pred = clf.predict(X_test)
+
+    path = str(tmp_path / "clf.l3")
+    clf.save(path)
+    clf_l = L3Classifier.load(path, mmap=mmap)
+    assert clf_l.get_params() == clf.get_params()
+    assert not hasattr(clf_l, "X_")
+    assert clf_l._item_to_item_id == clf._item_to_item_id
+    assert [r.raw_rule for r in clf_l.lvl2_rules_] == [r.raw_rule for r in clf.lvl2_rules_]
+    assert isinstance(clf_l.lvl2_rules_.item_ids.base, np.memmap) == mmap
+    for engine in ["loop", "sparse"]:
+        assert (clf_l.predict(X_test, engine=engine) == y_pred).all()
+    assert os.path.getsize(path) < len(pickle.dumps(clf))
+
+    # the rule sets are saved with the parameters they were fitted with, not the current ones
+    clf.set_params(min_sup=0.05).save(path)
+    clf_l = L3Classifier.load(path, mmap=mmap)
+    assert clf_l.min_sup == 0.01 and clf_l.n_lvl2_rules_ == clf.n_lvl2_rules_
+    for engine in ["loop", "sparse"]:
+        assert (clf_l.predict(X_test, engine=engine) == y_pred).all()
+
+
+def test_rule_matrix_from_arrays():
+    from l3wrapper.matching import rule_matrix_from_arrays
+
+    R, lengths = rule_matrix_from_arrays(np.ones(3, dtype=np.int32), np.array([0, 2, 1], dtype=np.int32),
+                                         np.array([0, 2, 3], dtype=np.int32), 3, np.array([1, 1, 1]))
+    assert R.shape == (2, 3)
+    with pytest.raises(ValueError):
+        rule_matrix_from_arrays(np.ones(3, dtype=np.int32), np.array([0, 5, 1], dtype=np.int32),
+                                np.array([0, 2, 3], dtype=np.int32), 3, np.array([1, 1, 1]))
+
+
+def _anonymous_memory():
+    with open("/proc/self/smaps_rollup") as fp:
+        for line in fp:
+            if line.startswith("Anonymous:"):
+                return int(line.split()[1]) * 1024
+
+
+def _serve(path, mmap, X, queue):
+    before = _anonymous_memory()
+    clf = L3Classifier.load(path, mmap=mmap)
+    clf.predict(X, engine="sparse", explain=None)
+    queue.put(_anonymous_memory() - before)
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/smaps_rollup"), reason="requires Linux smaps")
+def test_shared_model_memory(dataset_X_y, tmp_path):
+    import multiprocessing
+    from l3wrapper.dictionary import RuleTable
+    X, y = dataset_X_y
+    clf = L3Classifier().fit(X, y)
+
+    # a large level 2 rule set of random rules, with one item per column
+    rng = np.random.default_rng(0)
+    n_rules, length = 100000, 4
+    column_items = dict()
+    for item_id, (column_id, _) in clf._item_id_to_item.items():
+        column_items.setdefault(column_id, list()).append(item_id)
+    columns = np.argsort(rng.random((n_rules, X.shape[1])), axis=1)[:, :length]
+    items = np.empty(columns.shape, dtype=np.int64)
+    for column_id, item_ids in column_items.items():
+        items[columns == column_id] = rng.choice(item_ids, (columns == column_id).sum())
+    items = np.sort(items, axis=1)
+    clf._mined_lvl2_rules = RuleTable(np.arange(n_rules + 1) * length, items.reshape(-1),
+                                      rng.choice(list(clf._class_dict), n_rules),
+                                      np.full(n_rules, X.shape[0]), np.full(n_rules, 100.))
+    clf._set_rule_sets()
+    path = str(tmp_path / "clf.l3")
+    clf.save(path)
+    model_size = os.path.getsize(path)
+
+    # the private memory of each worker does not grow with the model if it is memory-mapped
+    context = multiprocessing.get_context("fork")
+    for mmap in [True, False]:
+        for n_workers in [1, 4]:
+            queue = context.Queue()
+            workers = [context.Process(target=_serve, args=(path, mmap, X[:5], queue)) for _ in range(n_workers)]
+            for worker in workers:
+                worker.start()
+            growths = [queue.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+            if mmap:
+                assert max(growths) < 0.05 * model_size
+            else:
+                assert min(growths) > 0.9 * model_size
+
+
+def test_mine_class_rules(dataset_X_y):
+    from itertools import combinations
+    from l3wrapper.mining import build_bitsets, mine_class_rules, split_levels
+    X, y = dataset_X_y
+    X, y = X[::7, :4], y[::7]
+    codes = np.stack([np.unique(X[:, i], return_inverse=True)[1].reshape(-1) for i in range(X.shape[1])], axis=1)
+    offsets = np.concatenate([[0], np.cumsum(codes.max(axis=0) + 1)])
+    item_indexes = codes + offsets[:-1]
+    labels, y_codes = np.unique(y, return_inverse=True)
+
+    item_bitsets = build_bitsets(item_indexes, offsets[-1])
+    class_bitsets = build_bitsets(y_codes.reshape(-1, 1), len(labels))
+    rules = mine_class_rules(item_bitsets, np.repeat(np.arange(X.shape[1]), np.diff(offsets)), class_bitsets,
+                             min_count=3, min_conf=40, max_length=3)
+
+    # brute force
+    expected = set()
+    rows = [set(row) for row in item_indexes.tolist()]
+    for length in range(1, 4):
+        for itemset in set(c for row in item_indexes.tolist() for c in combinations(row, length)):
+            covered = [i for (i, row) in enumerate(rows) if row.issuperset(itemset)]
+            for class_index in range(len(labels)):
+                count = sum(y_codes[i] == class_index for i in covered)
+                if count >= 3 and 100 * count / len(covered) >= 40:
+                    expected.add((itemset, class_index, count))
+    assert set((items, c, count) for (items, c, count, _) in rules) == expected
+
+    # lazy pruning: a discarded rule only misclassifies the records left, and leaves them
+    # to the following rules, level 2 rules cover none of the records left
+    rules = [((3,), 0, 1, 50.), ((0,), 0, 1, 50.), ((0, 2), 1, 1, 100.), ((1,), 1, 1, 100.)]
+    item_bitsets = build_bitsets(np.array([[0, 2], [0, 3], [1, 3]]), 4)
+    class_bitsets = build_bitsets(np.array([[1], [0], [1]]), 2)
+    assert split_levels(rules, item_bitsets, class_bitsets).tolist() == [1, 0, 1, 2]
+
+
+def test_python_train_engine(dataset_X_y):
+    X, y = dataset_X_y
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+    clf = L3Classifier(train_engine="python", min_sup=0.02, min_conf=0.6, max_length=3).fit(X_train, y_train)
+    assert clf.current_token_ is None
+    assert clf.n_lvl1_rules_ > 0 and clf.n_lvl2_rules_ > 0
+    for rules in [clf.lvl1_rules_, clf.lvl2_rules_]:
+        assert (rules.supports >= 0.02 * X_train.shape[0]).all()
+        assert (rules.confidences >= 60).all()
+        assert (rules.lengths <= 3).all()
+    assert set(clf._class_dict.values()) == set(y_train)
+    assert accuracy_score(y_test, clf.predict(X_test)) > 0.7
+
+    with pytest.raises(NotImplementedError):
+        L3Classifier(train_engine="java").fit(X_train, y_train)
+
+
+def test_partial_fit(dataset_X_y):
+    X, y = dataset_X_y
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+    params = dict(min_sup=0.02, min_conf=0.6, max_length=3)
+
+    clf = L3Classifier(**params)
+    with pytest.raises(ValueError):
+        clf.partial_fit(X_train, y_train)
+    # batches where some values and labels only appear later
+    order = np.argsort(X_train[:, 0], kind="stable")
+    n_lvl1_rules = list()
+    for batch in np.array_split(order, 3):
+        clf.partial_fit(X_train[batch], y_train[batch], classes=np.unique(y))
+        n_lvl1_rules.append(clf.n_lvl1_rules_)
+        assert clf._mined_n_samples == sum(batch.shape[0] for batch in np.array_split(order, 3)[:len(n_lvl1_rules)])
+
+    # the same model as fitting the whole data at once
+    clf_all = L3Classifier(train_engine="python", **params).fit(X_train[order], y_train[order])
+    assert clf.n_items_used_ == clf_all.n_items_used_
+    for level in ["lvl1_rules_", "lvl2_rules_"]:
+        assert [r.raw_rule for r in getattr(clf, level)] == [r.raw_rule for r in getattr(clf_all, level)]
+    assert (clf.predict(X_test) == clf_all.predict(X_test)).all()
+    assert clf.unlabeled_class_ == clf_all.unlabeled_class_
+
+    with pytest.raises(ValueError):
+        clf.partial_fit(X_train[:10], np.array(["unknown"] * 10))
+
+    # batches with no new items do not reallocate the bitsets, unless their capacity is exceeded
+    clf = L3Classifier(**params).partial_fit(X_train, y_train, classes=np.unique(y))
+    n_reallocations = 0
+    for batch in np.array_split(np.arange(X_train.shape[0]), 16):
+        bitsets = clf._stream_item_bitsets
+        clf.partial_fit(X_train[batch], y_train[batch])
+        n_reallocations += clf._stream_item_bitsets is not bitsets
+    assert n_reallocations <= 2
+    clf_all = L3Classifier(train_engine="python", **params).fit(np.concatenate([X_train, X_train]),
+                                                                np.concatenate([y_train, y_train]))
+    for level in ["lvl1_rules_", "lvl2_rules_"]:
+        assert [r.raw_rule for r in getattr(clf, level)] == [r.raw_rule for r in getattr(clf_all, level)]
+
+    # the mining only counts the batch: with the same batch again and again no itemset becomes
+    # frequent, the history is never counted and the mining time does not grow with it
+    clf = L3Classifier(**params)
+    mine_stats = list()
+    for _ in range(24):
+        clf.partial_fit(X_train, y_train, classes=np.unique(y))
+        mine_stats.append(clf.fit_stats_["mine"])
+    assert all(stats["n_history_counts"] == 0 for stats in mine_stats[1:])
+    assert len({stats["n_itemsets"] for stats in mine_stats}) == 1
+    times = [stats["wall_time"] for stats in mine_stats[1:]]
+    assert np.median(times[-8:]) < 2 * np.median(times[:8]) + 0.01
+
+    # the itemsets becoming frequent are counted over the history, also when the parameters change
+    clf = L3Classifier(**params)
+    batches = np.array_split(order, 4)
+    for i, batch in enumerate(batches):
+        if i == 2:
+            clf.set_params(min_sup=0.01, max_length=0)
+        clf.partial_fit(X_train[batch], y_train[batch], classes=np.unique(y))
+    assert clf.fit_stats_["mine"]["n_history_counts"] > 0
+    clf_all = L3Classifier(train_engine="python", **dict(params, min_sup=0.01, max_length=0)).fit(X_train[order],
+                                                                                                 y_train[order])
+    for level in ["lvl1_rules_", "lvl2_rules_"]:
+        assert [r.raw_rule for r in getattr(clf, level)] == [r.raw_rule for r in getattr(clf_all, level)]
+
+
+@pytest.mark.parametrize("max_matching", [1, 3])
+def test_predict_proba(dataset_X_y, max_matching):
+    X, y = dataset_X_y
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+    clf = L3Classifier(max_matching=max_matching).fit(X_train, y_train)
+    y_pred, proba = clf.predict(X_test, explain="arrays", return_proba=True)
+    used_levels, indptr, rule_ids = clf.used_levels_, clf.matched_rules_indptr_, clf.matched_rule_ids_
+    assert (y_pred == clf.predict(X_test, explain=None)).all()
+    assert proba.shape == (X_test.shape[0], len(clf.classes_))
+    assert np.allclose(proba.sum(axis=1), 1)
+    assert np.allclose(proba, clf.predict_proba(X_test, engine="sparse"))
+
+    scores = clf.decision_function(X_test)
+    assert (scores.sum(axis=1) == np.diff(indptr)).all()
+
+    # a single rule predicts its class with its confidence, the rest is shared by all the classes
+    i = np.flatnonzero(used_levels == 1)[0]
+    rule = clf.lvl1_rules_[int(rule_ids[indptr[i]])]
+    if max_matching == 1:
+        confidence = rule.confidence / 100
+        assert np.isclose(proba[i, clf.classes_.index(clf._class_dict[rule.class_id])],
+                          confidence + (1 - confidence) / len(clf.classes_))
+
+    # the most probable class is the predicted one, whatever the strategy
+    assert (np.array(clf.classes_)[proba.argmax(axis=1)] == y_pred)[used_levels != -1].all()
+    for match_strategy in ["majority_voting", "confidence_weighted", "support_weighted"]:
+        clf_many = L3Classifier(min_sup=0.005, max_matching=5, match_strategy=match_strategy).fit(X_train, y_train)
+        y_pred, proba = clf_many.predict(X_test, explain="arrays", return_proba=True)
+        matched = clf_many.used_levels_ != -1
+        assert (np.array(clf_many.classes_)[proba.argmax(axis=1)] == y_pred)[matched].all()
+        assert np.allclose(proba.sum(axis=1), 1)
+
+    unmatched = used_levels == -1
+    assert (proba[unmatched, clf.classes_.index(clf.unlabeled_class_)] == 1).all()
+
+
+def test_vote():
+    from collections import Counter
+    from l3wrapper.voting import vote
+
+    def reference_vote(rule_ids, rule_classes):
+        # the former per-record voting: most votes, then lower summed rule id
+        priority = Counter()
+        for rule_id, rule_class in zip(rule_ids, rule_classes):
+            priority[rule_class] += rule_id
+        most_common = Counter(rule_classes).most_common()
+        most_common = sorted(most_common, key=lambda x: priority[x[0]])
+        most_common = sorted(most_common, key=lambda x: x[1], reverse=True)
+        return most_common[0][0]
+
+    rng = np.random.default_rng(0)
+    n_matching = rng.integers(0, 6, 2000)
+    indptr = np.concatenate([[0], np.cumsum(n_matching)])
+    rule_ids = np.concatenate([np.sort(rng.choice(12, n, replace=False)) for n in n_matching])
+    rule_classes = rng.integers(0, 3, rule_ids.shape[0])
+    winners, scores = vote(indptr, rule_ids, rule_classes, 3)
+    for i in range(n_matching.shape[0]):
+        start, end = indptr[i], indptr[i + 1]
+        if start == end:
+            assert winners[i] == -1
+        else:
+            assert winners[i] == reference_vote(rule_ids[start:end].tolist(), rule_classes[start:end].tolist())
+    assert (scores.sum(axis=1) == n_matching).all()
+
+    # weighted votes
+    winners, scores = vote(np.array([0, 3]), np.array([0, 1, 2]), np.array([0, 1, 1]), 2,
+                           weights=np.array([0.9, 0.4, 0.4]))
+    assert winners.tolist() == [0] and np.allclose(scores, [[0.9, 0.8]])
+
+
+@pytest.mark.parametrize("engine", ["loop", "sparse"])
+def test_match_strategies(dataset_X_y, engine):
+    from l3wrapper.voting import MATCH_STRATEGIES, MatchStrategy, register_match_strategy
+
+    X, y = dataset_X_y
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+    clf = L3Classifier(max_matching=5).fit(X_train, y_train)
+    majority_pred = clf.predict(X_test, engine=engine, explain=None)
+
+    # first_match labels as a single matching rule, matching at most one rule
+    first_pred = clf.set_params(match_strategy="first_match").predict(X_test, engine=engine, explain="arrays")
+    assert (np.diff(clf.matched_rules_indptr_) <= 1).all()
+    assert (first_pred == L3Classifier(max_matching=1).fit(X_train, y_train)
+            .predict(X_test, engine=engine, explain=None)).all()
+
+    # weighted votes, checked against the per-record sums
+    for strategy, field in [("confidence_weighted", "confidences"), ("support_weighted", "supports")]:
+        y_pred = clf.set_params(match_strategy=strategy).predict(X_test, engine=engine, explain="arrays")
+        used_levels, indptr, rule_ids = clf.used_levels_, clf.matched_rules_indptr_, clf.matched_rule_ids_
+        scores = clf.decision_function(X_test, engine=engine)
+        rule_sets = {1: clf.lvl1_rules_, 2: clf.lvl2_rules_}
+        for i in np.flatnonzero(used_levels != -1)[:50]:
+            rules = rule_sets[used_levels[i]]
+            expected = np.zeros(len(clf.classes_))
+            for r in rule_ids[indptr[i]:indptr[i + 1]]:
+                expected[clf.classes_.index(clf._class_dict[rules.class_ids[r]])] += getattr(rules, field)[r]
+            assert np.allclose(scores[i], expected)
+            assert y_pred[i] == clf.classes_[int(expected.argmax())] or \
+                np.isclose(expected.max(), np.sort(expected)[-2])
+    assert (clf.predict(X_test, engine=engine, explain=None) != majority_pred).any()
+
+    try:
+        register_match_strategy("first_by_support", MatchStrategy(weight="supports", first_match=True))
+        clf.set_params(match_strategy="first_by_support")
+        assert (clf.predict(X_test, engine=engine, explain=None) == first_pred).all()
+    finally:
+        MATCH_STRATEGIES.pop("first_by_support")
+
+    with pytest.raises(ValueError):
+        clf.set_params(match_strategy="unknown").predict(X_test)
+
+
+def test_fit_stats(dataset_X_y, tmp_path):
+    X, y = dataset_X_y
+    calls = list()
+    clf = L3Classifier(fit_callback=lambda stage, stats: calls.append((stage, stats)))
+    clf.fit(X, y, save_human_readable=True)
+    assert list(clf.fit_stats_) == ["validate", "dump", "train", "load_rules", "write_human_readable", "total"]
+    assert calls == list(clf.fit_stats_.items())
+    stats = clf.fit_stats_
+    assert all(stage_stats["wall_time"] >= 0 for stage_stats in stats.values())
+    assert stats["validate"]["n_samples"] == X.shape[0]
+    assert stats["dump"]["bytes_written"] > 0
+    assert stats["train"]["returncode"] == 0
+    assert stats["load_rules"]["bytes_read"] > 0
+    assert stats["total"]["n_lvl1_rules"] == clf.n_lvl1_rules_
+    assert stats["total"]["wall_time"] >= sum(stats[stage]["wall_time"] for stage in ["dump", "train"])
+    clf.save(str(tmp_path / "clf.l3"))
+    assert L3Classifier.load(str(tmp_path / "clf.l3")).fit_callback is None
+
+    clf = L3Classifier(train_engine="python", cache_dir=str(tmp_path)).fit(X, y)
+    assert list(clf.fit_stats_) == ["validate", "cache_lookup", "mine", "cache_store", "total"]
+    assert not clf.fit_stats_["cache_lookup"]["hit"]
+    clf.fit(X, y)
+    assert list(clf.fit_stats_) == ["validate", "cache_lookup", "total"]
+    assert clf.fit_stats_["cache_lookup"]["hit"]
+
+    models = L3Classifier().fit_many(X, y, {"min_sup": [0.01, 0.05]})
+    for _, model in models:
+        assert list(model.fit_stats_) == ["validate", "dump", "train", "load_rules"]
+
+
+@pytest.mark.parametrize("engine", ["loop", "sparse"])
+def test_prediction_stats(dataset_X_y, engine):
+    X, y = dataset_X_y
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+    clf = L3Classifier(max_matching=3).fit(X_train, y_train)
+    clf.predict(X_test, engine=engine)
+    assert not hasattr(clf, "prediction_stats_")
+
+    clf.set_params(track_predictions=True).predict(X_test, engine=engine, explain="arrays")
+    stats = clf.prediction_stats_
+    used_levels, indptr, rule_ids = clf.used_levels_, clf.matched_rules_indptr_, clf.matched_rule_ids_
+    entry_levels = np.repeat(used_levels, np.diff(indptr))
+    assert stats.n_samples == X_test.shape[0]
+    assert stats.lvl1_hits.shape == (clf.n_lvl1_rules_,) and stats.lvl2_hits.shape == (clf.n_lvl2_rules_,)
+    assert (stats.lvl1_hits == np.bincount(rule_ids[entry_levels == 1], minlength=clf.n_lvl1_rules_)).all()
+    assert (stats.lvl2_hits == np.bincount(rule_ids[entry_levels == 2], minlength=clf.n_lvl2_rules_)).all()
+    assert stats.level_counts == {level: int((used_levels == level).sum()) for level in [1, 2, -1]}
+    assert stats.latency_counts.sum() == X_test.shape[0]
+
+    # the counters accumulate over the calls, with any number of jobs
+    clf.set_params(n_jobs=2).predict_proba(X_test, engine=engine)
+    assert stats.n_samples == 2 * X_test.shape[0]
+    assert (stats.lvl1_hits == 2 * np.bincount(rule_ids[entry_levels == 1], minlength=clf.n_lvl1_rules_)).all()
+    assert sum(stats.level_counts.values()) == stats.latency_counts.sum() == stats.n_samples
+
+    stats.reset()
+    assert stats.n_samples == 0 and stats.lvl1_hits.sum() == 0 and stats.latency_counts.sum() == 0
+    clf.fit(X_train, y_train)
+    assert not hasattr(clf, "prediction_stats_")
+
+
+def _random_rules(n_rules, n_columns, cardinality, max_length, seed, min_length=0):
+    from l3wrapper.dictionary import RuleTable
+
+    rng = np.random.default_rng(seed)
+    item_sets = list()
+    for _ in range(n_rules):
+        columns = rng.choice(n_columns, size=rng.integers(min_length, max_length + 1), replace=False)
+        item_sets.append(sorted(int(column * cardinality + rng.integers(cardinality) + 1) for column in columns))
+    indptr = np.concatenate([[0], np.cumsum([len(items) for items in item_sets])])
+    rules = RuleTable(indptr, [item for items in item_sets for item in items], np.zeros(n_rules),
+                      np.ones(n_rules), np.ones(n_rules))
+    return rules, [set(items) for items in item_sets]
+
+
+def test_find_unreachable_rules():
+    import time
+    import tracemalloc
+    from l3wrapper.matching import find_unreachable_rules
+
+    # short and long rules, so that both the subsets and the candidates of the posting lists are checked
+    item_columns = {item_id: item_id - 1 for item_id in range(1, 14 * 3 + 1)}
+    rules, item_sets = _random_rules(400, 14, 3, 12, seed=0)
+    shadowing_rules, shadowing_item_sets = _random_rules(20, 14, 3, 6, seed=1, min_length=1)
+    for max_matching in [1, 3]:
+        for max_candidates in [1, 2 ** 20]:
+            unreachable = find_unreachable_rules(rules, item_columns, max_matching, max_candidates=max_candidates)
+            shadowed = find_unreachable_rules(rules, item_columns, max_matching, shadowing_rules=shadowing_rules,
+                                              max_candidates=max_candidates)
+            for rule_id, items in enumerate(item_sets):
+                n_before = sum(other <= items for other in item_sets[:rule_id])
+                assert unreachable[rule_id] == (n_before >= max_matching)
+                assert shadowed[rule_id] == (n_before >= max_matching
+                                             or any(other <= items for other in shadowing_item_sets))
+
+    # the time and the memory do not grow with the square of the number of rules
+    item_columns = {item_id: item_id - 1 for item_id in range(1, 12 * 5 + 1)}
+    times, peaks = list(), list()
+    for n_rules in [20000, 80000]:
+        rules, _ = _random_rules(n_rules, 12, 5, 4, seed=2)
+        tracemalloc.start()
+        start = time.perf_counter()
+        find_unreachable_rules(rules, item_columns, 3)
+        times.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    assert times[1] < 8 * times[0] + 0.5
+    assert peaks[1] < 8 * peaks[0]
+
+
+@pytest.mark.parametrize("max_matching", [1, 3])
+def test_compact(dataset_X_y, tmp_path, max_matching):
+    from l3wrapper.matching import build_item_columns, find_unreachable_rules
+
+    X, y = dataset_X_y
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
+    clf = L3Classifier(min_sup=0.005, max_matching=max_matching).fit(X_train, y_train)
+    lvl1_rules, lvl2_rules = clf.lvl1_rules_, clf.lvl2_rules_
+    expected = {engine: (clf.predict(X, engine=engine, explain=None), clf.predict_proba(X, engine=engine),
+                         clf.decision_function(X, engine=engine)) for engine in ["loop", "sparse"]}
+
+    # a rule is unreachable if enough earlier rules, or any level 1 rule, generalize it
+    unreachable = find_unreachable_rules(lvl2_rules, build_item_columns(clf._item_id_to_item), max_matching,
+                                         shadowing_rules=lvl1_rules)
+    lvl1_item_sets = [set(rule.item_ids) for rule in lvl1_rules]
+    lvl2_item_sets = [set(rule.item_ids) for rule in lvl2_rules]
+    for rule_id in range(0, len(lvl2_rules), 7):
+        items = lvl2_item_sets[rule_id]
+        n_before = sum(other <= items for other in lvl2_item_sets[:rule_id])
+        shadowed = any(other <= items for other in lvl1_item_sets)
+        assert unreachable[rule_id] == (n_before >= max_matching or shadowed)
+
+    clf.compact(X_test)
+    report = clf.compaction_report_
+    assert report["after"]["n_lvl2_rules"] == len(lvl2_rules) - report["n_unreachable"][2] < len(lvl2_rules)
+    assert report["after"]["nbytes"] < report["before"]["nbytes"]
+    assert "predict_time" in report["before"] and "predict_time" in report["after"]
+    for engine, (y_pred, proba, scores) in expected.items():
+        assert (clf.predict(X, engine=engine, explain=None) == y_pred).all()
+        assert np.allclose(clf.predict_proba(X, engine=engine), proba)
+        assert np.allclose(clf.decision_function(X, engine=engine), scores)
+
+    clf.save(tmp_path / "clf.l3")
+    loaded = L3Classifier.load(tmp_path / "clf.l3")
+    assert loaded.n_lvl2_rules_ == clf.n_lvl2_rules_
+    assert (loaded.decision_function(X) == expected["loop"][2]).all()
+
+    # the unused rules are the ones matching none of the records
+    clf.set_params(track_predictions=True).compact(X_test, prune_unused=True)
+    clf.predict(X_test, explain=None)
+    assert (clf.prediction_stats_.lvl1_hits > 0).all() and (clf.prediction_stats_.lvl2_hits > 0).all()
+    with pytest.raises(ValueError):
+        clf.compact(prune_unused=True)
+
+    clf.fit(X_train, y_train)
+    assert clf.n_lvl2_rules_ == len(lvl2_rules) and not hasattr(clf, "_lvl2_rule_ranks")
+
+
+def test_fit_async(dataset_X_y, tmp_path):
+    import asyncio
+    import time
+
+    X, y = dataset_X_y
+    lines = list()
+    clf = L3Classifier(work_dir=str(tmp_path))
+    asyncio.run(clf.fit_async(X, y, remove_files=False, progress_callback=lines.append))
+    clf_sync = L3Classifier().fit(X, y)
+    assert (clf.predict(X, explain=None) == clf_sync.predict(X, explain=None)).all()
+    assert list(clf.fit_stats_) == ["validate", "dump", "train", "load_rules", "total"]
+    assert clf.fit_stats_["train"]["returncode"] == 0
+    with open(os.path.join(clf.train_dir_, f"{clf.current_token_}_stdout.txt")) as fp:
+        assert lines == fp.read().splitlines()
+
+    # a training that never ends is killed and its files removed
+    l3_root = tmp_path / "slow_l3"
+    (l3_root / "bin").mkdir(parents=True)
+    train_bin = l3_root / "bin" / "L3CFiltriItemTrain"
+    train_bin.write_text("#!/bin/sh\necho started\nexec sleep 60\n")
+    train_bin.chmod(0o755)
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+    slow = L3Classifier(l3_root=str(l3_root), work_dir=str(work_dir))
+
+    start = time.perf_counter()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(slow.fit_async(X, y, timeout=0.5))
+    assert time.perf_counter() - start < 30
+    assert os.listdir(work_dir) == []
+
+    async def fit_and_cancel():
+        started = asyncio.Event()
+        task = asyncio.ensure_future(slow.fit_async(X, y, progress_callback=lambda line: started.set()))
+        await asyncio.wait_for(started.wait(), 30)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(fit_and_cancel())
+    assert time.perf_counter() - start < 30
+    assert os.listdir(work_dir) == []
+
+    # a cancellation during a stage run in the executor waits for the stage before removing the files
+    dumped = list()
+
+    def slow_dump(filestem, X_codes, y):
+        time.sleep(0.5)
+        L3Classifier._dump_stage(slow, filestem, X_codes, y)
+        dumped.append(os.listdir(work_dir))
+
+    slow._dump_stage = slow_dump
+
+    async def cancel_dump():
+        task = asyncio.ensure_future(slow.fit_async(X, y))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_dump())
+    assert len(dumped) == 1 and len(dumped[0]) == 1
+    assert os.listdir(work_dir) == []